@@ -0,0 +1,230 @@
+import numpy as np
+
+from dqn_trainer.environments.space_game_env import SpaceGameEnvironment, Action
+from dqn_trainer.utils.replay_buffer import ReplayBuffer
+from dqn_trainer.utils.data_processor import GameDataProcessor
+
+# Number of distinct observations cycled through when filling buffers, so large
+# capacities do not need one freshly allocated array per slot
+STATE_POOL_SIZE = 256
+
+# Shape of the raw RGB frames fed to the data processor (Atari-sized screenshot)
+RAW_FRAME_SHAPE = (210, 160, 3)
+
+# Raw frame shape that is an integer multiple of the (84, 84) state shape, which
+# takes the block-averaging path instead of the PIL resize fallback
+ALIGNED_FRAME_SHAPE = (168, 168, 3)
+
+
+def _state_pool(shape, seed=0):
+    """
+    Create a pool of random observations
+
+    Args:
+        shape: Shape of a single observation
+        seed: Random seed
+
+    Returns:
+        List of float32 observations
+    """
+    rng = np.random.default_rng(seed)
+    return [rng.random(shape, dtype=np.float32) for _ in range(STATE_POOL_SIZE)]
+
+
+def _fill_buffer(buffer, states, count, num_actions=len(Action)):
+    """
+    Fill a replay buffer with pooled transitions
+
+    Args:
+        buffer: Replay buffer to fill
+        states: Pool of observations
+        count: Number of transitions to add
+        num_actions: Number of possible actions
+    """
+    pool_size = len(states)
+    for i in range(count):
+        buffer.add(
+            states[i % pool_size],
+            i % num_actions,
+            states[(i + 1) % pool_size],
+            float(i % 7) - 3.0,
+            i % 100 == 99
+        )
+
+
+def setup_env_step(seed=0):
+    """Benchmark SpaceGameEnvironment.step with random actions"""
+    np.random.seed(seed)
+    env = SpaceGameEnvironment()
+    env.reset()
+    actions = np.random.randint(0, env.action_space, size=4096)
+    counter = [0]
+
+    def step():
+        action = int(actions[counter[0] % len(actions)])
+        counter[0] += 1
+        _, _, done, _ = env.step(action)
+        if done:
+            env.reset()
+
+    return step
+
+
+def setup_env_observation(seed=0):
+    """Benchmark SpaceGameEnvironment._get_observation"""
+    np.random.seed(seed)
+    env = SpaceGameEnvironment()
+    env.reset()
+    return env._get_observation
+
+
+def setup_replay_add(capacity, seed=0):
+    """Benchmark ReplayBuffer.add on a buffer that is already full"""
+    states = _state_pool((84 * 84,), seed)
+    buffer = ReplayBuffer(capacity=capacity)
+    _fill_buffer(buffer, states, capacity)
+    counter = [0]
+
+    def add():
+        i = counter[0]
+        counter[0] += 1
+        buffer.add(states[i % STATE_POOL_SIZE], i % len(Action),
+                   states[(i + 1) % STATE_POOL_SIZE], 0.1, False)
+
+    return add
+
+
+def setup_replay_sample(capacity, batch_size=64, seed=0):
+    """Benchmark ReplayBuffer.sample on a full buffer"""
+    np.random.seed(seed)
+    states = _state_pool((84 * 84,), seed)
+    buffer = ReplayBuffer(capacity=capacity)
+    _fill_buffer(buffer, states, capacity)
+
+    def sample():
+        buffer.sample(batch_size)
+
+    return sample
+
+
+def setup_agent_train_step(model_type, batch_size, seed=0):
+    """Benchmark DQNAgent.train_step for a linear or convolutional Q-network"""
+    import torch
+    from dqn_trainer.models.dqn_model import DQN, ConvDQN
+    from dqn_trainer.models.dqn_agent import DQNAgent
+
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+
+    if model_type == "dqn":
+        model = DQN(input_dim=84 * 84, output_dim=len(Action))
+        target_model = DQN(input_dim=84 * 84, output_dim=len(Action))
+        state_shape = (84 * 84,)
+    else:
+        model = ConvDQN(input_channels=1, output_dim=len(Action))
+        target_model = ConvDQN(input_channels=1, output_dim=len(Action))
+        state_shape = (1, 84, 84)
+    target_model.load_state_dict(model.state_dict())
+
+    agent = DQNAgent(
+        model=model,
+        target_model=target_model,
+        batch_size=batch_size,
+        buffer_size=STATE_POOL_SIZE * 8,
+        target_update_freq=10 ** 9
+    )
+    agent.logger.disabled = True
+    _fill_buffer(agent.replay_buffer, _state_pool(state_shape, seed), STATE_POOL_SIZE * 8)
+
+    return agent.train_step
+
+
+def setup_update_stack(frame_stack=4, seed=0):
+    """Benchmark GameDataProcessor.update_stack on raw RGB frames"""
+    rng = np.random.default_rng(seed)
+    frames = [rng.integers(0, 256, RAW_FRAME_SHAPE, dtype=np.uint8) for _ in range(32)]
+    processor = GameDataProcessor(frame_stack=frame_stack)
+    processor.reset()
+    counter = [0]
+
+    def update():
+        processor.update_stack(frames[counter[0] % len(frames)])
+        counter[0] += 1
+
+    return update
+
+
+def setup_preprocess_batch(batch_size=64, num_workers=1, frame_shape=RAW_FRAME_SHAPE, seed=0):
+    """Benchmark GameDataProcessor.preprocess_batch on raw RGB frames"""
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 256, (batch_size, *frame_shape), dtype=np.uint8)
+    processor = GameDataProcessor()
+    out = np.empty((batch_size, *processor.state_shape), dtype=np.float32)
+
+    def preprocess():
+        processor.preprocess_batch(frames, out=out, num_workers=num_workers)
+
+    return preprocess
+
+
+def build_cases(capacities=(1000, 10000, 100000), batch_sizes=(32, 64, 128)):
+    """
+    Build the list of benchmark cases
+
+    Args:
+        capacities: Replay buffer capacities to benchmark
+        batch_sizes: Training batch sizes to benchmark
+
+    Returns:
+        List of case dicts with name, setup function, setup kwargs and iteration count
+    """
+    cases = [
+        {"name": "env.step", "setup": setup_env_step, "kwargs": {}, "iterations": 2000},
+        {"name": "env._get_observation", "setup": setup_env_observation, "kwargs": {}, "iterations": 2000},
+    ]
+
+    for capacity in capacities:
+        cases.append({
+            "name": f"replay_buffer.add[capacity={capacity}]",
+            "setup": setup_replay_add,
+            "kwargs": {"capacity": capacity},
+            "iterations": 20000
+        })
+        cases.append({
+            "name": f"replay_buffer.sample[capacity={capacity},batch=64]",
+            "setup": setup_replay_sample,
+            "kwargs": {"capacity": capacity},
+            "iterations": 500
+        })
+
+    for model_type in ("dqn", "conv_dqn"):
+        for batch_size in batch_sizes:
+            cases.append({
+                "name": f"agent.train_step[model={model_type},batch={batch_size}]",
+                "setup": setup_agent_train_step,
+                "kwargs": {"model_type": model_type, "batch_size": batch_size},
+                "iterations": 50 if model_type == "conv_dqn" else 200
+            })
+
+    cases.append({
+        "name": "data_processor.update_stack[frame_stack=4]",
+        "setup": setup_update_stack,
+        "kwargs": {},
+        "iterations": 1000
+    })
+
+    cases.append({
+        "name": "data_processor.preprocess_batch[batch=64]",
+        "setup": setup_preprocess_batch,
+        "kwargs": {},
+        "iterations": 200
+    })
+
+    cases.append({
+        "name": "data_processor.preprocess_batch[batch=64,frame=168x168]",
+        "setup": setup_preprocess_batch,
+        "kwargs": {"frame_shape": ALIGNED_FRAME_SHAPE},
+        "iterations": 200
+    })
+
+    return cases
@@ -0,0 +1,221 @@
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Metrics where a larger value is better; every other metric is "lower is better"
+HIGHER_IS_BETTER = {"steps_per_sec"}
+
+# Metrics that are compared against a baseline run
+COMPARED_METRICS = ["steps_per_sec", "latency_p50_ms", "latency_p99_ms", "peak_rss_mb"]
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of the current process
+
+    Returns:
+        Peak RSS in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes everywhere else
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def measure(fn, iterations, warmup=10):
+    """
+    Time repeated calls of a function
+
+    Args:
+        fn: Zero-argument callable to benchmark
+        iterations: Number of timed calls
+        warmup: Number of untimed calls made first
+
+    Returns:
+        Dictionary of throughput and latency metrics
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = np.empty(iterations, dtype=np.int64)
+    clock = time.perf_counter_ns
+
+    start = clock()
+    for i in range(iterations):
+        call_start = clock()
+        fn()
+        latencies[i] = clock() - call_start
+    elapsed = (clock() - start) / 1e9
+
+    latencies_ms = latencies / 1e6
+    p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+
+    return {
+        "iterations": iterations,
+        "steps_per_sec": iterations / elapsed if elapsed > 0 else float("inf"),
+        "latency_mean_ms": float(latencies_ms.mean()),
+        "latency_p50_ms": float(p50),
+        "latency_p90_ms": float(p90),
+        "latency_p99_ms": float(p99),
+        "latency_max_ms": float(latencies_ms.max()),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def run_metadata():
+    """
+    Describe the machine and library versions a run was made on
+
+    Returns:
+        Dictionary of run metadata
+    """
+    metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__
+    }
+
+    try:
+        import torch
+        metadata["torch"] = torch.__version__
+        metadata["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+
+    return metadata
+
+
+def save_results(results, filename):
+    """
+    Save benchmark results to a JSON file
+
+    Args:
+        results: Dictionary with "metadata" and "results" entries
+        filename: File to save results to
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """
+    Load benchmark results from a JSON file
+
+    Args:
+        filename: File to load results from
+
+    Returns:
+        Dictionary with "metadata" and "results" entries
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """
+    Compare a benchmark run against a baseline run
+
+    Args:
+        current: Results of the current run
+        baseline: Results of the baseline run
+        threshold: Allowed relative change before a metric counts as regressed
+
+    Returns:
+        (comparisons, regressions) where each entry is a dict describing one metric
+    """
+    comparisons = []
+    regressions = []
+
+    for name, metrics in sorted(current["results"].items()):
+        baseline_metrics = baseline["results"].get(name)
+        if baseline_metrics is None:
+            continue
+
+        for metric in COMPARED_METRICS:
+            old = baseline_metrics.get(metric)
+            new = metrics.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+
+            change = (new - old) / old
+
+            # Express every change so that a positive value is a regression
+            if metric in HIGHER_IS_BETTER:
+                regression = -change
+            else:
+                regression = change
+
+            entry = {
+                "benchmark": name,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": change,
+                "regressed": regression > threshold
+            }
+            comparisons.append(entry)
+            if entry["regressed"]:
+                regressions.append(entry)
+
+    return comparisons, regressions
+
+
+def format_results(results):
+    """
+    Format benchmark results as a text table
+
+    Args:
+        results: Dictionary of benchmark name to metrics
+
+    Returns:
+        Table as a string
+    """
+    header = f"{'benchmark':<48} {'steps/s':>12} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'RSS MB':>9}"
+    lines = [header, "-" * len(header)]
+
+    for name, metrics in sorted(results.items()):
+        lines.append(
+            f"{name:<48} {metrics['steps_per_sec']:>12.1f} "
+            f"{metrics['latency_p50_ms']:>10.4f} {metrics['latency_p90_ms']:>10.4f} "
+            f"{metrics['latency_p99_ms']:>10.4f} {metrics['peak_rss_mb']:>9.1f}"
+        )
+
+    return "\n".join(lines)
+
+
+def format_comparison(comparisons):
+    """
+    Format a baseline comparison as a text table
+
+    Args:
+        comparisons: Comparison entries from compare_results
+
+    Returns:
+        Table as a string
+    """
+    header = f"{'benchmark':<48} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>9}"
+    lines = [header, "-" * len(header)]
+
+    for entry in comparisons:
+        marker = "  REGRESSED" if entry["regressed"] else ""
+        lines.append(
+            f"{entry['benchmark']:<48} {entry['metric']:<16} {entry['baseline']:>12.4f} "
+            f"{entry['current']:>12.4f} {entry['change'] * 100:>8.1f}%{marker}"
+        )
+
+    return "\n".join(lines)
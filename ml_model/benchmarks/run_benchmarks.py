@@ -0,0 +1,117 @@
+import argparse
+import fnmatch
+import multiprocessing
+import os
+import sys
+
+# Add parent directory to path so the dqn_trainer package can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.cases import build_cases
+from benchmarks.harness import (
+    measure, run_metadata, save_results, load_results,
+    compare_results, format_results, format_comparison
+)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the DQN trainer environment and learner")
+
+    parser.add_argument("--output", type=str, default="./benchmark_results.json",
+                        help="JSON file to write results to")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="JSON file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative change that counts as a regression (0.1 = 10%%)")
+    parser.add_argument("--filter", type=str, default="*",
+                        help="Glob pattern selecting which benchmarks to run")
+    parser.add_argument("--capacities", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Replay buffer capacities to benchmark")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[32, 64, 128],
+                        help="Training batch sizes to benchmark")
+    parser.add_argument("--iterations_scale", type=float, default=1.0,
+                        help="Multiplier applied to every benchmark's iteration count")
+    parser.add_argument("--torch_threads", type=int, default=None,
+                        help="Number of intra-op threads torch may use")
+    parser.add_argument("--no_isolate", action="store_true",
+                        help="Run every benchmark in this process instead of a fresh one "
+                             "(faster, but peak RSS then accumulates across benchmarks)")
+
+    return parser.parse_args()
+
+
+def run_case(case, iterations, torch_threads=None):
+    """
+    Set up and time a single benchmark case
+
+    Args:
+        case: Case dict from build_cases
+        iterations: Number of timed iterations
+        torch_threads: Number of intra-op threads torch may use
+
+    Returns:
+        Dictionary of metrics
+    """
+    if torch_threads is not None:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    fn = case["setup"](**case["kwargs"])
+    return measure(fn, iterations, warmup=max(1, iterations // 20))
+
+
+def _run_case_isolated(case, iterations, torch_threads=None):
+    """Run a case in a fresh process so its peak RSS is measured on its own"""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case, iterations, torch_threads))
+
+
+def main():
+    """Main function"""
+    args = parse_args()
+
+    cases = [
+        case for case in build_cases(tuple(args.capacities), tuple(args.batch_sizes))
+        if fnmatch.fnmatch(case["name"], args.filter)
+    ]
+    if not cases:
+        print(f"No benchmarks match {args.filter!r}")
+        return 1
+
+    results = {}
+    for case in cases:
+        iterations = max(1, int(case["iterations"] * args.iterations_scale))
+        print(f"Running {case['name']} ({iterations} iterations)...", flush=True)
+
+        if args.no_isolate:
+            results[case["name"]] = run_case(case, iterations, args.torch_threads)
+        else:
+            results[case["name"]] = _run_case_isolated(case, iterations, args.torch_threads)
+
+    run = {"metadata": run_metadata(), "results": results}
+    save_results(run, args.output)
+
+    print()
+    print(format_results(results))
+    print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        comparisons, regressions = compare_results(run, baseline, args.threshold)
+
+        print()
+        print(format_comparison(comparisons))
+
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold * 100:.0f}%")
+            return 1
+
+        print(f"\nNo regressions beyond {args.threshold * 100:.0f}%")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import json
+import os
+import numpy as np
+
+from .space_game_env import Action
+
+# Event types recorded in window.gameData.events (see notes/gameplay-data-collection.md)
+EVENT_TYPES = ("player_shot", "enemy_shot", "enemy_destroyed", "player_hit", "game_over")
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+# Features of each observation vector, in order
+OBSERVATION_FIELDS = ("x", "y", "lives", "score", "elapsed")
+
+# Reward for each event type, following the reward signals listed in the data collection notes
+DEFAULT_REWARD_WEIGHTS = {
+    "enemy_destroyed": 10.0,
+    "player_hit": -1.0,
+    "game_over": -10.0,
+    "survival": 0.01
+}
+
+# Human action lookup indexed by [horizontal move + 1, shot fired]
+_ACTION_TABLE = np.array([
+    [Action.LEFT.value, Action.LEFT_SHOOT.value],
+    [Action.IDLE.value, Action.SHOOT.value],
+    [Action.RIGHT.value, Action.RIGHT_SHOOT.value]
+], dtype=np.int64)
+
+
+def load_game_sessions(directory):
+    """
+    Load recorded window.gameData sessions from JSON files
+
+    Args:
+        directory: Directory containing JSON files, each holding one session or a list of sessions
+
+    Returns:
+        List of session dicts
+    """
+    sessions = []
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+
+        with open(os.path.join(directory, filename), 'r') as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            sessions.extend(data)
+        else:
+            sessions.append(data)
+
+    return sessions
+
+
+class SessionReplayEnvironment:
+    """
+    Vectorized environment that replays recorded web game sessions
+
+    Every session is converted once into flat NumPy arrays: one observation per
+    100ms position sample, and per-step rewards, done flags and inferred human
+    actions. Events are sorted by timestamp and indexed by step, so stepping
+    any number of sessions is a handful of array lookups with no Python work
+    per session. The recorded trajectory does not depend on the actions passed
+    to step(); they are compared against the human actions instead, which is
+    what offline policy scoring needs.
+    """
+    def __init__(
+        self,
+        sessions,
+        screen_width=550,
+        screen_height=700,
+        max_lives=3,
+        move_threshold=1.0,
+        reward_weights=None
+    ):
+        """
+        Initialize the environment
+
+        Args:
+            sessions: List of window.gameData session dicts
+            screen_width: Width of the game canvas in pixels
+            screen_height: Height of the game canvas in pixels
+            max_lives: Number of lives the player starts with
+            move_threshold: Minimum horizontal movement in pixels that counts as a move
+            reward_weights: Reward per event type (defaults to DEFAULT_REWARD_WEIGHTS)
+        """
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.max_lives = max_lives
+        self.move_threshold = move_threshold
+        self.reward_weights = dict(DEFAULT_REWARD_WEIGHTS)
+        if reward_weights:
+            self.reward_weights.update(reward_weights)
+
+        self.action_space = len(Action)
+        self.observation_space_shape = (len(OBSERVATION_FIELDS),)
+
+        self._build_arrays(sessions)
+
+        self.num_envs = len(self.session_ids)
+        self.cursor = np.zeros(self.num_envs, dtype=np.int64)
+        self.finished = np.zeros(self.num_envs, dtype=bool)
+
+    def _build_arrays(self, sessions):
+        """
+        Precompute the flat observation, step and event arrays for all sessions
+
+        Args:
+            sessions: List of window.gameData session dicts
+        """
+        observations = []
+        rewards = []
+        dones = []
+        human_actions = []
+        event_types = []
+        event_timestamps = []
+        event_bounds = []
+        session_ids = []
+        num_steps = []
+        num_events = 0
+
+        for session in sessions:
+            arrays = self._session_arrays(session)
+            if arrays is None:
+                continue
+
+            obs, step_rewards, step_dones, actions, types, timestamps, bounds = arrays
+            observations.append(obs)
+            rewards.append(step_rewards)
+            dones.append(step_dones)
+            human_actions.append(actions)
+            event_types.append(types)
+            event_timestamps.append(timestamps)
+            event_bounds.append(bounds + num_events)
+            num_events += len(types)
+            session_ids.append(session.get("sessionId", f"session-{len(session_ids)}"))
+            num_steps.append(len(step_rewards))
+
+        if not session_ids:
+            raise ValueError("No session has at least two position samples to replay")
+
+        self.session_ids = session_ids
+        self.num_steps = np.array(num_steps, dtype=np.int64)
+
+        # Session i owns steps [step_offsets[i], step_offsets[i + 1]) and one more observation than steps
+        self.step_offsets = np.concatenate(([0], np.cumsum(self.num_steps)))
+        self.obs_offsets = self.step_offsets[:-1] + np.arange(len(session_ids))
+
+        self.observations = np.concatenate(observations)
+        self.rewards = np.concatenate(rewards)
+        self.dones = np.concatenate(dones)
+        self.human_actions = np.concatenate(human_actions)
+
+        # Events of step j are event_types[event_bounds[j, 0]:event_bounds[j, 1]]
+        self.event_types = np.concatenate(event_types)
+        self.event_timestamps = np.concatenate(event_timestamps)
+        self.event_bounds = np.concatenate(event_bounds)
+
+    def _session_arrays(self, session):
+        """
+        Convert a single session into per-step arrays
+
+        Args:
+            session: window.gameData session dict
+
+        Returns:
+            (observations, rewards, dones, human_actions, event_types, event_timestamps, event_bounds),
+            or None if the session is too short to replay
+        """
+        positions = session.get("positions", [])
+        if len(positions) < 2:
+            return None
+
+        xs = np.array([p["x"] for p in positions], dtype=np.float64)
+        ys = np.array([p["y"] for p in positions], dtype=np.float64)
+        times = np.array([p["timestamp"] for p in positions], dtype=np.float64)
+
+        order = np.argsort(times, kind="stable")
+        xs, ys, times = xs[order], ys[order], times[order]
+
+        # Sort events by timestamp, dropping types we do not model
+        events = [e for e in session.get("events", []) if e.get("type") in EVENT_CODES]
+        types = np.array([EVENT_CODES[e["type"]] for e in events], dtype=np.int8)
+        timestamps = np.array([e["timestamp"] for e in events], dtype=np.float64)
+        scores = np.array([e.get("score", np.nan) for e in events], dtype=np.float64)
+
+        order = np.argsort(timestamps, kind="stable")
+        types, timestamps, scores = types[order], timestamps[order], scores[order]
+
+        # Step k covers (times[k], times[k + 1]]; earlier events go to the first step
+        # and later ones to the last step
+        step_count = len(times) - 1
+        ends = np.searchsorted(timestamps, times[1:], side="right")
+        ends[-1] = len(types)
+        starts = np.concatenate(([0], ends[:-1]))
+
+        # Per-step event counts from cumulative counts of each type
+        one_hot = np.zeros((len(types) + 1, len(EVENT_TYPES)), dtype=np.int64)
+        one_hot[np.arange(1, len(types) + 1), types] = 1
+        cumulative = np.cumsum(one_hot, axis=0)
+        counts = cumulative[ends] - cumulative[starts]
+
+        # Truncate the replay at the first step containing game over
+        game_over_steps = np.flatnonzero(counts[:, EVENT_CODES["game_over"]])
+        if len(game_over_steps):
+            step_count = int(game_over_steps[0]) + 1
+            counts = counts[:step_count]
+            starts = starts[:step_count]
+            ends = ends[:step_count]
+            xs, ys, times = xs[:step_count + 1], ys[:step_count + 1], times[:step_count + 1]
+
+        # Lives and score at the start of every observation
+        boundaries = np.concatenate(([0], ends))
+        hits_before = cumulative[boundaries, EVENT_CODES["player_hit"]]
+        lives = np.maximum(self.max_lives - hits_before, 0)
+
+        destroyed = types == EVENT_CODES["enemy_destroyed"]
+        destroyed_scores = scores[destroyed]
+        destroyed_scores = np.where(
+            np.isnan(destroyed_scores),
+            10.0 * np.arange(1, len(destroyed_scores) + 1),
+            destroyed_scores
+        )
+        destroyed_before = cumulative[boundaries, EVENT_CODES["enemy_destroyed"]]
+        score = np.zeros(len(boundaries), dtype=np.float64)
+        if len(destroyed_scores):
+            score = np.where(destroyed_before > 0, destroyed_scores[np.maximum(destroyed_before - 1, 0)], 0.0)
+
+        observations = np.stack([
+            xs / self.screen_width,
+            ys / self.screen_height,
+            lives / self.max_lives,
+            score,
+            (times - times[0]) / 1000.0
+        ], axis=1).astype(np.float32)
+
+        rewards = (
+            self.reward_weights["enemy_destroyed"] * counts[:, EVENT_CODES["enemy_destroyed"]]
+            + self.reward_weights["player_hit"] * counts[:, EVENT_CODES["player_hit"]]
+            + self.reward_weights["game_over"] * counts[:, EVENT_CODES["game_over"]]
+            + self.reward_weights["survival"]
+        ).astype(np.float32)
+
+        dones = np.zeros(step_count, dtype=bool)
+        dones[-1] = True
+
+        # Infer the human action from horizontal movement and shots fired during the step
+        dx = np.diff(xs)
+        move = np.where(dx > self.move_threshold, 1, np.where(dx < -self.move_threshold, -1, 0))
+        shot = (counts[:, EVENT_CODES["player_shot"]] > 0).astype(np.int64)
+        human_actions = _ACTION_TABLE[move + 1, shot]
+
+        bounds = np.stack([starts, ends], axis=1).astype(np.int64)
+
+        return observations, rewards, dones, human_actions, types, timestamps, bounds
+
+    def reset(self):
+        """
+        Reset every session to its first position sample
+
+        Returns:
+            Initial observations, shape (num_envs, num_features)
+        """
+        self.cursor[:] = 0
+        self.finished[:] = False
+        return self.observations[self.obs_offsets]
+
+    def step(self, actions):
+        """
+        Advance every unfinished session by one recorded step
+
+        Args:
+            actions: Actions chosen by the policy, shape (num_envs,)
+
+        Returns:
+            (next_observations, rewards, dones, info); sessions that already
+            finished return their final observation, zero reward and done=True
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        active = ~self.finished
+
+        step_index = self.step_offsets[:-1] + np.minimum(self.cursor, self.num_steps - 1)
+        rewards = np.where(active, self.rewards[step_index], 0.0).astype(np.float32)
+        human_actions = self.human_actions[step_index]
+        dones = self.dones[step_index] | self.finished
+
+        self.cursor += active
+        self.finished = dones.copy()
+
+        info = {
+            "active": active,
+            "human_action": human_actions,
+            "matches": active & (actions == human_actions),
+            "step_index": step_index
+        }
+
+        return self.observations[self.obs_offsets + self.cursor], rewards, dones, info
+
+    def events_for_step(self, step_index):
+        """
+        Get the events recorded during a step
+
+        Args:
+            step_index: Global step index (as returned in info["step_index"])
+
+        Returns:
+            (event_types, event_timestamps) for the step
+        """
+        start, end = self.event_bounds[step_index]
+        return self.event_types[start:end], self.event_timestamps[start:end]
+
+    def get_training_samples(self):
+        """
+        Get every recorded transition as training samples
+
+        Returns:
+            states, actions, next_states, rewards, dones
+        """
+        session_index = np.repeat(np.arange(self.num_envs), self.num_steps)
+        state_index = np.arange(len(self.rewards)) + session_index
+        return (
+            self.observations[state_index],
+            self.human_actions,
+            self.observations[state_index + 1],
+            self.rewards,
+            self.dones
+        )
+
+    def evaluate_policy(self, policy):
+        """
+        Score a policy against the recorded human actions
+
+        Args:
+            policy: Callable mapping observations of shape (num_envs, num_features) to actions
+
+        Returns:
+            Dictionary with overall and per-session action agreement and episode returns
+        """
+        observations = self.reset()
+        matches = np.zeros(self.num_envs, dtype=np.int64)
+        returns = np.zeros(self.num_envs, dtype=np.float64)
+
+        while not self.finished.all():
+            actions = policy(observations)
+            observations, rewards, _, info = self.step(actions)
+            matches += info["matches"]
+            returns += rewards
+
+        return {
+            "action_agreement": float(matches.sum() / self.num_steps.sum()),
+            "session_agreement": matches / self.num_steps,
+            "episode_returns": returns,
+            "total_steps": int(self.num_steps.sum())
+        }
@@ -3,6 +3,8 @@ import json
 import os
 from enum import Enum
 
+from ..utils.columnar_buffer import ColumnarBuffer
+
 class Action(Enum):
     """Possible actions in the space game"""
     LEFT = 0
@@ -12,6 +14,15 @@ class Action(Enum):
     RIGHT_SHOOT = 4
     IDLE = 5
 
+# Storage dtypes of the recorded step fields; None keeps the dtype of the recorded values
+STEP_DTYPES = {
+    "state": None,
+    "action": np.int64,
+    "next_state": None,
+    "reward": np.float32,
+    "done": np.bool_
+}
+
 class SpaceGameEnvironment:
     """
     Environment wrapper for the Space Invaders game
@@ -250,12 +261,28 @@ class WebGameEnvironment:
     
     This environment provides an interface for collecting data from the web game
     and using it to train a DQN agent.
+    
+    Steps are stored in growable columnar arrays (one per field) and episodes are
+    delimited by an array of end offsets, so recording a step is an amortized O(1)
+    array write and training samples are slices of the stored columns.
     """
     def __init__(self):
         """Initialize the environment"""
         self.action_space = len(Action)
-        self.current_episode_data = []
-        self.all_episodes_data = []
+        self.steps = ColumnarBuffer(dtypes=STEP_DTYPES)
+        self.episode_ends = ColumnarBuffer(dtypes={"end": np.int64}, initial_capacity=64)
+    
+    @property
+    def num_episodes(self):
+        """Number of completed episodes"""
+        return len(self.episode_ends)
+    
+    @property
+    def completed_steps(self):
+        """Number of steps that belong to completed episodes"""
+        if not len(self.episode_ends):
+            return 0
+        return int(self.episode_ends.column("end")[-1])
     
     def record_step(self, state, action, next_state, reward, done):
         """
@@ -268,69 +295,102 @@ class WebGameEnvironment:
             reward: Reward received
             done: Whether the episode is done
         """
-        self.current_episode_data.append({
-            "state": state,
-            "action": action,
-            "next_state": next_state,
-            "reward": reward,
-            "done": done
-        })
+        self.steps.append(state=state, action=action, next_state=next_state, reward=reward, done=done)
         
-        # If episode is done, add to all episodes data
+        # If episode is done, mark where it ends
         if done:
-            self.all_episodes_data.append(self.current_episode_data)
-            self.current_episode_data = []
+            self.episode_ends.append(end=len(self.steps))
+    
+    def get_episode(self, index):
+        """
+        Get the columns of a completed episode
+        
+        Args:
+            index: Episode index
+            
+        Returns:
+            Dict of field name to array view
+        """
+        ends = self.episode_ends.column("end")
+        start = int(ends[index - 1]) if index > 0 else 0
+        return self.steps.as_dict(start, int(ends[index]))
     
     def get_all_data(self):
         """
         Get all recorded data
         
         Returns:
-            List of all episodes' data
-        """
-        return self.all_episodes_data
+            List of all episodes' data, each a list of step dicts
+        """
+        episodes = []
+        for index in range(self.num_episodes):
+            columns = self.get_episode(index)
+            length = len(columns["action"])
+            episodes.append([
+                {name: column[i] for name, column in columns.items()}
+                for i in range(length)
+            ])
+        return episodes
     
     def save_data(self, filename):
         """
-        Save all recorded data to a file
+        Save all completed episodes to a file
+        
+        The file is an uncompressed .npz archive with one array per field plus the
+        episode end offsets, so it can be loaded without pickle.
         
         Args:
             filename: File to save data to
         """
         # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        episode_ends = self.episode_ends.column("end") if self.num_episodes else np.zeros(0, dtype=np.int64)
         
-        # Save data to file
-        np.save(filename, self.all_episodes_data, allow_pickle=True)
+        # Save data to file (through a handle so numpy does not change the extension)
+        with open(filename, 'wb') as f:
+            np.savez(f, episode_ends=episode_ends, **self.steps.as_dict(0, self.completed_steps))
     
     def load_data(self, filename):
         """
-        Load data from a file
+        Load data from a file, replacing any recorded data
         
         Args:
             filename: File to load data from
         """
-        self.all_episodes_data = list(np.load(filename, allow_pickle=True))
+        self.steps.clear()
+        self.episode_ends.clear()
+        
+        try:
+            data = np.load(filename, allow_pickle=False)
+        except ValueError:
+            # Files written before the columnar format hold a pickled list of episodes
+            for episode in np.load(filename, allow_pickle=True):
+                for step in episode:
+                    self.record_step(step["state"], step["action"], step["next_state"],
+                                     step["reward"], step["done"])
+            return
+        
+        with data:
+            episode_ends = data["episode_ends"]
+            if len(episode_ends):
+                self.steps.extend(**{name: data[name] for name in STEP_DTYPES})
+                self.episode_ends.extend(end=episode_ends)
     
     def get_training_samples(self):
         """
-        Get all data as training samples
+        Get all data from completed episodes as training samples
+        
+        The arrays are views of the recorded columns; copy them if the environment
+        keeps recording while they are in use.
         
         Returns:
             states, actions, next_states, rewards, dones
         """
-        states = []
-        actions = []
-        next_states = []
-        rewards = []
-        dones = []
-        
-        for episode in self.all_episodes_data:
-            for step in episode:
-                states.append(step["state"])
-                actions.append(step["action"])
-                next_states.append(step["next_state"])
-                rewards.append(step["reward"])
-                dones.append(step["done"])
-        
-        return np.array(states), np.array(actions), np.array(next_states), np.array(rewards), np.array(dones) 
\ No newline at end of file
+        if not len(self.steps):
+            return tuple(np.array([]) for _ in range(5))
+        
+        columns = self.steps.as_dict(0, self.completed_steps)
+        return columns["state"], columns["action"], columns["next_state"], columns["reward"], columns["done"]
\ No newline at end of file
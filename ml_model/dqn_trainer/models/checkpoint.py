@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import torch
+
+from .dqn_model import DQN, ConvDQN
+
+# Version of the manifest layout
+MANIFEST_VERSION = 1
+
+# Files of a checkpoint saved by DQNAgent.save_model as <name><suffix>
+MANIFEST_SUFFIX = "_manifest.json"
+WEIGHTS_SUFFIX = "_q_network.pth"
+
+# Model classes a manifest can name
+MODEL_CLASSES = {cls.__name__: cls for cls in (DQN, ConvDQN)}
+
+
+def checkpoint_base(path):
+    """
+    Get the base path of a checkpoint (the directory and name given to save_model)
+
+    Args:
+        path: Base path, or the path of the manifest or the weights file
+
+    Returns:
+        Base path
+    """
+    for suffix in (MANIFEST_SUFFIX, WEIGHTS_SUFFIX):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def file_sha256(path):
+    """
+    Hash a file
+
+    Args:
+        path: File path
+
+    Returns:
+        Hex SHA-256 digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_model(model):
+    """
+    Describe how to rebuild a model
+
+    Args:
+        model: DQN or ConvDQN
+
+    Returns:
+        Dictionary with the model class, constructor arguments, input shape,
+        number of actions, parameter dtype and observation preprocessing
+    """
+    return {
+        "class": type(model).__name__,
+        "args": list(model.init_args),
+        "kwargs": dict(model.init_kwargs),
+        "input_shape": list(model.input_shape),
+        "output_dim": model.output_dim,
+        "dtype": str(next(model.parameters()).dtype).replace("torch.", ""),
+        "preprocessing": dict(model.preprocessing)
+    }
+
+
+def write_manifest(path, name, model):
+    """
+    Write the manifest of a checkpoint whose weights are already saved
+
+    Args:
+        path: Checkpoint directory
+        name: Base name of the checkpoint files
+        model: Q-network the weights were saved from
+
+    Returns:
+        Path of the manifest
+    """
+    weights_file = f"{name}{WEIGHTS_SUFFIX}"
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "name": name,
+        "created_at": datetime.now().isoformat(),
+        "model": describe_model(model),
+        "weights": {
+            "file": weights_file,
+            "sha256": file_sha256(os.path.join(path, weights_file))
+        }
+    }
+
+    manifest_path = os.path.join(path, f"{name}{MANIFEST_SUFFIX}")
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        # Dimensions may be NumPy integers (e.g. input_dim computed with np.prod)
+        json.dump(manifest, f, indent=2, default=lambda value: value.item())
+    os.replace(temp_path, manifest_path)
+
+    return manifest_path
+
+
+def read_manifest(model_path):
+    """
+    Read the manifest of a checkpoint
+
+    Args:
+        model_path: Base path of the checkpoint, or the path of one of its files
+
+    Returns:
+        Manifest dictionary
+    """
+    manifest_path = checkpoint_base(model_path) + MANIFEST_SUFFIX
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No checkpoint manifest at {manifest_path}; save the model with DQNAgent.save_model, "
+                                f"or write one for an older checkpoint with train.py --mode=migrate")
+
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported checkpoint manifest version {manifest.get('version')}")
+
+    return manifest
+
+
+def model_from_state_dict(model_class, state_dict):
+    """
+    Build an untrained model whose architecture matches a bare state dict
+
+    The layer sizes are read from the weight shapes, so only the model class
+    has to be known.
+
+    Args:
+        model_class: DQN or ConvDQN
+        state_dict: State dict saved from a model of that class
+
+    Returns:
+        Model with the dtype of the state dict
+    """
+    if model_class is DQN:
+        # model.0.weight, model.2.weight, ...: Linear layers separated by ReLUs
+        weights = [state_dict[key] for key in sorted(
+            (key for key in state_dict if key.startswith("model.") and key.endswith(".weight")),
+            key=lambda key: int(key.split(".")[1])
+        )]
+        if not weights:
+            raise ValueError("State dict has no DQN layers")
+        model = DQN(weights[0].shape[1], weights[-1].shape[0], hidden_dims=[w.shape[0] for w in weights[:-1]])
+    elif model_class is ConvDQN:
+        if "conv1.weight" not in state_dict or "fc2.weight" not in state_dict:
+            raise ValueError("State dict has no ConvDQN layers")
+        model = ConvDQN(state_dict["conv1.weight"].shape[1], state_dict["fc2.weight"].shape[0])
+    else:
+        raise ValueError(f"Unknown model class {model_class.__name__}")
+
+    return model.to(next(iter(state_dict.values())).dtype)
+
+
+def migrate_checkpoint(model_path, model_class):
+    """
+    Write the manifest of a checkpoint saved before checkpoints had one
+
+    The weights are loaded with weights_only into a model of the given class
+    built from their shapes, strictly, so the manifest only describes weights
+    that really fit it.
+
+    Args:
+        model_path: Base path of the checkpoint, or the path of its weights file
+        model_class: DQN or ConvDQN, the class the checkpoint was trained with
+
+    Returns:
+        Path of the manifest
+    """
+    base = checkpoint_base(model_path)
+    state_dict = torch.load(base + WEIGHTS_SUFFIX, map_location="cpu", weights_only=True)
+
+    model = model_from_state_dict(model_class, state_dict)
+    model.load_state_dict(state_dict)
+
+    return write_manifest(os.path.dirname(base), os.path.basename(base), model)
+
+
+def build_model(description):
+    """
+    Build an untrained model from its description
+
+    Args:
+        description: "model" entry of a manifest
+
+    Returns:
+        Model with the described architecture and dtype
+    """
+    if description["class"] not in MODEL_CLASSES:
+        raise ValueError(f"Unknown model class {description['class']}")
+
+    model = MODEL_CLASSES[description["class"]](*description["args"], **description["kwargs"])
+    model = model.to(getattr(torch, description["dtype"]))
+
+    if list(model.input_shape) != description["input_shape"] or model.output_dim != description["output_dim"]:
+        raise ValueError(f"{description['class']} built from the manifest has input shape {model.input_shape} "
+                         f"and {model.output_dim} actions, the manifest says {description['input_shape']} "
+                         f"and {description['output_dim']}")
+
+    return model
+
+
+def share_weights(model, state_dict):
+    """
+    Make a model use the tensors of a state dict as its weights, without copying them
+
+    Used to serve weights held in shared memory by another process.
+
+    Args:
+        model: Model built with build_model
+        state_dict: State dict of a model with the same architecture
+
+    Returns:
+        The model, in eval mode
+    """
+    expected = model.state_dict()
+    if set(expected) != set(state_dict):
+        raise ValueError(f"State dict keys {sorted(state_dict)} do not match the model's {sorted(expected)}")
+
+    for key, tensor in state_dict.items():
+        if tensor.shape != expected[key].shape:
+            raise ValueError(f"{key} has shape {tuple(tensor.shape)}, the model expects {tuple(expected[key].shape)}")
+
+        module_name, _, attribute = key.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attribute in module._parameters:
+            module._parameters[attribute].data = tensor
+        else:
+            module._buffers[attribute] = tensor
+
+    return model.eval()
+
+
+def load_checkpoint(model_path, device="cpu", warmup=True):
+    """
+    Load a checkpoint's Q-network from its manifest
+
+    The architecture is built from the manifest, the weights file is checked
+    against the manifest's hash and loaded strictly, and a warm-up forward pass
+    checks the output shape, so a mismatched checkpoint fails here instead of
+    on the first request. The weights are loaded with weights_only, so a
+    crafted file cannot run code when unpickled.
+
+    Args:
+        model_path: Base path of the checkpoint, or the path of one of its files
+        device: Device to load the model on
+        warmup: Run a forward pass on a zero state after loading
+
+    Returns:
+        (model in eval mode, manifest)
+    """
+    manifest = read_manifest(model_path)
+    description = manifest["model"]
+
+    # The weights must sit next to the manifest
+    weights_file = manifest["weights"]["file"]
+    if os.path.basename(weights_file) != weights_file or weights_file in ("", ".", ".."):
+        raise ValueError(f"Invalid weights file {weights_file!r} in the checkpoint manifest")
+    weights_path = os.path.join(os.path.dirname(checkpoint_base(model_path)), weights_file)
+    if file_sha256(weights_path) != manifest["weights"]["sha256"]:
+        raise ValueError(f"Weights in {weights_path} do not match the hash in the checkpoint manifest")
+
+    model = build_model(description).to(device)
+    model.load_state_dict(torch.load(weights_path, map_location=device, weights_only=True))
+    model.eval()
+
+    if warmup:
+        state = torch.zeros((1,) + tuple(description["input_shape"]), dtype=getattr(torch, description["dtype"]),
+                            device=device)
+        with torch.no_grad():
+            q_values = model(state)
+        if tuple(q_values.shape) != (1, description["output_dim"]):
+            raise ValueError(f"Warm-up forward pass returned shape {tuple(q_values.shape)}, "
+                             f"expected (1, {description['output_dim']})")
+
+    return model, manifest
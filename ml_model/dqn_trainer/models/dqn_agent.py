@@ -6,7 +6,9 @@ import os
 import logging
 from datetime import datetime
 
+from .checkpoint import write_manifest
 from ..utils.replay_buffer import ReplayBuffer
+from ..utils.tensor_conversion import BatchConverter
 
 class DQNAgent:
     """
@@ -66,6 +68,9 @@ class DQNAgent:
         # Set up replay buffer
         self.replay_buffer = ReplayBuffer(capacity=buffer_size)
         
+        # Converts sampled batches to tensors, reusing staging buffers between steps
+        self.batch_converter = BatchConverter(device)
+        
         # Store hyperparameters
         self.gamma = gamma
         self.epsilon = epsilon_start
@@ -104,20 +109,37 @@ class DQNAgent:
         if epsilon is None:
             epsilon = self.epsilon
             
-        # Convert state to tensor
-        if not isinstance(state, torch.Tensor):
-            state = torch.FloatTensor(state).unsqueeze(0).to(self.device)
-        
         # Epsilon-greedy action selection
         if np.random.random() < epsilon:
             # Explore: choose a random action
             return torch.randint(0, self.q_network.model[-1].out_features, (1,)).item()
         else:
+            # Convert state to tensor
+            if not isinstance(state, torch.Tensor):
+                state = self.batch_converter.to_tensor(state, name="state").unsqueeze(0)
+            
             # Exploit: choose the best action
             with torch.no_grad():
                 q_values = self.q_network(state)
                 return torch.argmax(q_values).item()
     
+    def select_actions(self, states):
+        """
+        Select the greedy action for each state of a batch
+        
+        Args:
+            states: Batch of states
+            
+        Returns:
+            NumPy array with the best action for each state
+        """
+        if not isinstance(states, torch.Tensor):
+            states = self.batch_converter.to_tensor(states, name="states")
+        
+        with torch.no_grad():
+            q_values = self.q_network(states)
+            return torch.argmax(q_values, dim=1).cpu().numpy()
+    
     def update_epsilon(self):
         """
         Update the exploration rate
@@ -158,12 +180,26 @@ class DQNAgent:
         # Sample a batch of experiences
         states, actions, next_states, rewards, dones = self.replay_buffer.sample(self.batch_size)
         
-        # Convert to tensors
-        states = torch.FloatTensor(states).to(self.device)
-        actions = torch.LongTensor(actions).unsqueeze(1).to(self.device)
-        next_states = torch.FloatTensor(next_states).to(self.device)
-        rewards = torch.FloatTensor(rewards).unsqueeze(1).to(self.device)
-        dones = torch.FloatTensor(dones).unsqueeze(1).to(self.device)
+        return self.train_on_batch(states, actions, next_states, rewards, dones)
+    
+    def train_on_batch(self, states, actions, next_states, rewards, dones):
+        """
+        Perform a single training step on a given batch of experiences
+        
+        Args:
+            states: Batch of states
+            actions: Batch of actions
+            next_states: Batch of next states
+            rewards: Batch of rewards
+            dones: Batch of done flags
+            
+        Returns:
+            Loss value for this step
+        """
+        # Convert to tensors (zero-copy where dtype and layout already match)
+        states, actions, next_states, rewards, dones = self.batch_converter.to_tensors(
+            states, actions, next_states, rewards, dones
+        )
         
         # Compute current Q values
         current_q_values = self.q_network(states).gather(1, actions)
@@ -235,6 +271,10 @@ class DQNAgent:
         """
         Save the model and training state
         
+        A manifest describing the model's architecture and the hash of its
+        weights is written last (see models/checkpoint.py), so a checkpoint
+        with a manifest is complete.
+        
         Args:
             path: Directory to save to
             name: Base name for files (if None, use timestamp)
@@ -266,6 +306,9 @@ class DQNAgent:
         training_path = os.path.join(path, f"{name}_training_state.pth")
         torch.save(training_state, training_path)
         
+        # Describe the architecture so the checkpoint can be loaded on its own
+        write_manifest(path, name, self.q_network)
+        
         self.logger.info(f"Saved model and training state to {path}")
     
     def load_model(self, path, name):
@@ -6,9 +6,18 @@ class DQN(nn.Module):
     """
     Deep Q-Network Model
     """
+    # States are flattened to input_shape before the forward pass
+    preprocessing = {"flatten": True}
+    
     def __init__(self, input_dim, output_dim, hidden_dims=[128, 128]):
         super(DQN, self).__init__()
         
+        # Constructor arguments, used to build copies and checkpoint manifests
+        self.init_args = (input_dim, output_dim)
+        self.init_kwargs = {"hidden_dims": list(hidden_dims)}
+        self.input_shape = (input_dim,)
+        self.output_dim = output_dim
+        
         # Build layers dynamically based on hidden_dims
         layers = []
         prev_dim = input_dim
@@ -52,9 +61,18 @@ class ConvDQN(nn.Module):
     """
     Convolutional DQN for image-based inputs (like screenshots of the game)
     """
+    # Pixel values are scaled to [0, 1] in forward
+    preprocessing = {"scale": 1.0 / 255.0}
+    
     def __init__(self, input_channels, output_dim):
         super(ConvDQN, self).__init__()
         
+        # Constructor arguments, used to build copies and checkpoint manifests
+        self.init_args = (input_channels, output_dim)
+        self.init_kwargs = {}
+        self.input_shape = (input_channels, 84, 84)  # fc_input_dim below assumes 84x84 frames
+        self.output_dim = output_dim
+        
         # Convolutional layers
         self.conv1 = nn.Conv2d(input_channels, 32, kernel_size=8, stride=4)
         self.conv2 = nn.Conv2d(32, 64, kernel_size=4, stride=2)
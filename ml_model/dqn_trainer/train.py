@@ -8,11 +8,14 @@ from datetime import datetime
 # Import DQN components
 from models.dqn_model import DQN, ConvDQN
 from models.dqn_agent import DQNAgent
+from models.checkpoint import migrate_checkpoint
 from utils.replay_buffer import ReplayBuffer
 from utils.data_processor import GameDataProcessor
 from utils.visualization import TrainingVisualizer
 from environments.space_game_env import SpaceGameEnvironment
 from utils.web_interface import WebGameAPI
+from utils.episode_manifest import MANIFEST_FILENAME, EpisodeManifest
+from utils.segment_compactor import SegmentCompactor
 
 # Set up logging
 logging.basicConfig(
@@ -30,8 +33,8 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Train a DQN agent on Space Invaders gameplay data")
     
     # Training options
-    parser.add_argument("--mode", type=str, choices=["train", "eval", "collect"], default="train",
-                        help="Mode to run the script in")
+    parser.add_argument("--mode", type=str, choices=["train", "eval", "collect", "compact", "migrate"],
+                        default="train", help="Mode to run the script in")
     parser.add_argument("--epochs", type=int, default=100,
                         help="Number of training epochs")
     parser.add_argument("--batch_size", type=int, default=64,
@@ -47,7 +50,7 @@ def parse_args():
     parser.add_argument("--hidden_dims", type=int, nargs="+", default=[128, 128],
                         help="Hidden layer dimensions")
     parser.add_argument("--load_model", type=str, default=None,
-                        help="Path to load a trained model from")
+                        help="Path to load a trained model from (or to write the manifest of with --mode=migrate)")
     
     # Environment options
     parser.add_argument("--env_steps", type=int, default=1000,
@@ -60,6 +63,33 @@ def parse_args():
                         help="Directory to save/load data from")
     parser.add_argument("--use_web_data", action="store_true",
                         help="Use data from the web game instead of simulated environment")
+    parser.add_argument("--load_workers", type=int, default=None,
+                        help="Number of processes used to load web game episodes (default: one per CPU)")
+    parser.add_argument("--max_episode_files", type=int, default=None,
+                        help="Maximum number of web game episode files to load")
+    parser.add_argument("--max_episode_bytes", type=int, default=None,
+                        help="Maximum total size in bytes of web game episode files to load")
+    parser.add_argument("--min_episode_reward", type=float, default=None,
+                        help="Only load web game episodes with at least this total reward")
+    parser.add_argument("--episodes_since", type=datetime.fromisoformat, default=None,
+                        help="Only load web game episodes recorded at or after this ISO date/time")
+    parser.add_argument("--session_id", type=str, default=None,
+                        help="Only load web game episodes from this game session")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream web game episodes in minibatches instead of loading them all into memory")
+    parser.add_argument("--shuffle_buffer_size", type=int, default=10000,
+                        help="Number of steps shuffled between when streaming")
+    parser.add_argument("--shard_index", type=int, default=0,
+                        help="Index of the shard of episode files this process trains on when streaming")
+    parser.add_argument("--num_shards", type=int, default=1,
+                        help="Number of shards the episode files are split into when streaming")
+    parser.add_argument("--segment_mb", type=int, default=256,
+                        help="Size in MB of the segment files episodes are merged into by --mode=compact")
+    parser.add_argument("--recompress", type=str, choices=["none", "zlib", "lzma"], default=None,
+                        help="Recompress episodes with this compression during --mode=compact")
+    parser.add_argument("--delete_delay", type=float, default=300.0,
+                        help="Seconds episode files moved by --mode=compact are kept for running loaders; "
+                             "they are deleted by a later compaction")
     
     # Output options
     parser.add_argument("--save_dir", type=str, default="./models",
@@ -74,8 +104,15 @@ def train_from_web_data(args):
     logger.info("Training from web game data")
     
     # Load data
-    api = WebGameAPI(data_dir=args.data_dir)
-    if not api.load_data():
+    api = WebGameAPI(data_dir=args.data_dir, read_only=True)
+    if not api.load_data(
+        num_workers=args.load_workers,
+        max_files=args.max_episode_files,
+        max_bytes=args.max_episode_bytes,
+        min_reward=args.min_episode_reward,
+        since=args.episodes_since,
+        session_id=args.session_id
+    ):
         logger.error("No data found. Please collect data first using --mode=collect")
         return
     
@@ -90,6 +127,7 @@ def train_from_web_data(args):
     states, actions, rewards, next_states, dones = api.get_training_data()
     
     # Determine input and output dimensions
+    state_shape = np.asarray(states[0]).shape
     input_dim = states[0].size if hasattr(states[0], 'size') else len(states[0])
     output_dim = len(np.unique(actions))
     
@@ -105,7 +143,7 @@ def train_from_web_data(args):
         model = DQN(input_dim=input_dim, output_dim=output_dim, hidden_dims=args.hidden_dims)
     else:
         # Assume input is image-like for conv model
-        model = ConvDQN(input_channels=states[0].shape[0] if len(states[0].shape) > 2 else 1, output_dim=output_dim)
+        model = ConvDQN(input_channels=state_shape[0] if len(state_shape) > 2 else 1, output_dim=output_dim)
     
     # Create agent
     agent = DQNAgent(
@@ -148,6 +186,95 @@ def train_from_web_data(args):
     
     logger.info("Training complete")
 
+def train_from_web_stream(args):
+    """Train a DQN agent by streaming minibatches of web game data"""
+    logger.info("Training from streamed web game data")
+    
+    # Select episodes
+    api = WebGameAPI(data_dir=args.data_dir, read_only=True)
+    filters = {
+        "min_reward": args.min_episode_reward,
+        "since": args.episodes_since,
+        "session_id": args.session_id
+    }
+    dataset = api.get_training_dataset(
+        batch_size=args.batch_size,
+        max_files=args.max_episode_files,
+        max_bytes=args.max_episode_bytes,
+        shuffle_buffer_size=args.shuffle_buffer_size,
+        shard_index=args.shard_index,
+        num_shards=args.num_shards,
+        **filters
+    )
+    episodes = api.query_episodes(**filters)
+    if not dataset.sources or not episodes:
+        logger.error("No data found. Please collect data first using --mode=collect")
+        return
+    logger.info(f"Streaming {len(dataset.sources)} episodes (shard {args.shard_index + 1}/{args.num_shards})")
+    
+    # drop_last discards partial batches, so a shard with fewer steps than a batch would yield nothing
+    num_steps = {(os.path.join(api.data_dir, episode["path"]), episode["offset"]): episode["num_steps"]
+                 for episode in episodes}
+    shard_steps = sum(num_steps.get((path, offset), 0) for path, offset, _ in dataset.sources)
+    if shard_steps < args.batch_size:
+        logger.error(f"The selected episodes hold {shard_steps} steps, fewer than one batch of "
+                     f"{args.batch_size}; select more episodes or lower --batch_size")
+        return
+    
+    # Determine input and output dimensions from the first episode's header and the manifest
+    state_shape = dataset.state_shape()
+    input_dim = int(np.prod(state_shape))
+    output_dim = max(len(episode["action_counts"]) for episode in episodes)
+    
+    logger.info(f"Input dimension: {input_dim}")
+    logger.info(f"Output dimension: {output_dim}")
+    
+    # Create device
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    logger.info(f"Using device: {device}")
+    
+    # Create model
+    if args.model_type == "linear":
+        model = DQN(input_dim=input_dim, output_dim=output_dim, hidden_dims=args.hidden_dims)
+    else:
+        # Assume input is image-like for conv model
+        model = ConvDQN(input_channels=state_shape[0] if len(state_shape) > 2 else 1, output_dim=output_dim)
+    
+    # Create agent
+    agent = DQNAgent(
+        model=model,
+        learning_rate=args.learning_rate,
+        gamma=args.gamma,
+        batch_size=args.batch_size,
+        device=device
+    )
+    
+    # Train agent, one pass over the episodes per epoch
+    logger.info(f"Training for {args.epochs} epochs")
+    for epoch in range(args.epochs):
+        losses = [
+            agent.train_on_batch(states, actions, next_states, rewards, dones)
+            for states, actions, rewards, next_states, dones in dataset
+        ]
+        if losses:
+            logger.info(f"Epoch {epoch+1}/{args.epochs}, Loss: {np.mean(losses):.4f}")
+    
+    # Create directory for saving model
+    os.makedirs(args.save_dir, exist_ok=True)
+    
+    # Save model
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    model_name = f"dqn_web_{timestamp}"
+    agent.save_model(args.save_dir, model_name)
+    logger.info(f"Model saved as {model_name}")
+    
+    # Create visualizations
+    visualizer = TrainingVisualizer(save_dir=args.plot_dir)
+    visualizer.plot_losses(agent.loss_history)
+    visualizer.plot_epsilon(agent.epsilon_history)
+    
+    logger.info("Training complete")
+
 def train_with_environment(args):
     """Train a DQN agent using a simulated environment"""
     logger.info("Training with simulated environment")
@@ -355,7 +482,7 @@ def collect_web_data(args):
     logger.info("Setting up for web data collection")
     
     # Create API
-    api = WebGameAPI(data_dir=args.data_dir)
+    api = WebGameAPI(data_dir=args.data_dir, read_only=True)
     
     # Log instructions
     logger.info(f"Data will be saved to {args.data_dir}")
@@ -381,6 +508,45 @@ def collect_web_data(args):
     logger.info("3. Data will be automatically saved to the specified directory")
     logger.info("4. Run train.py with --mode=train and --use_web_data to train on the collected data")
 
+def compact_web_data(args):
+    """Merge recorded web game episode files into segment files"""
+    logger.info(f"Compacting episodes in {args.data_dir}")
+    
+    # Compaction only needs the manifest, so it can run next to a server recording to data_dir
+    manifest = EpisodeManifest(os.path.join(args.data_dir, MANIFEST_FILENAME))
+    try:
+        compactor = SegmentCompactor(args.data_dir, manifest, segment_bytes=args.segment_mb * 1024 * 1024,
+                                     compression=args.recompress, delete_delay=args.delete_delay)
+        result = compactor.compact()
+    except Exception as e:
+        logger.error(f"Compaction failed: {str(e)}")
+        return
+    finally:
+        manifest.close()
+    
+    if result is None:
+        logger.error("Another compaction of this data directory is running")
+        return
+    
+    logger.info(f"Moved {result['episodes']} episodes: {result['bytes_read']} bytes of episode files "
+                f"became {result['bytes_written']} bytes of segments, deleted {result['files_removed']} "
+                f"episode files moved earlier")
+
+def migrate_model(args):
+    """Write the manifest of a checkpoint saved before checkpoints had one"""
+    if not args.load_model:
+        logger.error("No model specified. Use --load_model to specify the checkpoint to migrate.")
+        return
+    
+    model_class = DQN if args.model_type == "linear" else ConvDQN
+    try:
+        manifest_path = migrate_checkpoint(args.load_model, model_class)
+    except Exception as e:
+        logger.error(f"Failed to migrate {args.load_model}: {str(e)}")
+        return
+    
+    logger.info(f"Wrote checkpoint manifest {manifest_path}")
+
 def main():
     """Main function"""
     args = parse_args()
@@ -392,7 +558,9 @@ def main():
     
     # Run in specified mode
     if args.mode == "train":
-        if args.use_web_data:
+        if args.use_web_data and args.stream:
+            train_from_web_stream(args)
+        elif args.use_web_data:
             train_from_web_data(args)
         else:
             train_with_environment(args)
@@ -400,6 +568,10 @@ def main():
         evaluate_model(args)
     elif args.mode == "collect":
         collect_web_data(args)
+    elif args.mode == "compact":
+        compact_web_data(args)
+    elif args.mode == "migrate":
+        migrate_model(args)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
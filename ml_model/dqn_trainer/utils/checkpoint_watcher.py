@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+
+# DQNAgent.save_model writes the manifest last, so a checkpoint is complete once it exists
+CHECKPOINT_SUFFIX = "_manifest.json"
+
+
+def latest_checkpoint(directory, suffix=CHECKPOINT_SUFFIX):
+    """
+    Find the newest checkpoint in a directory
+
+    Args:
+        directory: Checkpoint directory
+        suffix: Suffix of the file marking a complete checkpoint
+
+    Returns:
+        Path of the newest marker file, or None if there is none
+    """
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(suffix)]
+    except FileNotFoundError:
+        return None
+
+    if not entries:
+        return None
+    return max(entries, key=lambda entry: entry.stat().st_mtime).path
+
+
+class CheckpointWatcher:
+    """
+    Watch a directory for new checkpoints
+
+    A background thread polls the directory and calls the callback with the
+    base path of a new checkpoint (the path DQNAgent.load_model and
+    models/checkpoint.py load_checkpoint take). A checkpoint is only reported
+    once its manifest has kept the same size and modification time over two
+    polls.
+    """
+    def __init__(self, directory, callback, poll_interval=5.0, suffix=CHECKPOINT_SUFFIX):
+        """
+        Initialize the watcher and start its thread
+
+        Args:
+            directory: Checkpoint directory
+            callback: Function called as callback(model_path) for each new checkpoint
+            poll_interval: Seconds between polls
+            suffix: Suffix of the file marking a complete checkpoint
+        """
+        self.directory = directory
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.suffix = suffix
+
+        self.logger = logging.getLogger("CheckpointWatcher")
+
+        self._reported = None
+        self._candidate = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="CheckpointWatcher", daemon=True)
+        self._thread.start()
+
+    def latest(self):
+        """
+        Get the newest complete checkpoint in the directory
+
+        Returns:
+            Base path of the checkpoint, or None if there is none
+        """
+        path = latest_checkpoint(self.directory, self.suffix)
+        return path[:-len(self.suffix)] if path is not None else None
+
+    def _poll(self):
+        """Report the newest checkpoint if it is new and no longer being written"""
+        path = latest_checkpoint(self.directory, self.suffix)
+        if path is None or path == self._reported:
+            return
+
+        stat = os.stat(path)
+        candidate = (path, stat.st_size, stat.st_mtime)
+        if candidate != self._candidate:
+            # Wait one more poll to see that the file stopped changing
+            self._candidate = candidate
+            return
+
+        self._reported = path
+        self.logger.info(f"New checkpoint {path}")
+        self.callback(path[:-len(self.suffix)])
+
+    def _run(self):
+        """Poll until stopped (runs in a thread)"""
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self._poll()
+            except Exception as e:
+                self.logger.error(f"Error watching {self.directory}: {str(e)}")
+
+    def stop(self):
+        """Stop watching"""
+        self._stopped.set()
+        self._thread.join()
@@ -0,0 +1,159 @@
+import numpy as np
+
+
+def allocate_columns(sample_rows, capacity, dtypes):
+    """
+    Allocate empty columns shaped like the given rows
+
+    Args:
+        sample_rows: Dict of field name to an array of rows
+        capacity: Number of rows to allocate in every column
+        dtypes: Dict of field name to dtype; fields that are missing or map to
+            None keep the dtype of the sample rows
+
+    Returns:
+        Dict of field name to an uninitialized array of capacity rows
+    """
+    columns = {}
+    for name, rows in sample_rows.items():
+        dtype = dtypes.get(name)
+        if dtype is None:
+            dtype = rows.dtype
+        columns[name] = np.empty((capacity, *rows.shape[1:]), dtype=dtype)
+    return columns
+
+
+class ColumnarBuffer:
+    """
+    Append-only table stored as one growable NumPy array per field
+
+    Columns are allocated on the first append, using the shape and dtype of
+    the first values (or the dtypes given up front), and double in capacity
+    when full, so appends are amortized O(1) and reading a range of rows is a
+    slice view rather than a Python loop.
+    """
+    def __init__(self, dtypes=None, initial_capacity=1024):
+        """
+        Initialize the buffer
+
+        Args:
+            dtypes: Optional dict of field name to dtype; fields that are missing or
+                map to None keep the dtype of the first appended values
+            initial_capacity: Number of rows allocated on the first append
+        """
+        self.dtypes = dict(dtypes or {})
+        self.initial_capacity = max(1, initial_capacity)
+        self.columns = {}
+        self.size = 0
+        self.capacity = 0
+
+    def __len__(self):
+        """Return the number of rows"""
+        return self.size
+
+    @property
+    def fields(self):
+        """Names of the stored fields"""
+        return list(self.columns)
+
+    def _allocate(self, sample_rows):
+        """
+        Allocate empty columns shaped like the given rows
+
+        Args:
+            sample_rows: Dict of field name to an array of rows
+        """
+        self.capacity = max(self.initial_capacity, len(next(iter(sample_rows.values()))))
+        self.columns = allocate_columns(sample_rows, self.capacity, self.dtypes)
+
+    def reserve(self, capacity):
+        """
+        Make sure the buffer can hold at least capacity rows without growing
+
+        Args:
+            capacity: Number of rows to make room for
+        """
+        if capacity <= self.capacity:
+            return
+
+        new_capacity = max(capacity, 2 * self.capacity)
+        for name, column in self.columns.items():
+            grown = np.empty((new_capacity, *column.shape[1:]), dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        self.capacity = new_capacity
+
+    def append(self, **values):
+        """
+        Append a single row
+
+        Args:
+            **values: Value of every field for the new row
+        """
+        self.extend(**{name: np.asarray(value)[np.newaxis] for name, value in values.items()})
+
+    def extend(self, **rows):
+        """
+        Append several rows at once
+
+        Args:
+            **rows: Array of rows for every field, all with the same length
+        """
+        rows = {name: np.asarray(value) for name, value in rows.items()}
+        count = len(next(iter(rows.values())))
+
+        if not self.columns:
+            self._allocate(rows)
+        elif set(rows) != set(self.columns):
+            raise ValueError(f"Expected fields {sorted(self.columns)}, got {sorted(rows)}")
+
+        self.reserve(self.size + count)
+        for name, value in rows.items():
+            self.columns[name][self.size:self.size + count] = value
+        self.size += count
+
+    def column(self, name, start=0, end=None):
+        """
+        Get a view of a range of rows of one field
+
+        The view shares memory with the buffer until the next time it grows.
+
+        Args:
+            name: Field name
+            start: First row
+            end: Row after the last one (if None, the current size)
+
+        Returns:
+            Array view
+        """
+        if end is None:
+            end = self.size
+        return self.columns[name][start:end]
+
+    def as_dict(self, start=0, end=None):
+        """
+        Get views of a range of rows of every field
+
+        Args:
+            start: First row
+            end: Row after the last one (if None, the current size)
+
+        Returns:
+            Dict of field name to array view
+        """
+        return {name: self.column(name, start, end) for name in self.columns}
+
+    def truncate(self, size):
+        """
+        Drop every row from size onwards, keeping the allocated capacity
+
+        Args:
+            size: Number of rows to keep
+        """
+        self.size = min(self.size, size)
+
+    def clear(self):
+        """Remove all rows and release the columns"""
+        self.columns = {}
+        self.size = 0
+        self.capacity = 0
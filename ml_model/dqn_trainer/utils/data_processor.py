@@ -1,12 +1,46 @@
 import numpy as np
-import torch
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
+from .frame_cache import FrameCache
+from .frame_stack import FrameStack
+from .ring_buffer import RingBuffer
+from .tensor_conversion import BatchConverter
+
+# Integer ITU-R BT.601 luma weights for (R, G, B); they sum to 256 so grayscale is a right shift
+GRAYSCALE_WEIGHTS = (77, 150, 29)
+
+# Storage dtypes of collected gameplay fields; None keeps the dtype of the collected values
+GAMEPLAY_DTYPES = {
+    'state': None,
+    'action': np.int64,
+    'next_state': None,
+    'reward': np.float32,
+    'done': np.bool_
+}
+
+def to_grayscale(frames):
+    """
+    Convert RGB frames to grayscale with the integer luma weights
+    
+    Args:
+        frames: uint8 array whose last axis holds the (R, G, B) channels
+        
+    Returns:
+        uint16 array of grayscale values in [0, 255] without the channel axis
+    """
+    # Weighted grayscale in uint16: 255 * 256 still fits
+    gray = np.multiply(frames[..., 0], GRAYSCALE_WEIGHTS[0], dtype=np.uint16)
+    gray += np.multiply(frames[..., 1], GRAYSCALE_WEIGHTS[1], dtype=np.uint16)
+    gray += np.multiply(frames[..., 2], GRAYSCALE_WEIGHTS[2], dtype=np.uint16)
+    gray >>= 8
+    return gray
+
 class GameDataProcessor:
     """
     Process game data for training a DQN model
     """
-    def __init__(self, state_shape=(84, 84), frame_stack=4, device="cpu"):
+    def __init__(self, state_shape=(84, 84), frame_stack=4, device="cpu", frame_cache_bytes=0):
         """
         Initialize the data processor
         
@@ -14,16 +48,38 @@ class GameDataProcessor:
             state_shape: Shape to resize game frames to (height, width)
             frame_stack: Number of frames to stack together
             device: Device to use for tensor operations
+            frame_cache_bytes: Size in bytes of the LRU cache of preprocessed frames (0 disables it)
         """
         self.state_shape = state_shape
         self.frame_stack = frame_stack
         self.device = device
+        self.batch_converter = BatchConverter(device)
+        self.frame_cache = FrameCache(frame_cache_bytes) if frame_cache_bytes > 0 else None
+        self.frames = None
         self.current_stack = None
     
     def preprocess_frame(self, frame):
         """
         Preprocess a single frame
         
+        With a frame cache, repeated NumPy frames are looked up by a hash of their
+        bytes and the cached, read-only result is returned.
+        
+        Args:
+            frame: Raw frame from the game
+            
+        Returns:
+            Preprocessed frame
+        """
+        if self.frame_cache is not None and isinstance(frame, np.ndarray):
+            return self.frame_cache.get_or_compute(frame, self._preprocess_frame)
+        
+        return self._preprocess_frame(frame)
+    
+    def _preprocess_frame(self, frame):
+        """
+        Preprocess a single frame without the cache
+        
         Args:
             frame: Raw frame from the game
             
@@ -34,8 +90,8 @@ class GameDataProcessor:
         if isinstance(frame, np.ndarray):
             # If frame is a numpy array (e.g., screenshot)
             if len(frame.shape) == 3 and frame.shape[2] == 3:  # RGB image
-                # Convert to grayscale
-                frame = np.mean(frame, axis=2).astype(np.uint8)
+                # Convert to grayscale with the same weights as preprocess_batch
+                frame = to_grayscale(frame.astype(np.uint8, copy=False)).astype(np.uint8)
             
             # Resize the frame
             frame = Image.fromarray(frame).resize(self.state_shape)
@@ -49,11 +105,94 @@ class GameDataProcessor:
         
         return frame
     
+    def preprocess_batch(self, frames, out=None, num_workers=1, chunk_size=64):
+        """
+        Preprocess a batch of frames in one vectorized pass
+        
+        RGB frames are converted to grayscale with integer luma weights. When the
+        frame size is an integer multiple of state_shape, frames are downsampled by
+        averaging each block of pixels, summing one strided view per pixel offset
+        in the block; otherwise each frame falls back to a PIL resize.
+        
+        Args:
+            frames: uint8 array of shape (N, H, W, 3) or grayscale (N, H, W)
+            out: Optional float32 array of shape (N, *state_shape) to write into
+            num_workers: Number of threads to split the batch across
+            chunk_size: Number of frames each thread processes at a time
+            
+        Returns:
+            Preprocessed frames in [0, 1], shape (N, *state_shape)
+        """
+        frames = np.asarray(frames)
+        if frames.dtype != np.uint8:
+            raise ValueError(f"Expected uint8 frames, got {frames.dtype}")
+        if not (frames.ndim == 3 or (frames.ndim == 4 and frames.shape[3] == 3)):
+            raise ValueError(f"Expected frames of shape (N, H, W, 3) or (N, H, W), got {frames.shape}")
+        
+        expected_shape = (len(frames), *self.state_shape)
+        if out is None:
+            out = np.empty(expected_shape, dtype=np.float32)
+        elif out.shape != expected_shape or out.dtype != np.float32:
+            raise ValueError(f"Output buffer must be float32 with shape {expected_shape}, "
+                             f"got {out.dtype} {out.shape}")
+        
+        starts = range(0, len(frames), chunk_size)
+        
+        # NumPy and PIL release the GIL for the heavy work, so threads scale across cores
+        if num_workers > 1 and len(frames) > chunk_size:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                list(executor.map(
+                    lambda start: self._preprocess_chunk(frames[start:start + chunk_size],
+                                                         out[start:start + chunk_size]),
+                    starts
+                ))
+        else:
+            for start in starts:
+                self._preprocess_chunk(frames[start:start + chunk_size], out[start:start + chunk_size])
+        
+        return out
+    
+    def _preprocess_chunk(self, frames, out):
+        """
+        Preprocess a chunk of frames into an output buffer
+        
+        Args:
+            frames: uint8 array of shape (n, H, W, 3) or (n, H, W)
+            out: float32 array of shape (n, *state_shape) to write into
+        """
+        if frames.ndim == 4:
+            gray = to_grayscale(frames)
+        else:
+            gray = frames
+        
+        n, frame_height, frame_width = gray.shape
+        height, width = self.state_shape
+        
+        if frame_height % height == 0 and frame_width % width == 0:
+            # Area downsampling: average every (factor_h, factor_w) block of pixels by
+            # summing strided views, which is much faster than a reshape + sum over axes
+            factor_h = frame_height // height
+            factor_w = frame_width // width
+            sums = np.zeros((n, height, width), dtype=np.uint32)
+            for i in range(factor_h):
+                for j in range(factor_w):
+                    sums += gray[:, i::factor_h, j::factor_w]
+            np.multiply(sums, 1.0 / (255.0 * factor_h * factor_w), out=out, casting="unsafe")
+        else:
+            gray = gray.astype(np.uint8, copy=False)
+            for i in range(n):
+                resized = Image.fromarray(gray[i]).resize((width, height))
+                np.multiply(np.asarray(resized), 1.0 / 255.0, out=out[i], casting="unsafe")
+    
     def reset(self):
         """
         Reset the frame stack
         """
-        self.current_stack = np.zeros((self.frame_stack, *self.state_shape), dtype=np.float32)
+        if self.frames is None:
+            self.frames = FrameStack(self.frame_stack, self.state_shape)
+        else:
+            self.frames.reset()
+        self.current_stack = self.frames.stack()
     
     def update_stack(self, frame):
         """
@@ -63,7 +202,8 @@ class GameDataProcessor:
             frame: New frame to add to the stack
             
         Returns:
-            Updated frame stack
+            Updated frame stack, oldest frame first. This is a view of the stack's
+            ring buffer that the next update overwrites, so copy it before storing it.
         """
         if self.current_stack is None:
             self.reset()
@@ -71,9 +211,8 @@ class GameDataProcessor:
         # Preprocess the frame
         processed_frame = self.preprocess_frame(frame)
         
-        # Shift the stack and add the new frame
-        self.current_stack = np.roll(self.current_stack, shift=-1, axis=0)
-        self.current_stack[-1] = processed_frame
+        # Write the new frame over the oldest one
+        self.current_stack = self.frames.push(processed_frame)
         
         return self.current_stack
     
@@ -85,16 +224,14 @@ class GameDataProcessor:
             state: State to convert (if None, use current_stack)
             
         Returns:
-            State tensor
+            State tensor; on CPU it shares memory with the state when that is
+            already a contiguous float32 array (such as the current frame stack)
         """
         if state is None:
             state = self.current_stack
             
-        # Convert to tensor and add batch dimension
-        state_tensor = torch.FloatTensor(state).unsqueeze(0)
-        
-        # Move to correct device
-        return state_tensor.to(self.device)
+        # Convert to tensor on the correct device and add batch dimension
+        return self.batch_converter.to_tensor(state, name="state").unsqueeze(0)
     
     def process_batch(self, states, actions, next_states, rewards, dones):
         """
@@ -108,21 +245,18 @@ class GameDataProcessor:
             dones: Batch of done flags
             
         Returns:
-            Processed tensors ready for training
+            Processed tensors ready for training. Tensors that needed a dtype
+            conversion live in staging buffers reused by the next call.
         """
-        # Convert to tensors
-        states_tensor = torch.FloatTensor(states).to(self.device)
-        actions_tensor = torch.LongTensor(actions).unsqueeze(1).to(self.device)
-        next_states_tensor = torch.FloatTensor(next_states).to(self.device)
-        rewards_tensor = torch.FloatTensor(rewards).unsqueeze(1).to(self.device)
-        dones_tensor = torch.FloatTensor(dones).unsqueeze(1).to(self.device)
-        
-        return states_tensor, actions_tensor, next_states_tensor, rewards_tensor, dones_tensor
+        return self.batch_converter.to_tensors(states, actions, next_states, rewards, dones)
 
 
 class WebGameDataCollector:
     """
     Collect data from web-based games
+    
+    Data is kept in a fixed-capacity ring buffer with one typed array per field,
+    so evicting the oldest step once the collector is full is O(1).
     """
     def __init__(self, buffer_size=10000):
         """
@@ -131,8 +265,12 @@ class WebGameDataCollector:
         Args:
             buffer_size: Size of the replay buffer
         """
-        self.gameplay_data = []
         self.max_buffer_size = buffer_size
+        self.gameplay_data = RingBuffer(buffer_size, dtypes=GAMEPLAY_DTYPES)
+    
+    def __len__(self):
+        """Return the number of collected steps"""
+        return len(self.gameplay_data)
     
     def add_gameplay_data(self, state, action, next_state, reward, done):
         """
@@ -145,42 +283,50 @@ class WebGameDataCollector:
             reward: Reward received
             done: Whether the episode is done
         """
-        # Convert data to numpy arrays if they're not already
-        if not isinstance(state, np.ndarray):
-            state = np.array(state)
-        if not isinstance(next_state, np.ndarray):
-            next_state = np.array(next_state)
-            
-        # Store the data
-        self.gameplay_data.append({
-            'state': state,
-            'action': action,
-            'next_state': next_state,
-            'reward': reward,
-            'done': done
-        })
-        
-        # If we've exceeded the buffer size, remove the oldest data
-        if len(self.gameplay_data) > self.max_buffer_size:
-            self.gameplay_data.pop(0)
+        # Store the data, overwriting the oldest step if we've reached the buffer size
+        self.gameplay_data.append(
+            state=state,
+            action=action,
+            next_state=next_state,
+            reward=reward,
+            done=done
+        )
     
     def save_data(self, filename):
         """
         Save collected data to a file
         
+        The file is an uncompressed .npz archive with one array per field, oldest
+        step first, so it can be loaded without pickle.
+        
         Args:
             filename: File to save data to
         """
-        np.save(filename, self.gameplay_data, allow_pickle=True)
+        # Save through a handle so numpy does not change the extension
+        with open(filename, 'wb') as f:
+            np.savez(f, **self.gameplay_data.as_dict())
     
     def load_data(self, filename):
         """
-        Load collected data from a file
+        Load collected data from a file, replacing any collected data
         
         Args:
             filename: File to load data from
         """
-        self.gameplay_data = list(np.load(filename, allow_pickle=True))
+        self.gameplay_data.clear()
+        
+        try:
+            data = np.load(filename, allow_pickle=False)
+        except ValueError:
+            # Files written before the typed format hold a pickled list of step dicts
+            for step in np.load(filename, allow_pickle=True):
+                self.add_gameplay_data(step['state'], step['action'], step['next_state'],
+                                       step['reward'], step['done'])
+            return
+        
+        with data:
+            if data.files:
+                self.gameplay_data.extend(**{name: data[name] for name in GAMEPLAY_DTYPES})
     
     def get_training_data(self):
         """
@@ -189,10 +335,8 @@ class WebGameDataCollector:
         Returns:
             states, actions, next_states, rewards, dones
         """
-        states = np.array([data['state'] for data in self.gameplay_data])
-        actions = np.array([data['action'] for data in self.gameplay_data])
-        next_states = np.array([data['next_state'] for data in self.gameplay_data])
-        rewards = np.array([data['reward'] for data in self.gameplay_data])
-        dones = np.array([data['done'] for data in self.gameplay_data])
+        if not len(self.gameplay_data):
+            return tuple(np.array([]) for _ in range(5))
         
-        return states, actions, next_states, rewards, dones 
\ No newline at end of file
+        data = self.gameplay_data.as_dict()
+        return data['state'], data['action'], data['next_state'], data['reward'], data['done']
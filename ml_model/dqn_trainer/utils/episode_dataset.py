@@ -0,0 +1,203 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .episode_format import EPISODE_FIELDS
+from .parallel_loader import _as_source, read_episode_file, read_episode_state_shape
+
+# Marks the end of the stream in the batch queue
+_END = object()
+
+
+class EpisodeDataset:
+    """
+    Stream fixed-size minibatches from episode files without loading them all
+
+    Episodes are decoded lazily by background reader threads, a bounded number
+    of episodes ahead, and their steps go through a fixed-capacity shuffle
+    buffer: once the buffer is full, every batch is drawn at random from it and
+    the freed slots are refilled from the stream. A background thread keeps a
+    few batches ready, so decoding and shuffling overlap with training. Memory
+    use is bounded by the shuffle buffer and the prefetch depths, not by the
+    size of the dataset.
+
+    Episode files can be split between training processes with shard_index and
+    num_shards; each shard reads a disjoint subset of the files.
+    """
+    def __init__(self, sources, batch_size=64, shuffle=True, shuffle_buffer_size=10000, drop_last=True,
+                 num_threads=2, prefetch_episodes=8, prefetch_batches=4, shard_index=0, num_shards=1,
+                 seed=None):
+        """
+        Initialize the dataset
+
+        Args:
+            sources: Episode file paths, or (path, offset, length) tuples (see load_episode_files)
+            batch_size: Number of steps per batch
+            shuffle: Whether to shuffle the file order and the steps (if False, steps are yielded in order)
+            shuffle_buffer_size: Number of steps to shuffle between
+            drop_last: Whether to drop the last batch if it is smaller than batch_size
+            num_threads: Number of threads decoding episode files
+            prefetch_episodes: Maximum number of decoded episodes waiting to be shuffled
+            prefetch_batches: Maximum number of batches waiting to be consumed
+            shard_index: Index of this shard
+            num_shards: Number of shards the files are split into
+            seed: Random seed for shuffling
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+
+        self.sources = [_as_source(source) for source in sources][shard_index::num_shards]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = max(shuffle_buffer_size, batch_size) if shuffle else batch_size
+        self.drop_last = drop_last
+        self.num_threads = max(1, num_threads)
+        self.prefetch_episodes = max(1, prefetch_episodes)
+        self.prefetch_batches = max(1, prefetch_batches)
+        self.rng = np.random.default_rng(seed)
+
+    def state_shape(self):
+        """
+        Get the shape of one state from the header of the first episode, without iterating
+
+        Returns:
+            Tuple of the state dimensions
+        """
+        if not self.sources:
+            raise ValueError("Dataset has no episodes")
+        return read_episode_state_shape(*self.sources[0])
+
+    def __iter__(self):
+        """
+        Iterate over one pass of the dataset
+
+        Yields:
+            (states, actions, rewards, next_states, dones) arrays of batch_size steps
+        """
+        batches = queue.Queue(maxsize=self.prefetch_batches)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(batches, stop), daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _END:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # Unblock and stop the producer if the consumer stopped early
+            stop.set()
+            while producer.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.1)
+
+    def _episodes(self, stop):
+        """Decode episodes in background threads, a bounded number ahead, in file order"""
+        order = self.rng.permutation(len(self.sources)) if self.shuffle else range(len(self.sources))
+
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            pending = deque()
+            for index in order:
+                if stop.is_set():
+                    return
+                pending.append(executor.submit(read_episode_file, *self.sources[index]))
+                if len(pending) >= self.prefetch_episodes:
+                    yield pending.popleft().result()
+
+            while pending and not stop.is_set():
+                yield pending.popleft().result()
+
+    def _produce(self, batches, stop):
+        """Fill the shuffle buffer from the episode stream and queue batches (runs in a thread)"""
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        episodes = self._episodes(stop)
+        try:
+            capacity = self.shuffle_buffer_size
+            buffer = None
+            size = 0
+
+            for episode in episodes:
+                if buffer is None:
+                    buffer = {
+                        field: np.empty((capacity,) + episode[field].shape[1:], dtype=episode[field].dtype)
+                        for field in EPISODE_FIELDS
+                    }
+
+                position = 0
+                num_steps = len(episode["action"])
+                while position < num_steps:
+                    # Copy as many steps as fit into the buffer
+                    count = min(capacity - size, num_steps - position)
+                    for field in EPISODE_FIELDS:
+                        buffer[field][size:size + count] = episode[field][position:position + count]
+                    size += count
+                    position += count
+
+                    if size == capacity:
+                        batch, size = self._take_batch(buffer, size, self.batch_size)
+                        if not put(batch):
+                            return
+
+            # Drain the buffer
+            while buffer is not None and size >= self.batch_size:
+                batch, size = self._take_batch(buffer, size, self.batch_size)
+                if not put(batch):
+                    return
+            if buffer is not None and size > 0 and not self.drop_last:
+                batch, size = self._take_batch(buffer, size, size)
+                if not put(batch):
+                    return
+
+            put(_END)
+
+        except Exception as e:
+            put(e)
+
+        finally:
+            episodes.close()
+
+    def _take_batch(self, buffer, size, batch_size):
+        """
+        Remove a batch of steps from the shuffle buffer
+
+        Args:
+            buffer: Dict of field name to buffer array
+            size: Number of steps in the buffer
+            batch_size: Number of steps to remove
+
+        Returns:
+            (batch as a tuple of arrays in EPISODE_FIELDS order, new size of the buffer)
+        """
+        if self.shuffle:
+            indices = np.sort(self.rng.choice(size, batch_size, replace=False))
+        else:
+            indices = np.arange(batch_size)
+
+        batch = tuple(buffer[field][indices] for field in EPISODE_FIELDS)
+
+        # Keep the buffer dense: move the surviving steps from its tail into the freed slots
+        remaining = size - batch_size
+        tail = np.arange(remaining, size)
+        movers = tail[~np.isin(tail, indices, assume_unique=True)]
+        holes = indices[indices < remaining]
+        if len(holes):
+            for field in EPISODE_FIELDS:
+                buffer[field][holes] = buffer[field][movers]
+
+        return batch, remaining
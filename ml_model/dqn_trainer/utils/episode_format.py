@@ -0,0 +1,294 @@
+import json
+import lzma
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# File extension of binary episode files
+EPISODE_EXTENSION = ".bin"
+
+# Fields of every recorded step, in the order training data is returned
+EPISODE_FIELDS = ("state", "action", "reward", "next_state", "done")
+
+# In-memory dtype of every field
+EPISODE_DTYPES = {
+    "state": np.float32,
+    "action": np.int64,
+    "reward": np.float32,
+    "next_state": np.float32,
+    "done": np.bool_
+}
+
+# Magic bytes, format version and header length at the start of every episode blob
+MAGIC = b"GCEP"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+
+# Supported payload compressions
+COMPRESSORS = {
+    "none": (lambda data, level: data, lambda data: data),
+    "zlib": (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    "lzma": (lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress)
+}
+
+
+def episode_columns(steps):
+    """
+    Convert a list of step dicts into per-field arrays
+
+    Args:
+        steps: List of dicts with state, action, reward, next_state and done
+
+    Returns:
+        Dict of field name to array
+    """
+    return {
+        field: np.asarray([step[field] for step in steps], dtype=EPISODE_DTYPES[field])
+        for field in EPISODE_FIELDS
+    }
+
+
+def _rows_equal(a, b):
+    """Compare two arrays of observations row by row"""
+    return (a == b).reshape(len(a), -1).all(axis=1)
+
+
+def _deduplicate_observations(states, next_states):
+    """
+    Store every distinct observation of an episode once
+
+    Consecutive identical states (pauses, menus) collapse into one entry, and a
+    next_state is only stored when it differs from the following state.
+
+    Args:
+        states: Array of states, shape (n, ...)
+        next_states: Array of next states, shape (n, ...)
+
+    Returns:
+        (observations, state_index, next_state_index)
+    """
+    n = len(states)
+
+    # Keep a state only when it differs from the previous one
+    new_state = np.ones(n, dtype=bool)
+    if n > 1:
+        new_state[1:] = ~_rows_equal(states[1:], states[:-1])
+    state_index = np.cumsum(new_state) - 1
+
+    # next_state[i] usually equals state[i + 1]; store the others after the states
+    follows = np.zeros(n, dtype=bool)
+    if n > 1:
+        follows[:-1] = _rows_equal(next_states[:-1], states[1:])
+    num_states = int(new_state.sum())
+    next_state_index = np.where(
+        follows,
+        np.append(state_index[1:], 0),
+        num_states + np.cumsum(~follows) - 1
+    )
+
+    observations = np.concatenate((states[new_state], next_states[~follows]))
+    return observations, state_index.astype(np.int32), next_state_index.astype(np.int32)
+
+
+def encode_episode(columns, compression="zlib", level=None, metadata=None):
+    """
+    Encode an episode as a binary blob
+
+    The blob is a fixed preamble, a small JSON header describing every field,
+    and one compressed payload holding the fields' raw bytes back to back.
+    Observations are deduplicated and stored as uint8 when that is lossless.
+
+    Args:
+        columns: Dict of field name to array (see episode_columns)
+        compression: Payload compression ("zlib", "lzma" or "none")
+        level: Compression level (if None, the compressor's default)
+        metadata: Optional JSON-serializable dict stored in the header
+
+    Returns:
+        Encoded episode as bytes
+    """
+    if compression not in COMPRESSORS:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {sorted(COMPRESSORS)}")
+
+    states = np.asarray(columns["state"], dtype=np.float32)
+    next_states = np.asarray(columns["next_state"], dtype=np.float32)
+    observations, state_index, next_state_index = _deduplicate_observations(states, next_states)
+
+    # Screen pixels survive a round trip through uint8, normalized values do not
+    as_uint8 = observations.astype(np.uint8)
+    if np.array_equal(as_uint8, observations):
+        observations = as_uint8
+
+    fields = {
+        "observations": observations,
+        "state_index": state_index,
+        "next_state_index": next_state_index,
+        "action": np.asarray(columns["action"], dtype=np.int32),
+        "reward": np.asarray(columns["reward"], dtype=np.float32),
+        "done": np.asarray(columns["done"], dtype=np.uint8)
+    }
+
+    layout = []
+    offset = 0
+    for name, array in fields.items():
+        array = np.ascontiguousarray(array)
+        fields[name] = array
+        layout.append({
+            "name": name,
+            "dtype": array.dtype.newbyteorder("<").str,
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": array.nbytes
+        })
+        offset += array.nbytes
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "num_steps": len(state_index),
+        "state_shape": list(states.shape[1:]),
+        "compression": compression,
+        "fields": layout,
+        "metadata": metadata or {}
+    }).encode("utf-8")
+
+    payload = b"".join(array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes()
+                       for array in fields.values())
+    compress, _ = COMPRESSORS[compression]
+
+    return PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header + compress(payload, level)
+
+
+def decode_header(buffer):
+    """
+    Decode the header of an episode blob
+
+    Args:
+        buffer: Bytes-like object starting with an episode blob
+
+    Returns:
+        (header dict, offset of the payload in the buffer)
+    """
+    magic, version, header_length = PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary episode: bad magic bytes")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported episode format version {version}")
+
+    start = PREAMBLE.size
+    header = json.loads(bytes(buffer[start:start + header_length]).decode("utf-8"))
+    return header, start + header_length
+
+
+def decode_episode(buffer):
+    """
+    Decode an episode blob back into per-field arrays
+
+    Args:
+        buffer: Bytes-like object holding exactly one episode blob
+
+    Returns:
+        (columns, header) where columns maps field name to array as in episode_columns
+    """
+    header, payload_offset = decode_header(buffer)
+    _, decompress = COMPRESSORS[header["compression"]]
+    payload = decompress(bytes(buffer[payload_offset:]))
+
+    fields = {}
+    for field in header["fields"]:
+        array = np.frombuffer(payload, dtype=np.dtype(field["dtype"]),
+                              count=int(np.prod(field["shape"], dtype=np.int64)), offset=field["offset"])
+        fields[field["name"]] = array.reshape(field["shape"])
+
+    observations = fields["observations"].astype(np.float32)
+    columns = {
+        "state": observations[fields["state_index"]],
+        "action": fields["action"].astype(np.int64),
+        "reward": fields["reward"].copy(),
+        "next_state": observations[fields["next_state_index"]],
+        "done": fields["done"].astype(bool)
+    }
+
+    return columns, header
+
+
+def write_episode(path, columns, compression="zlib", level=None, metadata=None):
+    """
+    Write an episode to a binary file with a single write call
+
+    The file is written under a temporary name and renamed into place, so a
+    reader never sees a partially written episode.
+
+    Args:
+        path: File to write to
+        columns: Dict of field name to array (see episode_columns)
+        compression: Payload compression ("zlib", "lzma" or "none")
+        level: Compression level (if None, the compressor's default)
+        metadata: Optional JSON-serializable dict stored in the header
+
+    Returns:
+        Number of bytes written
+    """
+    blob = encode_episode(columns, compression, level, metadata)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(blob)
+    os.replace(temp_path, path)
+
+    return len(blob)
+
+
+def read_episode(path, offset=0, length=None):
+    """
+    Read an episode from a binary file
+
+    Args:
+        path: File to read from
+        offset: Byte offset of the episode blob in the file
+        length: Length of the blob in bytes (if None, read to the end of the file)
+
+    Returns:
+        (columns, header) as returned by decode_episode
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buffer = f.read() if length is None else f.read(length)
+
+    return decode_episode(buffer)
+
+
+def read_episode_header(path, offset=0):
+    """
+    Read the header of an episode in a binary file without decoding its payload
+
+    Args:
+        path: File to read from
+        offset: Byte offset of the episode blob in the file
+
+    Returns:
+        Header dict (see encode_episode)
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buffer = f.read(PREAMBLE.size)
+        if len(buffer) < PREAMBLE.size:
+            raise ValueError(f"Truncated episode header in {path}")
+        buffer += f.read(PREAMBLE.unpack(buffer)[2])
+
+    return decode_header(buffer)[0]
+
+
+def read_legacy_episode(path):
+    """
+    Read an episode saved as a JSON list of step dicts
+
+    Args:
+        path: JSON file to read from
+
+    Returns:
+        Dict of field name to array as in episode_columns
+    """
+    with open(path, 'r') as f:
+        return episode_columns(json.load(f))
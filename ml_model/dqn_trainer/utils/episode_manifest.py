@@ -0,0 +1,350 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# File name of the manifest database inside a data directory
+MANIFEST_FILENAME = "manifest.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT,
+    offset INTEGER NOT NULL DEFAULT 0,
+    length INTEGER,
+    num_steps INTEGER NOT NULL DEFAULT 0,
+    total_reward REAL NOT NULL DEFAULT 0,
+    action_counts TEXT NOT NULL DEFAULT '[]',
+    session_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS episodes_created_at ON episodes (created_at);
+CREATE INDEX IF NOT EXISTS episodes_total_reward ON episodes (total_reward);
+CREATE INDEX IF NOT EXISTS episodes_session_id ON episodes (session_id);
+CREATE INDEX IF NOT EXISTS episodes_path ON episodes (path);
+CREATE TABLE IF NOT EXISTS retired_files (
+    path TEXT PRIMARY KEY,
+    retired_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    episodes INTEGER NOT NULL,
+    total_steps INTEGER NOT NULL,
+    total_reward REAL NOT NULL,
+    action_counts TEXT NOT NULL
+);
+"""
+
+_COLUMNS = ("id", "path", "offset", "length", "num_steps", "total_reward",
+            "action_counts", "session_id", "created_at")
+
+
+def _timestamp(value):
+    """Convert a datetime or a POSIX timestamp to a POSIX timestamp"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class EpisodeManifest:
+    """
+    SQLite index of every saved episode
+
+    Each row records where an episode is stored (file path relative to the data
+    directory, byte offset and length) together with its step count, total
+    reward, action histogram and session id, so episodes can be selected with a
+    query instead of reading every file. Running totals over all stored
+    episodes are kept in a single row that is updated in the same transaction
+    as each episode, so they can be read without aggregating the table.
+
+    Episode ids are allocated by SQLite: reserve() inserts a pending row whose
+    id names the episode file, and commit() fills it in once the file is
+    written. Pending rows (length IS NULL) are ignored by queries, so a crash
+    between the two never exposes a missing file. The connection is shared
+    between threads behind a lock, and the database uses WAL journaling so
+    several processes can write to it.
+    """
+    def __init__(self, db_path):
+        """
+        Open (and create if needed) the manifest
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30.0,
+                                           isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+            with self._transaction():
+                self._initialize_totals()
+
+    def _initialize_totals(self):
+        """Create the totals row, aggregating existing episodes once (lock must be held)"""
+        if self._connection.execute("SELECT 1 FROM totals WHERE id = 0").fetchone() is not None:
+            return
+
+        totals = [0, 0, 0.0, []]
+        for row in self._connection.execute(
+            "SELECT num_steps, total_reward, action_counts FROM episodes WHERE length IS NOT NULL"
+        ):
+            totals = self._add_to_totals(totals, row["num_steps"], row["total_reward"],
+                                         json.loads(row["action_counts"]))
+
+        self._connection.execute(
+            "INSERT OR IGNORE INTO totals (id, episodes, total_steps, total_reward, action_counts) "
+            "VALUES (0, ?, ?, ?, ?)",
+            (totals[0], totals[1], totals[2], json.dumps(totals[3]))
+        )
+
+    @staticmethod
+    def _add_to_totals(totals, num_steps, total_reward, action_counts):
+        """Add an episode to [episodes, total_steps, total_reward, action_counts]"""
+        episodes, steps, reward, counts = totals
+        counts = list(counts) + [0] * (len(action_counts) - len(counts))
+        for action, count in enumerate(action_counts):
+            counts[action] += int(count)
+        return [episodes + 1, steps + int(num_steps), reward + float(total_reward), counts]
+
+    def _update_totals(self, num_steps, total_reward, action_counts):
+        """Add an episode to the totals row (lock must be held, inside a transaction)"""
+        row = self._connection.execute(
+            "SELECT episodes, total_steps, total_reward, action_counts FROM totals WHERE id = 0"
+        ).fetchone()
+        totals = self._add_to_totals(
+            [row["episodes"], row["total_steps"], row["total_reward"], json.loads(row["action_counts"])],
+            num_steps, total_reward, action_counts
+        )
+        self._connection.execute(
+            "UPDATE totals SET episodes = ?, total_steps = ?, total_reward = ?, action_counts = ? WHERE id = 0",
+            (totals[0], totals[1], totals[2], json.dumps(totals[3]))
+        )
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._connection.close()
+
+    def reserve(self):
+        """
+        Allocate the id of a new episode
+
+        Returns:
+            Episode id
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO episodes (created_at) VALUES (?)", (time.time(),)
+            )
+            return cursor.lastrowid
+
+    def commit(self, episode_id, path, length, num_steps, total_reward, action_counts,
+               session_id=None, offset=0):
+        """
+        Record where a reserved episode was stored
+
+        Args:
+            episode_id: Id returned by reserve()
+            path: Episode file, relative to the data directory
+            length: Size of the episode blob in bytes
+            num_steps: Number of steps in the episode
+            total_reward: Sum of the episode's rewards
+            action_counts: Number of times each action was taken, indexed by action
+            session_id: Id of the game session the episode came from
+            offset: Byte offset of the episode blob in the file
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "UPDATE episodes SET path = ?, offset = ?, length = ?, num_steps = ?, total_reward = ?, "
+                "action_counts = ?, session_id = ? WHERE id = ?",
+                (path, offset, length, num_steps, float(total_reward),
+                 json.dumps([int(count) for count in action_counts]), session_id, episode_id)
+            )
+            self._update_totals(num_steps, total_reward, action_counts)
+
+    def add(self, path, length, num_steps, total_reward, action_counts, session_id=None,
+            offset=0, created_at=None):
+        """
+        Record an episode that is already stored
+
+        Args:
+            path: Episode file, relative to the data directory
+            length: Size of the episode blob in bytes
+            num_steps: Number of steps in the episode
+            total_reward: Sum of the episode's rewards
+            action_counts: Number of times each action was taken, indexed by action
+            session_id: Id of the game session the episode came from
+            offset: Byte offset of the episode blob in the file
+            created_at: When the episode was recorded (if None, now)
+
+        Returns:
+            Episode id
+        """
+        with self._lock, self._transaction():
+            cursor = self._connection.execute(
+                "INSERT INTO episodes (path, offset, length, num_steps, total_reward, action_counts, "
+                "session_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, offset, length, num_steps, float(total_reward),
+                 json.dumps([int(count) for count in action_counts]), session_id,
+                 time.time() if created_at is None else _timestamp(created_at))
+            )
+            self._update_totals(num_steps, total_reward, action_counts)
+            return cursor.lastrowid
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one write transaction (lock must be held)"""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def totals(self):
+        """
+        Get running totals over all stored episodes
+
+        Returns:
+            Dictionary with episodes, total_steps, total_reward and action_counts (a list)
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT episodes, total_steps, total_reward, action_counts FROM totals WHERE id = 0"
+            ).fetchone()
+        return {
+            "episodes": row["episodes"],
+            "total_steps": row["total_steps"],
+            "total_reward": row["total_reward"],
+            "action_counts": json.loads(row["action_counts"])
+        }
+
+    def query(self, min_reward=None, max_reward=None, since=None, until=None, session_id=None,
+              min_steps=None, limit=None, path_prefix=None):
+        """
+        Find stored episodes matching all of the given filters, oldest first
+
+        Args:
+            min_reward: Minimum total reward
+            max_reward: Maximum total reward
+            since: Earliest recording time (datetime or POSIX timestamp)
+            until: Latest recording time (datetime or POSIX timestamp)
+            session_id: Game session id
+            min_steps: Minimum number of steps
+            limit: Maximum number of episodes to return
+            path_prefix: Only episodes stored in files whose path starts with this prefix
+
+        Returns:
+            List of dicts with one entry per manifest column; action_counts is a list
+        """
+        conditions = ["length IS NOT NULL"]
+        params = []
+
+        for condition, value in (
+            ("total_reward >= ?", min_reward),
+            ("total_reward <= ?", max_reward),
+            ("created_at >= ?", None if since is None else _timestamp(since)),
+            ("created_at <= ?", None if until is None else _timestamp(until)),
+            ("session_id = ?", session_id),
+            ("num_steps >= ?", min_steps),
+            ("substr(path, 1, length(?)) = ?", path_prefix)
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.extend([value] * condition.count("?"))
+
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM episodes WHERE {' AND '.join(conditions)} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+
+        episodes = []
+        for row in rows:
+            episode = dict(row)
+            episode["action_counts"] = json.loads(episode["action_counts"])
+            episodes.append(episode)
+        return episodes
+
+    def relocate(self, moves):
+        """
+        Point episodes at new storage locations in a single transaction
+
+        Files no longer referenced by any episode are recorded as retired in
+        the same transaction, so they can be deleted once readers that
+        resolved the old locations are done (see retired_files).
+
+        Args:
+            moves: Iterable of (episode_id, path, offset, length)
+        """
+        moves = list(moves)
+        with self._lock, self._transaction():
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO retired_files (path, retired_at) "
+                "SELECT path, ? FROM episodes WHERE id = ? AND path IS NOT NULL",
+                [(time.time(), episode_id) for episode_id, _, _, _ in moves]
+            )
+            self._connection.executemany(
+                "UPDATE episodes SET path = ?, offset = ?, length = ? WHERE id = ?",
+                [(path, offset, length, episode_id) for episode_id, path, offset, length in moves]
+            )
+            self._connection.execute(
+                "DELETE FROM retired_files WHERE path IN (SELECT path FROM episodes WHERE path IS NOT NULL)"
+            )
+
+    def retired_files(self, before=None):
+        """
+        Get the files retired by relocate
+
+        Args:
+            before: Only files retired at or before this POSIX timestamp (if None, all of them)
+
+        Returns:
+            List of paths relative to the data directory
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path FROM retired_files WHERE retired_at <= ? ORDER BY retired_at",
+                (float("inf") if before is None else _timestamp(before),)
+            ).fetchall()
+        return [row["path"] for row in rows]
+
+    def forget_retired(self, paths):
+        """
+        Remove deleted files from the retired files
+
+        Args:
+            paths: Paths relative to the data directory
+        """
+        with self._lock, self._transaction():
+            self._connection.executemany("DELETE FROM retired_files WHERE path = ?", [(path,) for path in paths])
+
+    def indexed_paths(self):
+        """
+        Get the set of files referenced by the manifest, including retired files not deleted yet
+
+        Returns:
+            Set of paths relative to the data directory
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT path FROM episodes WHERE path IS NOT NULL UNION SELECT path FROM retired_files"
+            ).fetchall()
+        return {row["path"] for row in rows}
+
+    def __len__(self):
+        """Return the number of stored episodes"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM episodes WHERE length IS NOT NULL"
+            ).fetchone()[0]
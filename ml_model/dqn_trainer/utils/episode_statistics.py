@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class EpisodeStatistics:
+    """
+    Running aggregates over a set of episodes
+
+    Keeps the episode count, step count, reward sum and a per-action counter
+    array, so statistics are updated once per episode and read without
+    walking the recorded steps.
+    """
+    def __init__(self, episodes=0, total_steps=0, total_reward=0.0, action_counts=None):
+        """
+        Initialize the statistics
+
+        Args:
+            episodes: Number of episodes already counted
+            total_steps: Number of steps already counted
+            total_reward: Sum of the rewards already counted
+            action_counts: Number of times each action was taken, indexed by action
+        """
+        self.episodes = int(episodes)
+        self.total_steps = int(total_steps)
+        self.total_reward = float(total_reward)
+        self.action_counts = np.asarray(action_counts if action_counts is not None else [], dtype=np.int64)
+
+    def add_episode(self, num_steps, total_reward, action_counts):
+        """
+        Count an episode
+
+        Args:
+            num_steps: Number of steps in the episode
+            total_reward: Sum of the episode's rewards
+            action_counts: Number of times each action was taken, indexed by action
+        """
+        self.episodes += 1
+        self.total_steps += int(num_steps)
+        self.total_reward += float(total_reward)
+
+        action_counts = np.asarray(action_counts, dtype=np.int64)
+        if len(action_counts) > len(self.action_counts):
+            self.action_counts = np.pad(self.action_counts, (0, len(action_counts) - len(self.action_counts)))
+        self.action_counts[:len(action_counts)] += action_counts
+
+    def reset(self):
+        """Forget every counted episode"""
+        self.episodes = 0
+        self.total_steps = 0
+        self.total_reward = 0.0
+        self.action_counts = np.zeros(0, dtype=np.int64)
+
+    def as_dict(self):
+        """
+        Get the statistics in the format returned by WebGameAPI.get_statistics
+
+        Returns:
+            Dictionary of statistics
+        """
+        if self.episodes == 0:
+            return {
+                "episodes": 0,
+                "total_steps": 0,
+                "avg_steps_per_episode": 0,
+                "avg_reward_per_episode": 0,
+                "action_distribution": {}
+            }
+
+        # Convert counts to percentages
+        action_distribution = {
+            str(action): int(count) / self.total_steps * 100
+            for action, count in enumerate(self.action_counts) if count
+        }
+
+        return {
+            "episodes": self.episodes,
+            "total_steps": self.total_steps,
+            "avg_steps_per_episode": self.total_steps / self.episodes,
+            "avg_reward_per_episode": self.total_reward / self.episodes,
+            "action_distribution": action_distribution
+        }
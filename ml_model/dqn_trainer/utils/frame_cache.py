@@ -0,0 +1,140 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FrameCache:
+    """
+    Bounded LRU cache of preprocessed frames keyed by a hash of the raw frame
+
+    Web captures repeat identical screenshots (pauses, menus, invulnerability
+    frames), so keying on the raw bytes lets each distinct frame be
+    preprocessed once. The cache is bounded by the total size of the cached
+    arrays and evicts the least recently used entries first. Cached arrays are
+    made read-only because the same array is handed out on every hit.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Maximum total size of the cached arrays in bytes
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """Return the number of cached frames"""
+        return len(self._entries)
+
+    @staticmethod
+    def key(frame):
+        """
+        Compute the cache key of a raw frame
+
+        Args:
+            frame: Raw frame as a NumPy array
+
+        Returns:
+            16-byte digest of the frame's shape, dtype and contents
+        """
+        frame = np.ascontiguousarray(frame)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{frame.shape}{frame.dtype.str}".encode())
+        digest.update(memoryview(frame).cast("B"))
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Look up a cached frame and mark it as recently used
+
+        Args:
+            key: Cache key from FrameCache.key
+
+        Returns:
+            Cached array, or None on a miss
+        """
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Cache a preprocessed frame, evicting least recently used frames if needed
+
+        Args:
+            key: Cache key from FrameCache.key
+            value: Preprocessed frame
+
+        Returns:
+            The cached (read-only) array
+        """
+        if value.nbytes > self.max_bytes:
+            return value
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old.nbytes
+
+        value.setflags(write=False)
+        self._entries[key] = value
+        self.current_bytes += value.nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+        return value
+
+    def get_or_compute(self, frame, compute):
+        """
+        Get the preprocessed version of a frame, computing it on a miss
+
+        Args:
+            frame: Raw frame as a NumPy array
+            compute: Function that preprocesses a raw frame
+
+        Returns:
+            Preprocessed (read-only) frame
+        """
+        key = self.key(frame)
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute(frame))
+        return value
+
+    def statistics(self):
+        """
+        Get cache statistics
+
+        Returns:
+            Dictionary with entry count, size, hit/miss/eviction counters and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        """Remove every cached frame, keeping the counters"""
+        self._entries.clear()
+        self.current_bytes = 0
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class FrameStack:
+    """
+    Stacks of the most recent frames kept in a preallocated ring
+
+    Every frame is written twice, at ring position head and head + num_frames,
+    so the num_frames most recent frames of a stack are always the contiguous
+    slice [head + 1, head + 1 + num_frames) of a ring twice as long. Pushing a
+    frame costs two frame copies instead of shifting the whole stack, and the
+    ordered stack is a view rather than a new array.
+
+    A FrameStack can hold a batch of independent stacks (one per environment).
+    Stacks that are pushed together share the same head, and the whole batch is
+    then a single view; pushing only some of them makes the heads diverge and
+    batch reads fall back to a gather.
+    """
+    def __init__(self, num_frames, frame_shape, num_stacks=None, dtype=np.float32):
+        """
+        Initialize the frame stack
+
+        Args:
+            num_frames: Number of frames in each stack
+            frame_shape: Shape of a single frame
+            num_stacks: Number of independent stacks (if None, a single unbatched stack)
+            dtype: Data type of the stored frames
+        """
+        self.num_frames = num_frames
+        self.frame_shape = tuple(frame_shape)
+        self.batched = num_stacks is not None
+        self.num_stacks = num_stacks if self.batched else 1
+
+        self._ring = np.zeros((self.num_stacks, 2 * num_frames, *self.frame_shape), dtype=dtype)
+
+        # Ring position of the newest frame of each stack
+        self.heads = np.full(self.num_stacks, num_frames - 1, dtype=np.int64)
+        self._aligned = True
+        self._offsets = np.arange(1, num_frames + 1)
+
+    def reset(self, indices=None):
+        """
+        Clear stacks back to all-zero frames
+
+        Args:
+            indices: Stacks to clear (if None, clear all of them)
+        """
+        if indices is None:
+            self._ring[:] = 0
+        else:
+            self._ring[indices] = 0
+
+    def push(self, frames, indices=None):
+        """
+        Add the newest frame to stacks, dropping their oldest frame
+
+        Args:
+            frames: New frame, or one frame per pushed stack when batched
+            indices: Stacks to push to (if None, push to all of them)
+
+        Returns:
+            Ordered stacks after the push (see stacks())
+        """
+        if indices is None:
+            head = (int(self.heads[0]) + 1) % self.num_frames if self._aligned else None
+
+            if head is not None:
+                self.heads[:] = head
+                self._ring[:, head] = frames
+                self._ring[:, head + self.num_frames] = frames
+                return self.stacks()
+
+            indices = np.arange(self.num_stacks)
+
+        indices = np.asarray(indices)
+        heads = (self.heads[indices] + 1) % self.num_frames
+        self.heads[indices] = heads
+        self._ring[indices, heads] = frames
+        self._ring[indices, heads + self.num_frames] = frames
+        self._aligned = bool((self.heads == self.heads[0]).all())
+
+        return self.stacks()
+
+    def stack(self, index=0):
+        """
+        Get one ordered stack as a view, oldest frame first
+
+        The view is only valid until the next push to that stack; copy it before
+        storing it (for example in a replay buffer).
+
+        Args:
+            index: Stack to get
+
+        Returns:
+            Array of shape (num_frames, *frame_shape)
+        """
+        start = int(self.heads[index]) + 1
+        return self._ring[index, start:start + self.num_frames]
+
+    def stacks(self, indices=None):
+        """
+        Get ordered stacks, oldest frame first
+
+        Unbatched stacks and batches whose stacks share a head are returned as
+        views that are only valid until the next push; other batches are
+        gathered into a new array.
+
+        Args:
+            indices: Stacks to get when batched (if None, all of them)
+
+        Returns:
+            Array of shape (num_frames, *frame_shape), or (n, num_frames, *frame_shape) when batched
+        """
+        if not self.batched:
+            return self.stack(0)
+
+        if self._aligned:
+            start = int(self.heads[0]) + 1
+            if indices is None:
+                return self._ring[:, start:start + self.num_frames]
+            return self._ring[indices, start:start + self.num_frames]
+
+        if indices is None:
+            indices = np.arange(self.num_stacks)
+        indices = np.asarray(indices)
+        positions = self.heads[indices, np.newaxis] + self._offsets
+        return self._ring[indices[:, np.newaxis], positions]
@@ -0,0 +1,208 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class InferenceBatcher:
+    """
+    Group concurrent inference requests into batches
+
+    Requests are queued from any thread. A worker thread takes the first
+    waiting request, keeps collecting until max_batch_size requests are
+    waiting or max_wait_ms has passed since the first one, runs one forward
+    pass for the whole batch and resolves each request's future with its own
+    result. Requests whose states have different shapes are batched
+    separately.
+
+    A request can name its own predict function, so several models with the
+    same architecture can share one batcher; each batch then runs one forward
+    pass per model.
+
+    The batcher counts requests and batches and keeps a window of recent batch
+    sizes and queue delays for metrics().
+
+    Closing with drain=True runs every request queued before the close, so a
+    batcher can be replaced without failing requests in flight.
+    """
+    def __init__(self, predict_fn=None, max_batch_size=32, max_wait_ms=2.0, metrics_window=1024):
+        """
+        Initialize the batcher and start its worker thread
+
+        Args:
+            predict_fn: Function mapping a stacked batch of states (NumPy array) to one result per state
+                (if None, every request gives its own)
+            max_batch_size: Maximum number of requests per batch
+            max_wait_ms: Maximum time to wait for more requests after the first one of a batch
+            metrics_window: Number of recent batches and requests the metrics are computed over
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._drain = False
+
+        # Makes the closed check and the enqueue of submit atomic with close
+        self._submit_lock = threading.Lock()
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._queue_delays = deque(maxlen=metrics_window)
+
+        self._worker = threading.Thread(target=self._run, name="InferenceBatcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, state, predict_fn=None):
+        """
+        Queue a state for inference
+
+        Args:
+            state: State as a NumPy array (or anything np.asarray accepts)
+            predict_fn: Function to run the state through (if None, the batcher's predict_fn)
+
+        Returns:
+            Future resolved with the result for this state
+        """
+        state = np.asarray(state, dtype=np.float32)
+        future = Future()
+        with self._submit_lock:
+            if self._closed.is_set():
+                raise RuntimeError("InferenceBatcher is closed")
+            self._queue.put((state, future, time.perf_counter(), predict_fn or self.predict_fn))
+        return future
+
+    def predict(self, state, timeout=None, predict_fn=None):
+        """
+        Run inference on a state, batched with concurrent requests
+
+        Args:
+            state: State as a NumPy array (or anything np.asarray accepts)
+            timeout: Maximum time to wait for the result in seconds (if None, no limit)
+            predict_fn: Function to run the state through (if None, the batcher's predict_fn)
+
+        Returns:
+            Result for this state
+        """
+        return self.submit(state, predict_fn).result(timeout)
+
+    def _collect(self):
+        """Wait for a request and collect a batch around it"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        """Form and run batches until closed (runs in a thread)"""
+        while not self._closed.is_set():
+            batch = self._collect()
+            if batch:
+                self._run_batch(batch)
+
+        # Run requests queued before a draining close
+        while self._drain and not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._run_batch(batch)
+
+        # Fail requests still queued after close
+        while True:
+            try:
+                _, future, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError("InferenceBatcher is closed"))
+
+    def _run_batch(self, batch):
+        """Run one forward pass per predict function and state shape and resolve the futures"""
+        started = time.perf_counter()
+
+        groups = {}
+        for request in batch:
+            groups.setdefault((request[3], request[0].shape), []).append(request)
+
+        for (predict_fn, _), requests in groups.items():
+            try:
+                results = predict_fn(np.stack([state for state, _, _, _ in requests]))
+                for (_, future, _, _), result in zip(requests, results):
+                    future.set_result(result)
+            except Exception as e:
+                with self._metrics_lock:
+                    self.errors += len(requests)
+                for _, future, _, _ in requests:
+                    future.set_exception(e)
+
+        with self._metrics_lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self._batch_sizes.append(len(batch))
+            self._queue_delays.extend(started - enqueued for _, _, enqueued, _ in batch)
+
+    def queue_depth(self):
+        """
+        Get the number of requests waiting for a batch
+
+        Returns:
+            Number of queued requests
+        """
+        return self._queue.qsize()
+
+    def metrics(self):
+        """
+        Get batching metrics
+
+        Returns:
+            Dictionary with request, batch and error counts, and the mean batch
+            size and queue delay percentiles over the recent window
+        """
+        with self._metrics_lock:
+            batch_sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+            queue_delays = np.asarray(self._queue_delays, dtype=np.float64) * 1000.0
+            metrics = {
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms
+            }
+
+        metrics["mean_batch_size"] = float(batch_sizes.mean()) if len(batch_sizes) else 0.0
+        for percentile in (50, 90, 99):
+            metrics[f"queue_delay_p{percentile}_ms"] = (
+                float(np.percentile(queue_delays, percentile)) if len(queue_delays) else 0.0
+            )
+
+        return metrics
+
+    def close(self, drain=False):
+        """
+        Stop the worker thread
+
+        Args:
+            drain: Run the requests already queued before stopping (if False, fail them)
+        """
+        with self._submit_lock:
+            self._drain = drain
+            self._closed.set()
+        self._worker.join()
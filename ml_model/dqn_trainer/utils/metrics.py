@@ -0,0 +1,301 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+
+# Content type of the Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value):
+    """Format a sample value for the text format"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    """Format a label set for the text format"""
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    """Base of the metric types: one value per label set, guarded by a lock"""
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """Label values in the order of labelnames"""
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """Remove every label set"""
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        """Get the metric as a JSON-serializable dictionary"""
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {"type": self.type_name, "help": self.help, "labelnames": list(self.labelnames), "samples": samples}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type_name = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        """
+        Increase the counter
+
+        Args:
+            amount: Amount to add
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), merge="sum"):
+        """
+        Initialize the gauge
+
+        Args:
+            name: Metric name
+            help_text: Description
+            labelnames: Names of the labels
+            merge: How values of several processes are combined ("sum" or "max")
+        """
+        super().__init__(name, help_text, labelnames)
+        self.merge = merge
+
+    def set(self, value, **labels):
+        """
+        Set the gauge
+
+        Args:
+            value: New value
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def snapshot(self):
+        """Get the metric as a JSON-serializable dictionary"""
+        snapshot = super().snapshot()
+        snapshot["merge"] = self.merge
+        return snapshot
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize the histogram
+
+        Args:
+            name: Metric name
+            help_text: Description
+            labelnames: Names of the labels
+            buckets: Sorted upper bounds of the buckets (+Inf is added)
+        """
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def observe(self, value, **labels):
+        """
+        Record a value
+
+        Args:
+            value: Observed value
+            **labels: Label values
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket counts (the last one is +Inf) followed by the sum
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def snapshot(self):
+        """Get the metric as a JSON-serializable dictionary"""
+        with self._lock:
+            samples = [[list(key), list(values)] for key, values in self._values.items()]
+        return {"type": self.type_name, "help": self.help, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "samples": samples}
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered in the Prometheus text format
+
+    Updating a metric takes one lock and a dict update, so instrumenting
+    request handlers costs microseconds. Collectors registered with
+    add_collector run before each render to set gauges read from other
+    objects.
+
+    Several processes (such as forked serving workers) can share their
+    metrics through a directory: each one exports periodic snapshots with
+    start_export, and render(directory) adds the snapshots of the others to
+    its own values.
+    """
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._metrics = {}
+        self._collectors = []
+
+        self._export_name = None
+        self._export_thread = None
+
+    def _register(self, metric):
+        """Add a metric to the registry"""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        """Create and register a Counter"""
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), merge="sum"):
+        """Create and register a Gauge"""
+        return self._register(Gauge(name, help_text, labelnames, merge))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Create and register a Histogram"""
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        Run a function before every render and export
+
+        Args:
+            collector: Function without arguments, typically setting gauges
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        """
+        Run the collectors and get every metric as a JSON-serializable dictionary
+
+        Returns:
+            Dictionary of metric name to metric snapshot
+        """
+        for collector in self._collectors:
+            collector()
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def start_export(self, directory, name, interval=1.0):
+        """
+        Write a snapshot to a directory periodically, for render in other processes
+
+        Args:
+            directory: Directory shared by the processes
+            name: Name of this process's snapshot file
+            interval: Seconds between snapshots
+        """
+        self._export_name = f"{name}.json"
+        path = os.path.join(directory, self._export_name)
+
+        def run():
+            while True:
+                temp_path = path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(temp_path, path)
+                time.sleep(interval)
+
+        self._export_thread = threading.Thread(target=run, name="MetricsExport", daemon=True)
+        self._export_thread.start()
+
+    @staticmethod
+    def _merge(snapshots):
+        """Combine snapshots of several processes"""
+        merged = {}
+        for snapshot in snapshots:
+            for name, metric in snapshot.items():
+                if name not in merged:
+                    merged[name] = dict(metric, samples={})
+                samples = merged[name]["samples"]
+
+                for key, value in metric["samples"]:
+                    key = tuple(key)
+                    if key not in samples:
+                        samples[key] = value
+                    elif metric["type"] == "histogram":
+                        samples[key] = [a + b for a, b in zip(samples[key], value)]
+                    elif metric.get("merge") == "max":
+                        samples[key] = max(samples[key], value)
+                    else:
+                        samples[key] = samples[key] + value
+        return merged
+
+    def render(self, directory=None):
+        """
+        Render the metrics in the Prometheus text format
+
+        Args:
+            directory: Directory with the snapshots of other processes to include (if None, only this process)
+
+        Returns:
+            Text of the metrics
+        """
+        snapshots = [self.snapshot()]
+        if directory is not None:
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith(".json") and file_name != self._export_name:
+                    try:
+                        with open(os.path.join(directory, file_name), 'r') as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+
+        lines = []
+        for name, metric in self._merge(snapshots).items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric["labelnames"]
+
+            for key, value in sorted(metric["samples"].items()):
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                    continue
+
+                cumulative = 0.0
+                for bound, count in zip(metric["buckets"] + [math.inf], value[:-1]):
+                    cumulative += count
+                    labels = _format_labels(labelnames + ["le"], key + (_format_value(bound),))
+                    lines.append(f"{name}_bucket{labels} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, key)} {_format_value(cumulative)}")
+
+        return "\n".join(lines) + "\n"
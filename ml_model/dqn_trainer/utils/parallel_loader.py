@@ -0,0 +1,256 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .episode_format import EPISODE_EXTENSION, read_episode, read_episode_header, read_legacy_episode
+
+
+def read_episode_file(path, offset=0, length=None):
+    """
+    Read an episode file in either the binary or the legacy JSON format
+
+    Args:
+        path: Episode file
+        offset: Byte offset of the episode blob in a binary file
+        length: Length of the blob in bytes (if None, read to the end of the file)
+
+    Returns:
+        Dict of field name to array
+    """
+    if path.endswith(".json"):
+        return read_legacy_episode(path)
+    columns, _ = read_episode(path, offset, length)
+    return columns
+
+
+def read_episode_state_shape(path, offset=0, length=None):
+    """
+    Get the shape of one state of an episode, reading only the header of binary files
+
+    Args:
+        path: Episode file
+        offset: Byte offset of the episode blob in a binary file
+        length: Length of the blob in bytes (unused, accepted for (path, offset, length) sources)
+
+    Returns:
+        Tuple of the state dimensions
+    """
+    if path.endswith(".json"):
+        return read_legacy_episode(path)["state"].shape[1:]
+    return tuple(read_episode_header(path, offset)["state_shape"])
+
+
+def _read_source(source):
+    """
+    Read an episode, naming it in decoding errors
+
+    Args:
+        source: (path, offset, length) of the episode
+
+    Returns:
+        Dict of field name to array
+    """
+    try:
+        return read_episode_file(*source)
+    except Exception as e:
+        path, offset, _ = source
+        location = f"{path} at offset {offset}" if offset else path
+        raise ValueError(f"Could not decode episode {location}: {type(e).__name__}: {e}") from e
+
+
+def _as_source(source):
+    """Normalize a path or a (path, offset, length) tuple to a tuple"""
+    if isinstance(source, (tuple, list)):
+        return tuple(source)
+    return (source, 0, None)
+
+
+def select_episode_files(directory, max_files=None, max_bytes=None):
+    """
+    List episode files in a directory, oldest first, within a file-count and byte budget
+
+    Args:
+        directory: Directory to list
+        max_files: Maximum number of files to select (if None, no limit)
+        max_bytes: Maximum total size of the selected files (if None, no limit)
+
+    Returns:
+        List of file paths
+    """
+    entries = [
+        entry for entry in os.scandir(directory)
+        if entry.name.startswith("episode_")
+        and (entry.name.endswith(EPISODE_EXTENSION) or entry.name.endswith(".json"))
+    ]
+    entries.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+
+    paths = []
+    total_bytes = 0
+    for entry in entries:
+        if max_files is not None and len(paths) >= max_files:
+            break
+
+        size = entry.stat().st_size
+        if max_bytes is not None and total_bytes + size > max_bytes:
+            break
+
+        paths.append(entry.path)
+        total_bytes += size
+
+    return paths
+
+
+def _decode_to_shared_memory(source):
+    """
+    Decode an episode into a shared memory block (runs in a worker process)
+
+    Args:
+        source: (path, offset, length) of the episode
+
+    Returns:
+        (name of the shared memory block, list of (field, dtype, shape, offset))
+    """
+    columns = _read_source(source)
+
+    layout = []
+    offset = 0
+    for name, array in columns.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for (name, dtype, shape, start), array in zip(layout, columns.values()):
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)[...] = array
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+    # The parent process takes ownership of the block and unlinks it once copied
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm_name = shm.name
+    shm.close()
+
+    return shm_name, layout
+
+
+def _decode_chunk_to_shared_memory(sources):
+    """
+    Decode several episodes into shared memory blocks (runs in a worker process)
+
+    If one episode fails, the blocks of the others in the chunk are released
+    before the error is raised.
+
+    Args:
+        sources: List of (path, offset, length) of the episodes
+
+    Returns:
+        List of (name of the shared memory block, layout), one per source
+    """
+    blocks = []
+    try:
+        for source in sources:
+            blocks.append(_decode_to_shared_memory(source))
+    except BaseException:
+        _release_shared_memory(blocks)
+        raise
+    return blocks
+
+
+def _release_shared_memory(blocks):
+    """
+    Unlink shared memory blocks without reading them
+
+    Args:
+        blocks: List of (name of the shared memory block, layout)
+    """
+    for shm_name, _ in blocks:
+        try:
+            shm = SharedMemory(name=shm_name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def _copy_from_shared_memory(shm_name, layout):
+    """
+    Copy an episode out of a shared memory block and release the block
+
+    Args:
+        shm_name: Name of the shared memory block
+        layout: List of (field, dtype, shape, offset)
+
+    Returns:
+        Dict of field name to array
+    """
+    shm = SharedMemory(name=shm_name)
+    try:
+        return {
+            name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset).copy()
+            for name, dtype, shape, offset in layout
+        }
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def load_episode_files(sources, num_workers=None, progress=None):
+    """
+    Load episodes, decoding them in parallel worker processes
+
+    Workers decode files into shared memory blocks and only send back the
+    block name and array layout, so the decoded arrays are never pickled.
+    If an episode cannot be decoded, the blocks of every other episode are
+    unlinked before the error is raised.
+
+    Args:
+        sources: Episode file paths, or (path, offset, length) tuples for episodes stored inside larger files
+        num_workers: Number of worker processes (if None, one per CPU; 1 loads in this process)
+        progress: Optional callback called as progress(episodes_loaded, total_episodes)
+
+    Returns:
+        List of episodes (dicts of field name to array) in the order of sources
+    """
+    sources = [_as_source(source) for source in sources]
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(sources))
+
+    episodes = []
+
+    if num_workers <= 1:
+        for source in sources:
+            episodes.append(_read_source(source))
+            if progress is not None:
+                progress(len(episodes), len(sources))
+        return episodes
+
+    chunksize = max(1, len(sources) // (num_workers * 16))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(_decode_chunk_to_shared_memory, sources[start:start + chunksize])
+            for start in range(0, len(sources), chunksize)
+        ]
+        try:
+            for future in futures:
+                for shm_name, layout in future.result():
+                    episodes.append(_copy_from_shared_memory(shm_name, layout))
+                    if progress is not None:
+                        progress(len(episodes), len(sources))
+        except BaseException:
+            # The workers gave up ownership of their blocks, so release every block not copied yet
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    _release_shared_memory(future.result())
+            raise
+
+    return episodes
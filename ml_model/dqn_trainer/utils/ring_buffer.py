@@ -0,0 +1,123 @@
+import numpy as np
+
+from .columnar_buffer import allocate_columns
+
+
+class RingBuffer:
+    """
+    Fixed-capacity table stored as one preallocated NumPy array per field
+
+    Once the buffer is full, each new row overwrites the oldest one, so
+    eviction is O(1) and no memory is allocated after the first append.
+    Columns are allocated on the first append using the shape and dtype of
+    the first values (or the dtypes given up front).
+    """
+    def __init__(self, capacity, dtypes=None):
+        """
+        Initialize the buffer
+
+        Args:
+            capacity: Maximum number of rows to keep
+            dtypes: Optional dict of field name to dtype; fields that are missing or
+                map to None keep the dtype of the first appended values
+        """
+        self.capacity = capacity
+        self.dtypes = dict(dtypes or {})
+        self.columns = {}
+        self.size = 0
+
+        # Index the next row is written to; when full, also the index of the oldest row
+        self.next_index = 0
+
+    def __len__(self):
+        """Return the number of rows"""
+        return self.size
+
+    def _allocate(self, sample_rows):
+        """
+        Allocate empty columns shaped like the given rows
+
+        Args:
+            sample_rows: Dict of field name to an array of rows
+        """
+        self.columns = allocate_columns(sample_rows, self.capacity, self.dtypes)
+
+    def append(self, **values):
+        """
+        Append a single row, evicting the oldest row if the buffer is full
+
+        Args:
+            **values: Value of every field for the new row
+        """
+        if not self.columns:
+            self._allocate({name: np.asarray(value)[np.newaxis] for name, value in values.items()})
+        elif values.keys() != self.columns.keys():
+            raise ValueError(f"Expected fields {sorted(self.columns)}, got {sorted(values)}")
+
+        for name, value in values.items():
+            self.columns[name][self.next_index] = value
+
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, **rows):
+        """
+        Append several rows at once, evicting the oldest rows as needed
+
+        Args:
+            **rows: Array of rows for every field, all with the same length
+        """
+        rows = {name: np.asarray(value) for name, value in rows.items()}
+        count = len(next(iter(rows.values())))
+
+        # Only the last capacity rows can survive
+        if count > self.capacity:
+            rows = {name: value[-self.capacity:] for name, value in rows.items()}
+            count = self.capacity
+
+        if not self.columns:
+            self._allocate(rows)
+        elif rows.keys() != self.columns.keys():
+            raise ValueError(f"Expected fields {sorted(self.columns)}, got {sorted(rows)}")
+
+        # Write up to the end of the ring, then wrap around to the start
+        first = min(count, self.capacity - self.next_index)
+        for name, value in rows.items():
+            column = self.columns[name]
+            column[self.next_index:self.next_index + first] = value[:first]
+            column[:count - first] = value[first:]
+
+        self.next_index = (self.next_index + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def column(self, name):
+        """
+        Get the rows of one field in insertion order, oldest first
+
+        This is a view until the buffer wraps around, and a single concatenation
+        of the two halves of the ring after that.
+
+        Args:
+            name: Field name
+
+        Returns:
+            Array of rows
+        """
+        column = self.columns[name]
+        if self.size < self.capacity or self.next_index == 0:
+            return column[:self.size]
+        return np.concatenate((column[self.next_index:], column[:self.next_index]))
+
+    def as_dict(self):
+        """
+        Get the rows of every field in insertion order, oldest first
+
+        Returns:
+            Dict of field name to array of rows
+        """
+        return {name: self.column(name) for name in self.columns}
+
+    def clear(self):
+        """Remove all rows, keeping the allocated columns"""
+        self.size = 0
+        self.next_index = 0
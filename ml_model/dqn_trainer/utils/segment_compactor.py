@@ -0,0 +1,267 @@
+import fcntl
+import logging
+import os
+import struct
+import time
+
+from .episode_format import EPISODE_EXTENSION, decode_episode, decode_header, encode_episode, read_legacy_episode
+
+# Segment files are named segment_<number>.bin, with an offset index next to them
+SEGMENT_PREFIX = "segment_"
+SEGMENT_INDEX_EXTENSION = ".idx"
+
+# Index record: byte offset and length of one episode blob in the segment
+SEGMENT_INDEX_RECORD = struct.Struct("<QQ")
+
+# File in the data directory locked for the whole of a compaction
+COMPACTION_LOCK_FILENAME = "compaction.lock"
+
+
+def read_segment_index(path):
+    """
+    Read the offset index of a segment file
+
+    Args:
+        path: Segment file
+
+    Returns:
+        List of (offset, length) of the episode blobs in the segment
+    """
+    index_path = os.path.splitext(path)[0] + SEGMENT_INDEX_EXTENSION
+    if not os.path.exists(index_path):
+        return []
+
+    with open(index_path, 'rb') as f:
+        data = f.read()
+
+    count = len(data) // SEGMENT_INDEX_RECORD.size
+    return [SEGMENT_INDEX_RECORD.unpack_from(data, i * SEGMENT_INDEX_RECORD.size) for i in range(count)]
+
+
+def list_segments(directory):
+    """
+    List the segment files of a data directory, oldest first
+
+    Args:
+        directory: Data directory
+
+    Returns:
+        List of segment file paths
+    """
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(EPISODE_EXTENSION)
+    )
+
+
+class SegmentCompactor:
+    """
+    Merge single-episode files into large append-only segment files
+
+    Episode blobs are appended back to back to the newest segment until it
+    reaches segment_bytes, and can optionally be recompressed on the way.
+    Each batch of episodes is made durable in the segment and its index,
+    then moved in the manifest with one transaction, so every episode is
+    readable at every point. Segments are only ever appended to, and only
+    episodes committed to the manifest are touched, so compaction can run
+    while new episodes are being recorded.
+
+    The source files are not deleted at once: loaders and streaming datasets
+    (in this or another process) may have resolved their paths before the
+    move. The manifest records them as retired, and they are deleted
+    delete_delay seconds later, at the start or end of a later compaction.
+
+    Each segment has a sidecar index of (offset, length) records, so the
+    manifest can be rebuilt without it.
+
+    Only one compaction of a data directory runs at a time, across processes:
+    compact() holds an exclusive flock on the directory's compaction.lock file
+    while it runs. The compactor only needs the manifest, so it can run in a
+    separate process from the server recording to the directory.
+    """
+    def __init__(self, data_dir, manifest, segment_bytes=256 * 1024 * 1024, compression=None, level=None,
+                 batch_size=1000, delete_delay=300.0):
+        """
+        Initialize the compactor
+
+        Args:
+            data_dir: Data directory holding the episode files and the manifest
+            manifest: EpisodeManifest of the data directory
+            segment_bytes: Size at which a segment is closed and a new one started
+            compression: Recompress episodes with this compression (if None, keep each episode's compression)
+            level: Compression level used when recompressing
+            batch_size: Number of episodes moved per manifest transaction
+            delete_delay: Seconds moved source files are kept for readers that resolved them before the move
+        """
+        self.data_dir = data_dir
+        self.manifest = manifest
+        self.segment_bytes = segment_bytes
+        self.compression = compression
+        self.level = level
+        self.batch_size = batch_size
+        self.delete_delay = delete_delay
+
+        self.logger = logging.getLogger("SegmentCompactor")
+
+    def _open_segment(self):
+        """
+        Open the segment to append to, starting a new one if the newest is full
+
+        Returns:
+            (file name relative to the data directory, file object opened for appending)
+        """
+        segments = list_segments(self.data_dir)
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            path = segments[-1]
+        else:
+            number = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX):-len(EPISODE_EXTENSION)]) + 1 if segments else 0
+            path = os.path.join(self.data_dir, f"{SEGMENT_PREFIX}{number:06d}{EPISODE_EXTENSION}")
+
+        return os.path.basename(path), open(path, 'ab')
+
+    def _episode_blob(self, episode):
+        """
+        Read an episode's blob, converting or recompressing it if needed
+
+        Args:
+            episode: Manifest entry
+
+        Returns:
+            Episode blob as bytes
+        """
+        path = os.path.join(self.data_dir, episode["path"])
+
+        # Episodes saved as JSON by earlier versions are converted to the binary format
+        if path.endswith(".json"):
+            return encode_episode(read_legacy_episode(path), self.compression or "zlib", self.level)
+
+        with open(path, 'rb') as f:
+            f.seek(episode["offset"])
+            blob = f.read(episode["length"])
+
+        if self.compression is not None and decode_header(blob)[0]["compression"] != self.compression:
+            columns, header = decode_episode(blob)
+            blob = encode_episode(columns, self.compression, self.level, header["metadata"])
+
+        return blob
+
+    def _compact_batch(self, episodes):
+        """
+        Move a batch of episodes into segments
+
+        Args:
+            episodes: Manifest entries of single-episode files
+
+        Returns:
+            (bytes read, bytes written)
+        """
+        moves = []
+        index_records = {}
+        bytes_read = 0
+        bytes_written = 0
+
+        segment_name, segment = self._open_segment()
+        try:
+            for episode in episodes:
+                blob = self._episode_blob(episode)
+
+                offset = segment.tell()
+                if offset > 0 and offset + len(blob) > self.segment_bytes:
+                    # Close the full segment and continue in a new one
+                    segment.flush()
+                    os.fsync(segment.fileno())
+                    segment.close()
+                    segment_name, segment = self._open_segment()
+                    offset = segment.tell()
+
+                segment.write(blob)
+                moves.append((episode["id"], segment_name, offset, len(blob)))
+                index_records.setdefault(segment_name, []).append(SEGMENT_INDEX_RECORD.pack(offset, len(blob)))
+                bytes_read += os.path.getsize(os.path.join(self.data_dir, episode["path"]))
+                bytes_written += len(blob)
+
+            # Make the segment durable before the manifest points at it
+            segment.flush()
+            os.fsync(segment.fileno())
+        finally:
+            segment.close()
+
+        # The index too, so a manifest pointing into a segment can always be rebuilt from it
+        for name, records in index_records.items():
+            with open(os.path.join(self.data_dir, os.path.splitext(name)[0] + SEGMENT_INDEX_EXTENSION), 'ab') as f:
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Retires the source files; they are deleted by remove_retired after delete_delay
+        self.manifest.relocate(moves)
+
+        return bytes_read, bytes_written
+
+    def remove_retired(self):
+        """
+        Delete source files moved into segments more than delete_delay seconds ago
+
+        Returns:
+            Number of files deleted
+        """
+        paths = self.manifest.retired_files(before=time.time() - self.delete_delay)
+        for path in paths:
+            try:
+                os.remove(os.path.join(self.data_dir, path))
+            except FileNotFoundError:
+                pass
+
+        self.manifest.forget_retired(paths)
+        return len(paths)
+
+    def compact(self, max_episodes=None):
+        """
+        Move single-episode files into segments
+
+        Args:
+            max_episodes: Maximum number of episodes to move (if None, all of them)
+
+        Returns:
+            Dictionary with the number of episodes moved, the bytes read and written
+            and the number of retired source files deleted, or None if another
+            compaction of the data directory is running
+        """
+        with open(os.path.join(self.data_dir, COMPACTION_LOCK_FILENAME), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.logger.warning(f"Compaction of {self.data_dir} is already running")
+                return None
+
+            # Closing the file releases the lock
+            return self._compact(max_episodes)
+
+    def _compact(self, max_episodes):
+        """Move single-episode files into segments (the compaction lock must be held)"""
+        moved = 0
+        bytes_read = 0
+        bytes_written = 0
+        removed = self.remove_retired()
+
+        while max_episodes is None or moved < max_episodes:
+            limit = self.batch_size if max_episodes is None else min(self.batch_size, max_episodes - moved)
+            episodes = self.manifest.query(limit=limit, path_prefix="episode_")
+            if not episodes:
+                break
+
+            batch_read, batch_written = self._compact_batch(episodes)
+            moved += len(episodes)
+            bytes_read += batch_read
+            bytes_written += batch_written
+
+            self.logger.info(f"Compacted {moved} episodes ({bytes_read} bytes in files, {bytes_written} bytes in segments)")
+
+        removed += self.remove_retired()
+
+        return {
+            "episodes": moved,
+            "bytes_read": bytes_read,
+            "bytes_written": bytes_written,
+            "files_removed": removed
+        }
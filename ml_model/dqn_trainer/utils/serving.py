@@ -0,0 +1,310 @@
+import itertools
+import multiprocessing
+import signal
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+# Registers the reductions that send tensors between processes as shared memory handles
+import torch.multiprocessing  # noqa: F401
+
+# Worker processes are forked so they share the parent's loaded model
+_FORK = multiprocessing.get_context("fork")
+
+
+def create_listening_socket(host, port, backlog=128):
+    """
+    Create a listening TCP socket that forked workers can accept on
+
+    Args:
+        host: Host to bind to
+        port: Port to bind to
+        backlog: Maximum number of pending connections
+
+    Returns:
+        Bound, listening, inheritable socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def start_workers(num_workers, run_worker):
+    """
+    Fork worker processes
+
+    Everything loaded before the call (such as model weights) is shared with
+    the workers copy-on-write.
+
+    Args:
+        num_workers: Number of workers
+        run_worker: Function called as run_worker(index) in each worker
+
+    Returns:
+        List of started processes
+    """
+    workers = [
+        _FORK.Process(target=run_worker, args=(index,), name=f"ServingWorker-{index}")
+        for index in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def wait_for_workers(workers):
+    """
+    Wait until every worker exits, stopping all of them on SIGINT or SIGTERM
+
+    Args:
+        workers: Processes from start_workers
+    """
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+
+class MessageQueue:
+    """
+    Messages any worker can send to the parent process
+
+    Every message is delivered once, in order, to the listener in the
+    parent. Create the queue before forking.
+    """
+    def __init__(self):
+        """Initialize the queue"""
+        self._queue = _FORK.Queue()
+
+    def publish(self, message):
+        """
+        Send a message to the parent
+
+        Args:
+            message: Picklable object
+        """
+        self._queue.put(message)
+
+    def listen(self, callback):
+        """
+        Call a function with every message (call in the parent)
+
+        Args:
+            callback: Function called as callback(message) in a background thread
+
+        Returns:
+            The listening thread
+        """
+        def run():
+            while True:
+                callback(self._queue.get())
+
+        thread = threading.Thread(target=run, name="MessageQueueListener", daemon=True)
+        thread.start()
+        return thread
+
+
+class TensorChannel:
+    """
+    Messages from the parent to every worker, with tensors passed by handle
+
+    Tensors in a message are moved to shared memory (if they are not there
+    yet) and sent as handles, so every worker maps the sender's copy instead
+    of receiving its own. Create the channel before forking.
+    """
+    def __init__(self, num_workers):
+        """
+        Initialize the channel
+
+        Args:
+            num_workers: Number of worker processes
+        """
+        self._queues = [_FORK.Queue() for _ in range(num_workers)]
+
+    def publish(self, message):
+        """
+        Send a message to every worker
+
+        Args:
+            message: Picklable object, typically holding tensors
+        """
+        for worker_queue in self._queues:
+            worker_queue.put(message)
+
+    def listen(self, worker_index, callback):
+        """
+        Call a function with every message sent to a worker (call in the worker)
+
+        Args:
+            worker_index: Index of the worker
+            callback: Function called as callback(message) in a background thread
+
+        Returns:
+            The listening thread
+        """
+        def run():
+            while True:
+                callback(self._queues[worker_index].get())
+
+        thread = threading.Thread(target=run, name="TensorChannelListener", daemon=True)
+        thread.start()
+        return thread
+
+
+class APIServer:
+    """
+    Run method calls made by worker processes on an object in this process
+
+    Workers send (worker, call id, method, args) on a shared queue; calls are
+    run on a thread pool and each result is sent back on the calling worker's
+    own queue. This keeps state that must live in one process (such as the
+    open episodes of every game session) in the parent while requests are
+    served by forked workers. Create the server before forking and call
+    client(index) in each worker.
+    """
+    def __init__(self, methods, num_workers, num_threads=8):
+        """
+        Initialize the server
+
+        Args:
+            methods: Names of the methods workers may call
+            num_workers: Number of worker processes
+            num_threads: Number of threads running calls concurrently
+        """
+        self.methods = tuple(methods)
+        self.num_threads = num_threads
+        self.requests = _FORK.Queue()
+        self.responses = [_FORK.Queue() for _ in range(num_workers)]
+
+        self._target = None
+        self._executor = None
+        self._thread = None
+
+    def client(self, worker_index):
+        """
+        Get the client a worker uses to make calls (call in the worker)
+
+        Args:
+            worker_index: Index of the worker
+
+        Returns:
+            APIClient
+        """
+        return APIClient(self.requests, self.responses[worker_index], worker_index, self.methods)
+
+    def start(self, target):
+        """
+        Start serving calls (call in the parent after forking)
+
+        Args:
+            target: Object the methods are called on
+        """
+        self._target = target
+        self._executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="APIServer")
+        self._thread = threading.Thread(target=self._run, name="APIServer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Dispatch calls until stopped (runs in a thread)"""
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            self._executor.submit(self._call, *request)
+
+    def _call(self, worker_index, call_id, method, args, kwargs):
+        """Run one call and send its result back to the worker"""
+        try:
+            if method not in self.methods:
+                raise AttributeError(f"Method {method} is not served")
+            response = (call_id, True, getattr(self._target, method)(*args, **kwargs))
+        except Exception as e:
+            response = (call_id, False, e)
+        self.responses[worker_index].put(response)
+
+    def stop(self):
+        """Stop serving calls, finishing the calls in progress"""
+        if self._thread is not None:
+            self.requests.put(None)
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+
+
+class APIClient:
+    """
+    Worker-side proxy that forwards method calls to an APIServer
+
+    Calls can be made from several threads at once; a receiver thread matches
+    results to calls by id.
+    """
+    def __init__(self, requests, responses, worker_index, methods):
+        """
+        Initialize the client
+
+        Args:
+            requests: Queue shared by all workers
+            responses: This worker's response queue
+            worker_index: Index of this worker
+            methods: Names of the methods that can be called
+        """
+        self._requests = requests
+        self._responses = responses
+        self._worker_index = worker_index
+        self._methods = methods
+
+        self._call_ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._receiver = threading.Thread(target=self._receive, name="APIClient", daemon=True)
+        self._receiver.start()
+
+    def _receive(self):
+        """Resolve pending calls with their results (runs in a thread)"""
+        while True:
+            call_id, ok, result = self._responses.get()
+            with self._lock:
+                future = self._pending.pop(call_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a method on the server's object and wait for its result
+
+        Args:
+            method: Method name
+            *args: Positional arguments
+            **kwargs: Keyword arguments
+
+        Returns:
+            The method's return value (its exception is raised here)
+        """
+        future = Future()
+        with self._lock:
+            call_id = next(self._call_ids)
+            self._pending[call_id] = future
+        self._requests.put((self._worker_index, call_id, method, args, kwargs))
+        return future.result()
+
+    def __getattr__(self, name):
+        """Forward served methods to the server"""
+        if name.startswith("_") or name not in self._methods:
+            raise AttributeError(name)
+        return partial(self.call, name)
@@ -0,0 +1,353 @@
+import fcntl
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from .episode_format import EPISODE_FIELDS
+
+# Every record is its payload length and CRC32 followed by the payload
+RECORD_HEADER = struct.Struct("<II")
+
+# Step payload: action, reward, done and the number of state dimensions,
+# followed by the state dimensions (uint32), the state and the next state (float32)
+STEP_HEADER = struct.Struct("<qfBB")
+
+# Suffixes of segments still being appended to and of segments of finished episodes
+SEGMENT_SUFFIX = ".log"
+SEALED_SUFFIX = ".sealed"
+
+# File in the log directory locked by the process that owns the log
+LOCK_FILENAME = "LOCK"
+
+
+def encode_steps(columns):
+    """
+    Encode a batch of steps as consecutive log records
+
+    Args:
+        columns: Dict of state, action, reward, next_state and done arrays, one row per step
+
+    Returns:
+        Records (header and payload of every step) as bytes
+    """
+    states = np.asarray(columns["state"], dtype="<f4")
+    next_states = np.asarray(columns["next_state"], dtype="<f4")
+    if states.shape != next_states.shape:
+        raise ValueError(f"state and next_state shapes differ: {states.shape} != {next_states.shape}")
+
+    num_steps = len(states)
+    shape = states.shape[1:]
+
+    # One packed record per step, laid out exactly like RECORD_HEADER + STEP_HEADER + dims + states
+    record_dtype = np.dtype([
+        ("length", "<u4"),
+        ("checksum", "<u4"),
+        ("action", "<i8"),
+        ("reward", "<f4"),
+        ("done", "u1"),
+        ("ndim", "u1"),
+        ("dims", "<u4", (len(shape),)),
+        ("state", "<f4", shape),
+        ("next_state", "<f4", shape)
+    ])
+    records = np.zeros(num_steps, dtype=record_dtype)
+    records["length"] = record_dtype.itemsize - RECORD_HEADER.size
+    records["action"] = columns["action"]
+    records["reward"] = columns["reward"]
+    records["done"] = columns["done"]
+    records["ndim"] = len(shape)
+    records["dims"] = shape
+    records["state"] = states
+    records["next_state"] = next_states
+
+    raw = records.view(np.uint8).reshape(num_steps, record_dtype.itemsize)
+    records["checksum"] = [zlib.crc32(row[RECORD_HEADER.size:]) for row in raw]
+
+    return raw.tobytes()
+
+
+def decode_step(payload):
+    """
+    Decode a log record payload back into a step
+
+    Args:
+        payload: Bytes-like payload of one record from encode_steps
+
+    Returns:
+        Dict with state, action, reward, next_state and done
+    """
+    action, reward, done, ndim = STEP_HEADER.unpack_from(payload, 0)
+    offset = STEP_HEADER.size
+    shape = struct.unpack_from(f"<{ndim}I", payload, offset)
+    offset += 4 * ndim
+
+    count = int(np.prod(shape, dtype=np.int64))
+    state = np.frombuffer(payload, dtype="<f4", count=count, offset=offset).reshape(shape)
+    next_state = np.frombuffer(payload, dtype="<f4", count=count, offset=offset + 4 * count).reshape(shape)
+
+    return {
+        "state": state,
+        "action": action,
+        "reward": reward,
+        "next_state": next_state,
+        "done": bool(done)
+    }
+
+
+def read_segment(path, repair=False):
+    """
+    Read every complete step of a segment
+
+    Reading stops at the first truncated or corrupt record, which is what a
+    crash in the middle of an append leaves behind.
+
+    Args:
+        path: Segment file
+        repair: Whether to truncate the file after the last complete record
+
+    Returns:
+        List of step dicts
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    steps = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        steps.append(decode_step(payload))
+        offset = start + length
+
+    if repair and offset < len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+
+    return steps
+
+
+class _OpenSegment:
+    """A session's open segment file and the lock serializing its appends"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+        self.sealed = False
+
+
+class StepLog:
+    """
+    Write-ahead log of recorded steps, one append-only segment per session
+
+    Each step is appended to its session's segment as a small length-prefixed,
+    checksummed record and flushed to the OS, so a crash of the process loses
+    nothing that was acknowledged. Segments are fsynced in batches by a
+    background thread every sync_interval seconds, which bounds what a power
+    loss can lose without paying for an fsync per step.
+
+    When an episode ends its segment is sealed: synced, closed and renamed, so
+    the session can start a new segment while the finished one is converted to
+    an episode file. Every segment has its own lock, so writes, fsyncs and
+    renames of one session never wait for another session. After a crash,
+    recover() returns the open segments (partial episodes) and the sealed
+    segments not converted yet.
+
+    Only one StepLog can own a directory at a time: it holds an exclusive
+    flock on the directory's LOCK file until it is closed, so a second process
+    cannot recover (and re-save or truncate) segments that are still in use.
+    """
+    def __init__(self, directory, sync_interval=0.05):
+        """
+        Initialize the log, raising RuntimeError if another StepLog owns the directory
+
+        Args:
+            directory: Directory holding the segments
+            sync_interval: Seconds between batched fsyncs (0 syncs every append, None never syncs)
+        """
+        self.directory = directory
+        self.sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        # Released by close, or by the OS if the process dies
+        self._lock_file = open(os.path.join(directory, LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"Step log {directory} is in use by another process")
+
+        # Open segments by session; the lock only guards this dict and _dirty
+        self._segments = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self._sync_thread = None
+        if sync_interval:
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="StepLogSync", daemon=True)
+            self._sync_thread.start()
+
+    def _segment_path(self, session_id):
+        """Get the path of a session's open segment"""
+        return os.path.join(self.directory, f"{session_id.encode('utf-8').hex()}{SEGMENT_SUFFIX}")
+
+    @staticmethod
+    def _session_of(path):
+        """Get the session id a segment belongs to"""
+        return bytes.fromhex(os.path.basename(path).split(".")[0]).decode("utf-8")
+
+    def append(self, session_id, step):
+        """
+        Append a step to a session's segment
+
+        Args:
+            session_id: Session the step belongs to
+            step: Dict with state, action, reward, next_state and done
+        """
+        self.append_batch(session_id, {field: np.asarray(step[field])[np.newaxis] for field in EPISODE_FIELDS})
+
+    def append_batch(self, session_id, columns):
+        """
+        Append several steps to a session's segment with a single write
+
+        Args:
+            session_id: Session the steps belong to
+            columns: Dict of state, action, reward, next_state and done arrays, one row per step
+        """
+        records = encode_steps(columns)
+
+        while True:
+            with self._lock:
+                segment = self._segments.get(session_id)
+                if segment is None:
+                    segment = self._segments[session_id] = _OpenSegment()
+
+            with segment.lock:
+                if segment.sealed:
+                    # Sealed while waiting for the lock; the next append starts a new segment
+                    continue
+                if segment.file is None:
+                    segment.file = open(self._segment_path(session_id), 'ab')
+                segment.file.write(records)
+                segment.file.flush()
+
+                if self.sync_interval == 0:
+                    os.fsync(segment.file.fileno())
+            break
+
+        if self.sync_interval:
+            with self._lock:
+                self._dirty.add(session_id)
+
+    def seal(self, session_id):
+        """
+        Seal a session's segment once its episode is done
+
+        Args:
+            session_id: Session whose episode ended
+
+        Returns:
+            Path of the sealed segment (to pass to discard once the episode is saved), or None
+        """
+        with self._lock:
+            segment = self._segments.pop(session_id, None) or _OpenSegment()
+            self._dirty.discard(session_id)
+
+        with segment.lock:
+            segment.sealed = True
+            if segment.file is not None:
+                if self.sync_interval is not None:
+                    os.fsync(segment.file.fileno())
+                segment.file.close()
+                segment.file = None
+
+            path = self._segment_path(session_id)
+            if not os.path.exists(path):
+                return None
+
+            sealed_path = f"{path[:-len(SEGMENT_SUFFIX)]}.{time.time_ns()}{SEALED_SUFFIX}"
+            os.replace(path, sealed_path)
+            return sealed_path
+
+    def discard(self, path):
+        """
+        Delete a sealed segment whose episode has been saved
+
+        Args:
+            path: Path returned by seal or recover
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def recover(self):
+        """
+        Find the steps left in the log by a previous process
+
+        Truncated records at the end of open segments are cut off.
+
+        Returns:
+            (open, sealed) where open maps session id to its list of steps and
+            sealed is a list of (path, session id, steps) of sealed segments
+        """
+        open_segments = {}
+        sealed_segments = []
+
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(SEGMENT_SUFFIX):
+                steps = read_segment(path, repair=True)
+                if steps:
+                    open_segments[self._session_of(path)] = steps
+            elif name.endswith(SEALED_SUFFIX):
+                sealed_segments.append((path, self._session_of(path), read_segment(path)))
+
+        return open_segments, sealed_segments
+
+    def sync(self):
+        """Fsync every segment appended to since the last sync"""
+        with self._lock:
+            segments = [self._segments[session_id] for session_id in self._dirty if session_id in self._segments]
+            self._dirty.clear()
+
+        for segment in segments:
+            f = segment.file
+            if f is None:
+                continue
+            try:
+                os.fsync(f.fileno())
+            except (OSError, ValueError):
+                # Sealed and closed in the meantime; seal syncs before closing
+                pass
+
+    def _sync_loop(self):
+        """Sync dirty segments every sync_interval seconds (runs in a thread)"""
+        while not self._closed.wait(self.sync_interval):
+            self.sync()
+
+    def close(self):
+        """Sync and close every open segment and release the directory"""
+        self._closed.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+
+        self.sync()
+        with self._lock:
+            segments = list(self._segments.values())
+            self._segments.clear()
+
+        for segment in segments:
+            with segment.lock:
+                segment.sealed = True
+                if segment.file is not None:
+                    segment.file.close()
+                    segment.file = None
+
+        self._lock_file.close()
@@ -0,0 +1,132 @@
+import numpy as np
+import torch
+
+# NumPy dtype matching each supported torch dtype
+NUMPY_DTYPES = {
+    torch.float32: np.float32,
+    torch.float64: np.float64,
+    torch.int64: np.int64,
+    torch.int32: np.int32,
+    torch.uint8: np.uint8,
+    torch.bool: np.bool_
+}
+
+
+class BatchConverter:
+    """
+    Convert NumPy batches to tensors on a device with as few copies as possible
+
+    Arrays that already have the requested dtype and a C-contiguous layout are
+    wrapped with torch.from_numpy, which shares their memory. Anything else is
+    copied once, converting the dtype on the way, into a reusable staging tensor
+    that is only reallocated when a larger batch arrives. When the target
+    device is a GPU the staging tensors are pinned, so the host-to-device copy
+    can run asynchronously.
+
+    Staging tensors are reused between calls with the same name, so a tensor
+    returned for a name is overwritten by the next conversion under that name.
+    """
+    def __init__(self, device="cpu", pin_memory=None):
+        """
+        Initialize the converter
+
+        Args:
+            device: Device to put tensors on
+            pin_memory: Whether to pin staging tensors (if None, pin when the device is a GPU)
+        """
+        self.device = torch.device(device)
+        if pin_memory is None:
+            pin_memory = self.device.type == "cuda" and torch.cuda.is_available()
+        self.pin_memory = pin_memory
+
+        self._staging = {}
+        self._copy_events = {}
+
+    def _staging_array(self, name, shape, dtype):
+        """
+        Get a staging tensor with room for a batch, and a NumPy view of it
+
+        Args:
+            name: Name of the staging tensor
+            shape: Shape of the batch
+            dtype: Torch dtype of the batch
+
+        Returns:
+            (tensor, array) of exactly the batch shape, sharing memory
+        """
+        tensor = self._staging.get(name)
+        if (tensor is None or tensor.dtype != dtype or tuple(tensor.shape[1:]) != tuple(shape[1:])
+                or tensor.shape[0] < shape[0]):
+            tensor = torch.empty(tuple(shape), dtype=dtype, pin_memory=self.pin_memory)
+            self._staging[name] = tensor
+
+        # Wait for the previous asynchronous copy out of this staging tensor before overwriting it
+        event = self._copy_events.pop(name, None)
+        if event is not None:
+            event.synchronize()
+
+        tensor = tensor[:shape[0]]
+        return tensor, tensor.numpy()
+
+    def to_tensor(self, array, dtype=torch.float32, name=None):
+        """
+        Convert an array to a tensor on the converter's device
+
+        Args:
+            array: NumPy array (or anything np.asarray accepts)
+            dtype: Torch dtype of the result
+            name: Name of the staging tensor to reuse (if None, a fresh tensor is allocated when a copy is needed)
+
+        Returns:
+            Tensor on the device; on CPU it may share memory with the input array or a staging tensor
+        """
+        if isinstance(array, torch.Tensor):
+            return array.to(self.device, dtype=dtype)
+
+        array = np.asarray(array)
+        numpy_dtype = NUMPY_DTYPES[dtype]
+
+        if array.dtype == numpy_dtype and array.flags.c_contiguous and array.flags.writeable:
+            # Zero-copy view of the input
+            tensor = torch.from_numpy(array)
+        elif name is None or array.ndim == 0:
+            tensor = torch.from_numpy(np.ascontiguousarray(array, dtype=numpy_dtype))
+        else:
+            # Single copy (with dtype conversion) into the reusable staging tensor
+            tensor, staging = self._staging_array(name, array.shape, dtype)
+            np.copyto(staging, array, casting="unsafe")
+
+        if self.device.type == "cpu":
+            return tensor
+
+        non_blocking = tensor.is_pinned()
+        device_tensor = tensor.to(self.device, non_blocking=non_blocking)
+        if non_blocking and name is not None:
+            event = torch.cuda.Event()
+            event.record()
+            self._copy_events[name] = event
+
+        return device_tensor
+
+    def to_tensors(self, states, actions, next_states, rewards, dones):
+        """
+        Convert a batch of experiences to tensors ready for training
+
+        Args:
+            states: Batch of states
+            actions: Batch of actions
+            next_states: Batch of next states
+            rewards: Batch of rewards
+            dones: Batch of done flags
+
+        Returns:
+            (states, actions, next_states, rewards, dones) tensors; actions, rewards
+            and dones have shape (batch, 1)
+        """
+        return (
+            self.to_tensor(states, name="states"),
+            self.to_tensor(actions, dtype=torch.int64, name="actions").unsqueeze(1),
+            self.to_tensor(next_states, name="next_states"),
+            self.to_tensor(rewards, name="rewards").unsqueeze(1),
+            self.to_tensor(dones, name="dones").unsqueeze(1)
+        )
@@ -1,23 +1,84 @@
-import json
 import os
+import queue
+import threading
+import time
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 import logging
 
+from .columnar_buffer import ColumnarBuffer
+from .episode_format import EPISODE_DTYPES, EPISODE_EXTENSION, EPISODE_FIELDS, episode_columns, write_episode
+from .episode_manifest import MANIFEST_FILENAME, EpisodeManifest
+from .episode_dataset import EpisodeDataset
+from .episode_statistics import EpisodeStatistics
+from .parallel_loader import select_episode_files, load_episode_files, read_episode_file
+from .segment_compactor import SegmentCompactor, list_segments, read_segment_index
+from .step_log import StepLog
+
+# Name of the write-ahead log directory inside the data directory
+STEP_LOG_DIRNAME = "wal"
+
+# Session of steps recorded without a session_id
+DEFAULT_SESSION = "default"
+
 class WebGameAPI:
     """
     API for collecting data from the web game and using it to train a model
+    
+    Steps are grouped into episodes per game session, so several games can be
+    recorded at once from different threads. Each session has its own episode
+    buffer guarded by one of a fixed set of lock stripes, and finished episodes
+    are sealed independently.
+    
+    enqueue_step and enqueue_batch validate transitions and return at once,
+    leaving them to a background writer that records them in batches. The
+    queue is bounded by its number of transitions; when it is full they raise
+    queue.Full so callers can shed load. Queued transitions are only in
+    memory until the writer logs them.
+    
+    Every open session holds an episode buffer and a step log file, so steps
+    that would start another session while max_sessions are open are
+    rejected with queue.Full. Sessions are counted once their steps are
+    recorded, so transitions still in the ingestion queue can exceed the
+    limit by the few sessions they open. Sessions that receive nothing for
+    session_timeout seconds are closed and their unfinished episode is
+    saved as it is.
+    
+    Only one recording WebGameAPI can use a data directory at a time, since it
+    owns the step log. Readers such as training scripts open the directory
+    with read_only=True, which skips the step log, its recovery and the
+    background threads, and can run next to a recording server.
     """
-    def __init__(self, data_dir="./data"):
+    def __init__(self, data_dir="./data", compression="zlib", wal_sync_interval=0.05, lock_shards=64,
+                 seal_workers=2, ingest_queue_size=100000, ingest_batch_size=1024, max_sessions=10000,
+                 session_timeout=600.0, read_only=False):
         """
         Initialize the API
         
         Args:
             data_dir: Directory to save data to
+            compression: Compression of saved episode files ("zlib", "lzma" or "none")
+            wal_sync_interval: Seconds between batched fsyncs of the step log
+                (0 syncs every step, None leaves syncing to the OS)
+            lock_shards: Number of locks the sessions are striped over
+            seal_workers: Number of threads saving finished episodes
+            ingest_queue_size: Maximum number of transitions waiting for the background writer
+            ingest_batch_size: Maximum number of transitions the writer records at once
+            max_sessions: Maximum number of sessions with an unfinished episode (None for no limit)
+            session_timeout: Seconds after which an idle session's unfinished episode is
+                saved and the session closed (None keeps sessions open)
+            read_only: Only read saved episodes; recording raises RuntimeError
         """
         self.data_dir = data_dir
+        self.compression = compression
+        self.read_only = read_only
         os.makedirs(data_dir, exist_ok=True)
         
+        # Index of the saved episodes (see utils/episode_manifest.py)
+        self.manifest = EpisodeManifest(os.path.join(data_dir, MANIFEST_FILENAME))
+        
         # Setup logging
         self.logger = logging.getLogger("WebGameAPI")
         self.logger.setLevel(logging.INFO)
@@ -26,42 +87,272 @@ class WebGameAPI:
             console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
             self.logger.addHandler(console_handler)
         
-        # Current episode data
-        self.current_episode = []
+        # Episodes being recorded, one ColumnarBuffer of steps per session, and
+        # the time.monotonic() of every session's last transition
+        self.current_episodes = {}
+        self._session_activity = {}
+        self._session_locks = [threading.Lock() for _ in range(lock_shards)]
+        self.max_sessions = max_sessions
+        self.session_timeout = session_timeout
         self.episode_counter = 0
         
-        # Training data
+        # Training data, one dict of per-field arrays per episode
         self.all_episodes = []
+        
+        # Guards all_episodes, episode_counter and statistics
+        self._data_lock = threading.Lock()
+        
+        # Every step is logged before it is acknowledged; finished episodes are
+        # converted to episode files in the background (see utils/step_log.py).
+        # The step log fails fast if another process is recording to data_dir.
+        self.step_log = None
+        self._sealer = None
+        self._pending_seals = set()
+        self._pending_lock = threading.Lock()
+        if not read_only:
+            self.step_log = StepLog(os.path.join(data_dir, STEP_LOG_DIRNAME), sync_interval=wal_sync_interval)
+            self._sealer = ThreadPoolExecutor(max_workers=seal_workers, thread_name_prefix="EpisodeSealer")
+            self._recover_episodes()
+        
+        # Running statistics, starting from the persisted totals of every saved episode
+        self.statistics = EpisodeStatistics(**self.manifest.totals())
+        
+        # Transitions queued by enqueue_step/enqueue_batch as (session_id, columns)
+        self.ingest_queue_size = ingest_queue_size
+        self.ingest_batch_size = ingest_batch_size
+        self._ingest_items = deque()
+        self._ingest_steps = 0
+        self._ingest_closed = False
+        self._ingest_condition = threading.Condition()
+        self._ingest_writer = None
+        if not read_only:
+            self._ingest_writer = threading.Thread(target=self._run_ingest_writer, name="IngestionWriter",
+                                                   daemon=True)
+            self._ingest_writer.start()
+        
+        # Closes idle sessions every half session_timeout
+        self._closed = threading.Event()
+        self._session_expiry = None
+        if not read_only and session_timeout:
+            self._session_expiry = threading.Thread(target=self._run_session_expiry, name="SessionExpiry",
+                                                    daemon=True)
+            self._session_expiry.start()
     
-    def record_step(self, data):
+    @property
+    def current_episode(self):
+        """Steps recorded so far in the episode of the default session, as a dict of per-field arrays"""
+        buffer = self.current_episodes.get(DEFAULT_SESSION)
+        return buffer.as_dict() if buffer is not None else episode_columns([])
+    
+    def _session_lock(self, session_id):
+        """Get the lock stripe guarding a session"""
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+    
+    @staticmethod
+    def _transition_columns(data):
         """
-        Record a step in the game
+        Convert and validate transitions given as per-field arrays
+        
+        Args:
+            data: Dict with state, action, reward, next_state and done, each
+                holding one row per transition
+        
+        Returns:
+            Dict of field name to array with the dtypes of EPISODE_DTYPES
+        """
+        for key in EPISODE_FIELDS:
+            if key not in data:
+                raise ValueError(f"Missing required key in step data: {key}")
+        
+        columns = {field: np.asarray(data[field], dtype=EPISODE_DTYPES[field]) for field in EPISODE_FIELDS}
+        
+        num_steps = len(columns["action"])
+        if columns["state"].ndim < 2 or columns["state"].shape != columns["next_state"].shape:
+            raise ValueError(f"state and next_state must have the same per-step shape, got "
+                             f"{columns['state'].shape} and {columns['next_state'].shape}")
+        for field in EPISODE_FIELDS:
+            if len(columns[field]) != num_steps or (field not in ("state", "next_state") and columns[field].ndim != 1):
+                raise ValueError(f"Expected {num_steps} values for {field}, got shape {columns[field].shape}")
+        
+        # Actions index the action histogram; values that did not survive the integer conversion are rejected
+        if np.any(columns["action"] < 0) or not np.array_equal(columns["action"], np.asarray(data["action"])):
+            raise ValueError("Actions must be non-negative integers")
+        if not (np.isfinite(columns["state"]).all() and np.isfinite(columns["next_state"]).all()
+                and np.isfinite(columns["reward"]).all()):
+            raise ValueError("States and rewards must be finite")
+        
+        return columns
+    
+    def _append_transitions(self, session_id, columns):
+        """
+        Append validated transitions to a session, sealing every episode they complete
         
         Args:
-            data: Step data (dict with state, action, reward, next_state, done)
+            session_id: Session the transitions belong to (None for the default session)
+            columns: Dict of per-field arrays from _transition_columns
         """
+        if self.read_only:
+            raise RuntimeError("WebGameAPI is read-only")
+        session_key = DEFAULT_SESSION if session_id is None else str(session_id)
+        
+        # Split the transitions after every done flag
+        ends = np.flatnonzero(columns["done"]) + 1
+        bounds = [0] + ends.tolist() + ([len(columns["done"])] if not len(ends) or ends[-1] < len(columns["done"]) else [])
+        
+        completed = []
+        with self._session_lock(session_key):
+            try:
+                self._extend_session(session_key, columns, bounds, completed)
+            finally:
+                # Episodes completed before a failure are kept. They are handed to the sealer
+                # under the session lock, so the episodes of a session are saved in order
+                for episode, segment in completed:
+                    self._complete_episode(episode, segment, session_id, session_key)
+    
+    def _extend_session(self, session_key, columns, bounds, completed):
+        """
+        Append transitions to a session's episode (session lock must be held)
+        
+        Args:
+            session_key: Session the transitions belong to
+            columns: Dict of per-field arrays
+            bounds: Row indices splitting the transitions into episode chunks
+            completed: List that (episode, sealed segment) of every completed episode is appended to
+        """
+        buffer = self.current_episodes.pop(session_key, None) or ColumnarBuffer(EPISODE_DTYPES, initial_capacity=256)
         try:
-            # Validate data format
-            required_keys = ["state", "action", "reward", "next_state", "done"]
-            for key in required_keys:
-                if key not in data:
-                    self.logger.error(f"Missing required key in step data: {key}")
-                    return False
-            
-            # Append to current episode
-            self.current_episode.append(data)
-            
-            # If episode is done, save it
-            if data["done"]:
-                self.all_episodes.append(self.current_episode)
-                self.episode_counter += 1
-                self.logger.info(f"Episode {self.episode_counter} completed with {len(self.current_episode)} steps")
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                chunk = {field: column[start:end] for field, column in columns.items()}
+                
+                # Append to the session's episode, then log it; undo the append if logging fails
+                size = len(buffer)
+                buffer.extend(**chunk)
+                try:
+                    self.step_log.append_batch(session_key, chunk)
+                except Exception:
+                    buffer.truncate(size)
+                    raise
                 
-                # Save to file
-                self._save_episode()
+                if chunk["done"][-1]:
+                    # The episode is done: seal the session's log segment and start a new episode
+                    episode = {field: column.copy() for field, column in buffer.as_dict().items()}
+                    completed.append((episode, self.step_log.seal(session_key)))
+                    buffer = ColumnarBuffer(EPISODE_DTYPES, initial_capacity=256)
+        finally:
+            if len(buffer):
+                self.current_episodes[session_key] = buffer
+                self._session_activity[session_key] = time.monotonic()
+            else:
+                self._session_activity.pop(session_key, None)
+    
+    def _complete_episode(self, episode, segment, session_id, session_key):
+        """
+        Add a completed episode to the training data and save it in the background
+        
+        Called with the session lock held. The episode id is reserved here, so
+        episodes keep the order in which their session completed them even when
+        several sealer threads save them.
+        
+        Args:
+            episode: Dict of per-field arrays
+            segment: Sealed step log segment holding the episode
+            session_id: Id of the game session the episode came from
+            session_key: Step log session of the episode
+        """
+        summary = self._summarize_episode(episode)
+        with self._data_lock:
+            self.all_episodes.append(episode)
+            self.statistics.add_episode(**summary)
+            self.episode_counter += 1
+            episode_number = self.episode_counter
+        self.logger.info(f"Episode {episode_number} of session {session_key} completed with {summary['num_steps']} steps")
+        
+        # Save to file in the background; the sealed log segment keeps it until then
+        episode_id = self.manifest.reserve()
+        future = self._sealer.submit(self._seal_episode, episode, summary, session_id, segment, episode_id)
+        with self._pending_lock:
+            self._pending_seals.add(future)
+        future.add_done_callback(self._seal_done)
+    
+    def _seal_done(self, future):
+        """Forget a finished background save"""
+        with self._pending_lock:
+            self._pending_seals.discard(future)
+    
+    def _check_session_limit(self, session_id):
+        """Raise queue.Full if transitions of session_id would open one session more than max_sessions"""
+        session_key = DEFAULT_SESSION if session_id is None else str(session_id)
+        if (self.max_sessions is not None and session_key not in self.current_episodes
+                and len(self.current_episodes) >= self.max_sessions):
+            raise queue.Full(f"Too many open sessions ({len(self.current_episodes)})")
+    
+    def expire_sessions(self, timeout=None):
+        """
+        Close sessions that received no transitions for a while
+        
+        The unfinished episode of every idle session is saved as it is (its
+        last step is not marked done) and its step log segment is sealed.
+        
+        Args:
+            timeout: Idle time in seconds (if None, use session_timeout)
+        
+        Returns:
+            Number of sessions closed
+        """
+        if timeout is None:
+            timeout = self.session_timeout
+        
+        expired = 0
+        for session_key, last_active in list(self._session_activity.items()):
+            if time.monotonic() - last_active < timeout:
+                continue
+            
+            with self._session_lock(session_key):
+                # Check again now that no transitions of the session are being appended
+                last_active = self._session_activity.get(session_key)
+                if last_active is None or time.monotonic() - last_active < timeout:
+                    continue
                 
-                # Reset current episode
-                self.current_episode = []
+                del self._session_activity[session_key]
+                buffer = self.current_episodes.pop(session_key, None)
+                segment = self.step_log.seal(session_key)
+                if buffer is not None and len(buffer):
+                    episode = {field: column.copy() for field, column in buffer.as_dict().items()}
+                    session_id = None if session_key == DEFAULT_SESSION else session_key
+                    self._complete_episode(episode, segment, session_id, session_key)
+                elif segment is not None:
+                    self.step_log.discard(segment)
+            
+            expired += 1
+        
+        if expired:
+            self.logger.info(f"Closed {expired} sessions idle for {timeout} seconds")
+        
+        return expired
+    
+    def _run_session_expiry(self):
+        """Close idle sessions every half session_timeout until closed (runs in a thread)"""
+        while not self._closed.wait(self.session_timeout / 2):
+            try:
+                self.expire_sessions()
+            except Exception as e:
+                self.logger.error(f"Error closing idle sessions: {str(e)}")
+    
+    def record_step(self, data):
+        """
+        Record a step in the game
+        
+        Safe to call from several threads; steps of different sessions are
+        recorded concurrently and steps of one session in call order.
+        
+        Args:
+            data: Step data (dict with state, action, reward, next_state, done
+                and an optional session_id)
+        """
+        try:
+            columns = self._step_columns(data)
+            self._check_session_limit(data.get("session_id"))
+            self._append_transitions(data.get("session_id"), columns)
             
             return True
         
@@ -69,30 +360,258 @@ class WebGameAPI:
             self.logger.error(f"Error recording step: {str(e)}")
             return False
     
-    def _save_episode(self):
-        """Save the current episode to a file"""
+    def record_batch(self, data):
+        """
+        Record many transitions of one session at once
+        
+        The transitions are validated together, appended to the step log with
+        one write per episode, and every episode they complete is sealed.
+        
+        Args:
+            data: Dict with an optional session_id and either a "transitions"
+                list of step dicts or state, action, reward, next_state and done
+                lists holding one entry per transition
+        
+        Returns:
+            True if successful, False otherwise
+        """
         try:
-            # Create a unique filename
+            columns = self._batch_columns(data)
+            if len(columns["action"]):
+                self._check_session_limit(data.get("session_id"))
+                self._append_transitions(data.get("session_id"), columns)
+            
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error recording batch: {str(e)}")
+            return False
+    
+    def _step_columns(self, data):
+        """Validate the data of record_step as columns of one transition"""
+        for key in EPISODE_FIELDS:
+            if key not in data:
+                raise ValueError(f"Missing required key in step data: {key}")
+        
+        return self._transition_columns({field: [data[field]] for field in EPISODE_FIELDS})
+    
+    def _batch_columns(self, data):
+        """Validate the data of record_batch as columns of its transitions"""
+        if "transitions" not in data:
+            return self._transition_columns(data)
+        
+        transitions = data["transitions"]
+        for key in EPISODE_FIELDS:
+            if any(key not in step for step in transitions):
+                raise ValueError(f"Missing required key in transition data: {key}")
+        
+        return self._transition_columns({field: [step[field] for step in transitions] for field in EPISODE_FIELDS})
+    
+    def enqueue_step(self, data):
+        """
+        Validate a step and queue it for the background writer
+        
+        Args:
+            data: Step data, as for record_step
+        
+        Returns:
+            True if queued, False if the data is invalid (queue.Full is raised if the queue
+            is full or the step would open more than max_sessions sessions)
+        """
+        try:
+            columns = self._step_columns(data)
+        except Exception as e:
+            self.logger.error(f"Error recording step: {str(e)}")
+            return False
+        
+        self._enqueue(data.get("session_id"), columns)
+        return True
+    
+    def enqueue_batch(self, data):
+        """
+        Validate transitions of one session and queue them for the background writer
+        
+        Args:
+            data: Transitions, as for record_batch
+        
+        Returns:
+            True if queued, False if the data is invalid (queue.Full is raised if the queue
+            is full or the transitions would open more than max_sessions sessions)
+        """
+        try:
+            columns = self._batch_columns(data)
+        except Exception as e:
+            self.logger.error(f"Error recording batch: {str(e)}")
+            return False
+        
+        if len(columns["action"]):
+            self._enqueue(data.get("session_id"), columns)
+        return True
+    
+    def _enqueue(self, session_id, columns):
+        """Add validated transitions to the ingestion queue"""
+        num_steps = len(columns["action"])
+        if self.read_only:
+            raise RuntimeError("WebGameAPI is read-only")
+        self._check_session_limit(session_id)
+        with self._ingest_condition:
+            if self._ingest_closed:
+                raise RuntimeError("WebGameAPI is closed")
+            # A batch larger than the whole queue is still taken when the queue is empty
+            if self._ingest_steps and self._ingest_steps + num_steps > self.ingest_queue_size:
+                raise queue.Full(f"Ingestion queue is full ({self._ingest_steps} transitions)")
+            
+            self._ingest_items.append((session_id, columns))
+            self._ingest_steps += num_steps
+            self._ingest_condition.notify()
+    
+    def ingest_queue_depth(self):
+        """
+        Get the number of queued transitions not recorded yet
+        
+        Returns:
+            Number of transitions in the ingestion queue or being recorded
+        """
+        with self._ingest_condition:
+            return self._ingest_steps
+    
+    def _run_ingest_writer(self):
+        """Record queued transitions in batches until closed (runs in a thread)"""
+        while True:
+            with self._ingest_condition:
+                while not self._ingest_items and not self._ingest_closed:
+                    self._ingest_condition.wait()
+                if not self._ingest_items:
+                    return
+                
+                batch = [self._ingest_items.popleft()]
+                num_steps = len(batch[0][1]["action"])
+                while self._ingest_items and num_steps + len(self._ingest_items[0][1]["action"]) <= self.ingest_batch_size:
+                    batch.append(self._ingest_items.popleft())
+                    num_steps += len(batch[-1][1]["action"])
+            
+            # Group by session, keeping each session's transitions in queue order
+            sessions = {}
+            for session_id, columns in batch:
+                sessions.setdefault(session_id, []).append(columns)
+            
+            for session_id, chunks in sessions.items():
+                try:
+                    columns = chunks[0] if len(chunks) == 1 else {
+                        field: np.concatenate([chunk[field] for chunk in chunks]) for field in EPISODE_FIELDS
+                    }
+                    self._append_transitions(session_id, columns)
+                except Exception as e:
+                    self.logger.error(f"Error recording queued transitions of session {session_id}: {str(e)}")
+            
+            with self._ingest_condition:
+                self._ingest_steps -= num_steps
+                self._ingest_condition.notify_all()
+    
+    def _seal_episode(self, episode, summary, session_id, segment, episode_id=None):
+        """
+        Save a finished episode and drop its step log segment
+        
+        Args:
+            episode: Dict of per-field arrays
+            summary: Episode summary from _summarize_episode
+            session_id: Id of the game session the episode came from
+            segment: Sealed step log segment holding the episode (or None)
+            episode_id: Id reserved in the manifest (if None, one is reserved now)
+        """
+        saved = self._save_episode(episode, summary, session_id=session_id, episode_id=episode_id)
+        if saved and segment is not None:
+            self.step_log.discard(segment)
+    
+    def _recover_episodes(self):
+        """
+        Recover episodes left in the step log by a previous process
+        
+        Finished episodes that were not saved yet are saved now, and
+        unfinished episodes are restored so their sessions can continue.
+        """
+        open_segments, sealed_segments = self.step_log.recover()
+        
+        for segment, session_key, steps in sealed_segments:
+            if steps:
+                episode = episode_columns(steps)
+                session_id = None if session_key == DEFAULT_SESSION else session_key
+                self._seal_episode(episode, self._summarize_episode(episode), session_id, segment)
+            else:
+                self.step_log.discard(segment)
+        
+        self.current_episodes = {}
+        for session_key, steps in open_segments.items():
+            buffer = ColumnarBuffer(EPISODE_DTYPES, initial_capacity=256)
+            buffer.extend(**episode_columns(steps))
+            self.current_episodes[session_key] = buffer
+            self._session_activity[session_key] = time.monotonic()
+        
+        if sealed_segments or open_segments:
+            self.logger.info(f"Recovered {len(sealed_segments)} finished episodes and "
+                             f"{len(open_segments)} unfinished episodes from the step log")
+    
+    def write_queue_depth(self):
+        """
+        Get the number of finished episodes waiting to be saved
+        
+        Returns:
+            Number of pending episode writes
+        """
+        with self._pending_lock:
+            return len(self._pending_seals)
+    
+    def flush(self):
+        """Wait until every queued transition is recorded and every finished episode has been saved"""
+        with self._ingest_condition:
+            while self._ingest_steps:
+                self._ingest_condition.wait()
+        
+        with self._pending_lock:
+            pending = list(self._pending_seals)
+        wait(pending)
+    
+    def close(self):
+        """Record queued transitions, save pending episodes and close the step log and the manifest"""
+        with self._ingest_condition:
+            self._ingest_closed = True
+            self._ingest_condition.notify_all()
+        self._closed.set()
+        
+        if not self.read_only:
+            self._ingest_writer.join()
+            if self._session_expiry is not None:
+                self._session_expiry.join()
+            self._sealer.shutdown(wait=True)
+            self.step_log.close()
+        self.manifest.close()
+    
+    def _save_episode(self, episode, summary, session_id=None, episode_id=None):
+        """
+        Save an episode to a binary episode file and record it in the manifest
+        
+        Args:
+            episode: Dict of per-field arrays
+            summary: Episode summary from _summarize_episode
+            session_id: Id of the game session the episode came from
+            episode_id: Id reserved in the manifest (if None, one is reserved now)
+        """
+        try:
+            # The manifest allocates the episode id, so filenames stay unique across restarts
+            if episode_id is None:
+                episode_id = self.manifest.reserve()
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"episode_{self.episode_counter}_{timestamp}.json"
+            filename = f"episode_{episode_id}_{timestamp}{EPISODE_EXTENSION}"
             filepath = os.path.join(self.data_dir, filename)
             
-            # Convert data to JSON-serializable format
-            episode_data = []
-            for step in self.current_episode:
-                json_step = {}
-                for key, value in step.items():
-                    if isinstance(value, np.ndarray):
-                        json_step[key] = value.tolist()
-                    else:
-                        json_step[key] = value
-                episode_data.append(json_step)
-            
             # Save to file
-            with open(filepath, 'w') as f:
-                json.dump(episode_data, f)
+            nbytes = write_episode(filepath, episode, compression=self.compression,
+                                   metadata={"episode_id": episode_id, "session_id": session_id})
             
-            self.logger.info(f"Saved episode to {filepath}")
+            # Index it
+            self.manifest.commit(episode_id, filename, nbytes, **summary, session_id=session_id)
+            
+            self.logger.info(f"Saved episode to {filepath} ({nbytes} bytes)")
             
             return True
         
@@ -100,14 +619,33 @@ class WebGameAPI:
             self.logger.error(f"Error saving episode: {str(e)}")
             return False
     
+    @staticmethod
+    def _summarize_episode(episode):
+        """
+        Compute the manifest summary of an episode
+        
+        Args:
+            episode: Dict of per-field arrays
+        
+        Returns:
+            Dictionary with num_steps, total_reward and action_counts
+        """
+        actions = np.asarray(episode["action"], dtype=np.int64)
+        return {
+            "num_steps": len(actions),
+            "total_reward": float(np.sum(episode["reward"], dtype=np.float64)),
+            "action_counts": np.bincount(actions).tolist() if len(actions) else []
+        }
+    
     def get_episodes(self):
         """
         Get all recorded episodes
         
         Returns:
-            List of all episodes
+            List of all episodes, each a dict of per-field arrays
         """
-        return self.all_episodes
+        with self._data_lock:
+            return list(self.all_episodes)
     
     def get_training_data(self):
         """
@@ -116,72 +654,100 @@ class WebGameAPI:
         Returns:
             (states, actions, rewards, next_states, dones)
         """
-        states = []
-        actions = []
-        rewards = []
-        next_states = []
-        dones = []
-        
-        for episode in self.all_episodes:
-            for step in episode:
-                states.append(step["state"])
-                actions.append(step["action"])
-                rewards.append(step["reward"])
-                next_states.append(step["next_state"])
-                dones.append(step["done"])
-        
-        return (
-            np.array(states),
-            np.array(actions),
-            np.array(rewards),
-            np.array(next_states),
-            np.array(dones)
+        episodes = self.get_episodes()
+        if not episodes:
+            return tuple(np.array([]) for _ in EPISODE_FIELDS)
+        
+        return tuple(
+            np.concatenate([episode[field] for episode in episodes])
+            for field in EPISODE_FIELDS
         )
     
-    def load_data(self, directory=None):
+    def get_training_dataset(self, batch_size=64, max_files=None, max_bytes=None, min_reward=None, since=None,
+                             until=None, session_id=None, **dataset_options):
+        """
+        Get a dataset that streams minibatches from the saved episodes
+        
+        Unlike load_data and get_training_data, nothing is loaded up front: the
+        matching episodes are selected from the manifest and decoded lazily
+        while iterating (see utils/episode_dataset.py).
+        
+        Args:
+            batch_size: Number of steps per batch
+            max_files: Maximum number of episodes, oldest first (if None, no limit)
+            max_bytes: Maximum total size of the episodes (if None, no limit)
+            min_reward: Only use episodes with at least this total reward
+            since: Only use episodes recorded at or after this time (datetime or POSIX timestamp)
+            until: Only use episodes recorded at or before this time (datetime or POSIX timestamp)
+            session_id: Only use episodes from this game session
+            **dataset_options: Options passed to EpisodeDataset (shuffle, shuffle_buffer_size,
+                num_threads, shard_index, num_shards, ...)
+        
+        Returns:
+            EpisodeDataset yielding (states, actions, rewards, next_states, dones) batches
+        """
+        sources = self._select_indexed_episodes(max_files, max_bytes, min_reward=min_reward,
+                                                since=since, until=until, session_id=session_id)
+        return EpisodeDataset(sources, batch_size=batch_size, **dataset_options)
+    
+    def load_data(self, directory=None, num_workers=None, max_files=None, max_bytes=None, progress=None,
+                  min_reward=None, since=None, until=None, session_id=None):
         """
         Load data from files
         
+        Episodes in self.data_dir are selected with a manifest query, so only the
+        matching files are opened. Other directories are scanned and can only be
+        limited by max_files and max_bytes. Reads binary episode files as well as
+        episodes saved in the legacy JSON format. Files are decoded in parallel
+        worker processes (see utils/parallel_loader.py).
+        
         Args:
             directory: Directory to load data from (if None, use self.data_dir)
+            num_workers: Number of worker processes (if None, one per CPU; 1 loads in this process)
+            max_files: Maximum number of episodes to load, oldest first (if None, no limit)
+            max_bytes: Maximum total size of the episodes to load (if None, no limit)
+            progress: Callback called as progress(episodes_loaded, total_episodes)
+                (if None, progress is logged every 10%)
+            min_reward: Only load episodes with at least this total reward
+            since: Only load episodes recorded at or after this time (datetime or POSIX timestamp)
+            until: Only load episodes recorded at or before this time (datetime or POSIX timestamp)
+            session_id: Only load episodes from this game session
         """
         if directory is None:
             directory = self.data_dir
         
         try:
             # Reset data
-            self.all_episodes = []
-            self.episode_counter = 0
+            with self._data_lock:
+                self.all_episodes = []
+                self.episode_counter = 0
+                self.statistics.reset()
             
-            # Find all episode files
-            episode_files = [f for f in os.listdir(directory) if f.startswith("episode_") and f.endswith(".json")]
+            if os.path.abspath(directory) == os.path.abspath(self.data_dir):
+                # Select the matching episodes from the manifest
+                sources = self._select_indexed_episodes(max_files, max_bytes, min_reward=min_reward,
+                                                        since=since, until=until, session_id=session_id)
+            else:
+                if any(value is not None for value in (min_reward, since, until, session_id)):
+                    self.logger.warning(f"Episode filters are ignored for unindexed directory {directory}")
+                sources = select_episode_files(directory, max_files, max_bytes)
             
-            if not episode_files:
+            if not sources:
                 self.logger.warning(f"No episode files found in {directory}")
                 return False
             
-            # Load each file
-            for filename in episode_files:
-                filepath = os.path.join(directory, filename)
-                
-                with open(filepath, 'r') as f:
-                    episode_data = json.load(f)
-                
-                # Convert lists back to numpy arrays
-                processed_episode = []
-                for step in episode_data:
-                    processed_step = {}
-                    for key, value in step.items():
-                        if key in ["state", "next_state"]:
-                            processed_step[key] = np.array(value)
-                        else:
-                            processed_step[key] = value
-                    processed_episode.append(processed_step)
-                
-                self.all_episodes.append(processed_episode)
-                self.episode_counter += 1
+            if progress is None:
+                progress = self._log_progress
             
-            self.logger.info(f"Loaded {self.episode_counter} episodes from {directory}")
+            # Load the files
+            episodes = load_episode_files(sources, num_workers, progress)
+            with self._data_lock:
+                self.all_episodes.extend(episodes)
+                self.episode_counter += len(episodes)
+                for episode in episodes:
+                    self.statistics.add_episode(**self._summarize_episode(episode))
+            
+            self.logger.info(f"Loaded {len(episodes)} episodes from {directory}")
             
             return True
         
@@ -189,54 +755,155 @@ class WebGameAPI:
             self.logger.error(f"Error loading data: {str(e)}")
             return False
     
+    def _select_indexed_episodes(self, max_files=None, max_bytes=None, **filters):
+        """
+        Select episodes of self.data_dir from the manifest
+        
+        Args:
+            max_files: Maximum number of episodes, oldest first (if None, no limit)
+            max_bytes: Maximum total size of the episodes (if None, no limit)
+            **filters: Filters passed to EpisodeManifest.query
+        
+        Returns:
+            List of (path, offset, length) tuples
+        """
+        # Episode files written before the manifest existed are indexed once
+        if len(self.manifest) == 0:
+            self.reindex()
+        
+        sources = []
+        total_bytes = 0
+        for episode in self.manifest.query(limit=max_files, **filters):
+            if max_bytes is not None and total_bytes + episode["length"] > max_bytes:
+                break
+            
+            path = os.path.join(self.data_dir, episode["path"])
+            # Legacy JSON episodes are always read whole
+            sources.append((path, 0, None) if path.endswith(".json") else (path, episode["offset"], episode["length"]))
+            total_bytes += episode["length"]
+        
+        return sources
+    
+    def query_episodes(self, min_reward=None, max_reward=None, since=None, until=None, session_id=None,
+                       min_steps=None, limit=None):
+        """
+        Find saved episodes without loading them
+        
+        Args:
+            min_reward: Minimum total reward
+            max_reward: Maximum total reward
+            since: Earliest recording time (datetime or POSIX timestamp)
+            until: Latest recording time (datetime or POSIX timestamp)
+            session_id: Game session id
+            min_steps: Minimum number of steps
+            limit: Maximum number of episodes to return
+        
+        Returns:
+            List of manifest entries (dicts), oldest first
+        """
+        return self.manifest.query(min_reward=min_reward, max_reward=max_reward, since=since, until=until,
+                                   session_id=session_id, min_steps=min_steps, limit=limit)
+    
+    def reindex(self):
+        """
+        Add episode files and segments in self.data_dir that are missing from the manifest
+        
+        Each unindexed episode is read once to compute its summary; the file's
+        modification time is used as the recording time.
+        
+        Returns:
+            Number of episodes added to the manifest
+        """
+        indexed = self.manifest.indexed_paths()
+        added = 0
+        
+        # Episode files hold one episode, segments the episodes listed in their index
+        sources = [(path, 0, None) for path in select_episode_files(self.data_dir)]
+        for segment in list_segments(self.data_dir):
+            sources.extend((segment, offset, length) for offset, length in read_segment_index(segment))
+        
+        for path, offset, length in sources:
+            filename = os.path.relpath(path, self.data_dir)
+            if filename in indexed:
+                continue
+            
+            try:
+                episode = read_episode_file(path, offset, length)
+            except Exception as e:
+                self.logger.error(f"Error indexing {path}: {str(e)}")
+                continue
+            
+            self.manifest.add(filename, os.path.getsize(path) if length is None else length,
+                              **self._summarize_episode(episode), offset=offset,
+                              created_at=os.path.getmtime(path))
+            added += 1
+        
+        if added:
+            self.logger.info(f"Indexed {added} episode files in {self.data_dir}")
+        
+        return added
+    
+    def compact(self, segment_bytes=256 * 1024 * 1024, compression=None, max_episodes=None, delete_delay=300.0):
+        """
+        Merge single-episode files into large segment files
+        
+        Safe to run while episodes are being recorded (see utils/segment_compactor.py).
+        Only one compaction of the data directory runs at a time, in this or any
+        other process.
+        
+        Args:
+            segment_bytes: Size at which a segment is closed and a new one started
+            compression: Recompress episodes with this compression (if None, keep it)
+            max_episodes: Maximum number of episodes to move (if None, all of them)
+            delete_delay: Seconds moved episode files are kept for loaders that already selected them
+        
+        Returns:
+            Dictionary with the number of episodes moved, the bytes read and written and
+            the number of retired files deleted, or None if a compaction is already running or it failed
+        """
+        try:
+            compactor = SegmentCompactor(self.data_dir, self.manifest, segment_bytes=segment_bytes,
+                                         compression=compression, delete_delay=delete_delay)
+            result = compactor.compact(max_episodes)
+            if result is None:
+                return None
+            self.logger.info(f"Compaction moved {result['episodes']} episodes into segments")
+            return result
+        
+        except Exception as e:
+            self.logger.error(f"Error compacting episodes: {str(e)}")
+            return None
+    
+    def start_compaction(self, **options):
+        """
+        Run compact on a background thread
+        
+        Args:
+            **options: Options passed to compact
+        
+        Returns:
+            The started thread
+        """
+        thread = threading.Thread(target=self.compact, kwargs=options, name="SegmentCompaction", daemon=True)
+        thread.start()
+        return thread
+    
+    def _log_progress(self, loaded, total):
+        """Log loading progress every 10% of the files"""
+        step = max(1, total // 10)
+        if loaded % step == 0 or loaded == total:
+            self.logger.info(f"Loading episodes: {loaded}/{total} ({loaded / total * 100:.0f}%)")
+    
     def get_statistics(self):
         """
         Get statistics about the collected data
         
+        Statistics are maintained incrementally as episodes are recorded and
+        loaded. Until load_data is called they cover every saved episode in
+        self.data_dir; afterwards they cover the loaded episodes.
+        
         Returns:
             Dictionary of statistics
         """
-        if not self.all_episodes:
-            return {
-                "episodes": 0,
-                "total_steps": 0,
-                "avg_steps_per_episode": 0,
-                "avg_reward_per_episode": 0,
-                "action_distribution": {}
-            }
-        
-        total_steps = sum(len(episode) for episode in self.all_episodes)
-        avg_steps = total_steps / len(self.all_episodes)
-        
-        # Calculate average reward per episode
-        episode_rewards = []
-        all_actions = []
-        
-        for episode in self.all_episodes:
-            episode_reward = sum(step["reward"] for step in episode)
-            episode_rewards.append(episode_reward)
-            
-            # Collect actions for distribution
-            for step in episode:
-                all_actions.append(step["action"])
-        
-        avg_reward = sum(episode_rewards) / len(episode_rewards)
-        
-        # Calculate action distribution
-        action_counts = {}
-        for action in all_actions:
-            if action in action_counts:
-                action_counts[action] += 1
-            else:
-                action_counts[action] = 1
-        
-        # Convert counts to percentages
-        action_distribution = {str(action): count / total_steps * 100 for action, count in action_counts.items()}
-        
-        return {
-            "episodes": len(self.all_episodes),
-            "total_steps": total_steps,
-            "avg_steps_per_episode": avg_steps,
-            "avg_reward_per_episode": avg_reward,
-            "action_distribution": action_distribution
-        } 
\ No newline at end of file
+        with self._data_lock:
+            return self.statistics.as_dict()
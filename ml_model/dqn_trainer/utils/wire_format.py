@@ -0,0 +1,91 @@
+import json
+import struct
+
+import numpy as np
+
+# Content type of binary request bodies
+WIRE_CONTENT_TYPE = "application/vnd.game-captcha.arrays"
+
+# A body starts with the length of its JSON header
+HEADER_LENGTH = struct.Struct("<I")
+
+# Array payloads start on a multiple of this many bytes
+PAYLOAD_ALIGNMENT = 8
+
+# Kinds of NumPy dtypes accepted in a body: bool, signed, unsigned and float
+ARRAY_KINDS = "biuf"
+
+
+def encode_message(arrays=None, **values):
+    """
+    Encode arrays and JSON values as a binary body
+
+    The body is the header length (uint32), a JSON header and the raw
+    little-endian bytes of every array. The header holds the JSON values and
+    the dtype, shape and offset of every array; it is padded so the arrays
+    start aligned.
+
+    Args:
+        arrays: Dict of field name to array
+        **values: JSON-serializable fields (session_id, action, reward, ...)
+
+    Returns:
+        Body as bytes
+    """
+    layout = {}
+    chunks = []
+    offset = 0
+    for name, array in (arrays or {}).items():
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        if array.dtype.kind not in ARRAY_KINDS:
+            raise ValueError(f"Unsupported dtype {array.dtype} for {name}")
+
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        chunks.append(array.tobytes())
+        offset += array.nbytes
+        padding = -offset % PAYLOAD_ALIGNMENT
+        chunks.append(b"\0" * padding)
+        offset += padding
+
+    header = json.dumps({"arrays": layout, "values": values}).encode("utf-8")
+    header += b" " * (-(HEADER_LENGTH.size + len(header)) % PAYLOAD_ALIGNMENT)
+
+    return HEADER_LENGTH.pack(len(header)) + header + b"".join(chunks)
+
+
+def decode_message(body):
+    """
+    Decode a binary body without copying the arrays
+
+    Args:
+        body: Bytes-like body from encode_message
+
+    Returns:
+        Dict of the JSON values and the arrays; arrays are read-only views of the body
+    """
+    if len(body) < HEADER_LENGTH.size:
+        raise ValueError("Body too short for a header")
+
+    (header_length,) = HEADER_LENGTH.unpack_from(body, 0)
+    payload_offset = HEADER_LENGTH.size + header_length
+    if payload_offset > len(body):
+        raise ValueError("Header length exceeds the body")
+
+    header = json.loads(bytes(body[HEADER_LENGTH.size:payload_offset]).decode("utf-8"))
+    message = dict(header.get("values", {}))
+
+    for name, field in header.get("arrays", {}).items():
+        dtype = np.dtype(field["dtype"])
+        if dtype.kind not in ARRAY_KINDS:
+            raise ValueError(f"Unsupported dtype {dtype} for {name}")
+
+        shape = tuple(int(dim) for dim in field["shape"])
+        count = int(np.prod(shape, dtype=np.int64))
+        start = payload_offset + int(field["offset"])
+        if start < payload_offset or start + count * dtype.itemsize > len(body):
+            raise ValueError(f"Array {name} exceeds the body")
+
+        message[name] = np.frombuffer(body, dtype=dtype, count=count, offset=start).reshape(shape)
+
+    return message
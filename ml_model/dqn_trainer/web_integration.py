@@ -1,18 +1,34 @@
 import argparse
+import bisect
+import functools
 import json
 import logging
 import os
+import queue
+import shutil
 import sys
+import tempfile
+import threading
+import time
+import zlib
 import numpy as np
-from datetime import datetime
-from flask import Flask, request, jsonify
+import torch
+from collections import namedtuple
+from flask import Flask, Response, request, jsonify
+from werkzeug.serving import make_server
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import DQN components
 from utils.web_interface import WebGameAPI
-from models.dqn_model import DQN, ConvDQN
+from utils.inference_batcher import InferenceBatcher
+from utils.wire_format import WIRE_CONTENT_TYPE, decode_message
+from utils.checkpoint_watcher import CheckpointWatcher, latest_checkpoint
+from utils.metrics import METRICS_CONTENT_TYPE, MetricsRegistry
+from utils.serving import (APIServer, MessageQueue, TensorChannel, create_listening_socket, start_workers,
+                           wait_for_workers)
+from models.checkpoint import MANIFEST_SUFFIX, build_model, checkpoint_base, load_checkpoint, share_weights
 from models.dqn_agent import DQNAgent
 
 # Set up logging
@@ -29,47 +45,318 @@ logger = logging.getLogger("Web Integration")
 # Create Flask app
 app = Flask(__name__)
 
-# Create API for data collection
-api = WebGameAPI(data_dir="./data")
+# API for data collection, created by main() for --data_dir (a client of the
+# parent's API in worker processes), or by get_api() on first use otherwise
+api = None
+api_lock = threading.Lock()
 
-# Create DQN agent (will be initialized when needed)
-agent = None
-model_loaded = False
+# A model served by /api/predict: its name in the registry, the agent, the
+# batcher running its forward passes, the function the batcher calls, the
+# model version and the state shape it takes. Reloading replaces the whole
+# tuple at once, so every request runs on one consistent model.
+ServedModel = namedtuple("ServedModel", ["name", "agent", "batcher", "predict_fn", "version", "path", "input_shape"])
 
-def load_model(model_path):
+# Name of the model served when none is given
+DEFAULT_MODEL = "default"
+
+# Header selecting the model of a prediction request
+MODEL_HEADER = "X-Model-Name"
+
+def model_version(manifest):
+    """Get the version reported for a checkpoint: its name and the start of its weights' hash"""
+    return f"{manifest['name']}-{manifest['weights']['sha256'][:8]}"
+
+class ModelRegistry:
     """
-    Load a trained model
+    Models served side by side, for A/B tests of policies
     
-    Args:
-        model_path: Path to the model
-        
-    Returns:
-        True if successful, False otherwise
+    Requests name a model with the X-Model-Name header, or are routed to one by a
+    hash of their session_id, split between the models in proportion to their
+    traffic weights; a session therefore always plays against the same model.
+    Models with the same architecture share one InferenceBatcher, so their
+    requests wait in one queue and each batch runs one forward pass per model.
     """
-    global agent, model_loaded
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._models = {}
+        self._weights = {}
+        self._batchers = {}
+        self._lock = threading.Lock()
+        
+        # (cumulative weights, model names), replaced as a whole when weights change
+        self._routes = ((), ())
     
-    try:
-        # Determine model type from filename
-        model_type = "linear" if "linear" in model_path else "conv"
+    def serve(self, name, agent, manifest, model_path, weight=None):
+        """
+        Start serving a model under a name, replacing the model of that name
+        
+        Requests already queued on the previous model finish on it.
+        
+        Args:
+            name: Model name
+            agent: DQNAgent to serve
+            manifest: Manifest of the agent's checkpoint
+            model_path: Path the agent's model was loaded from
+            weight: Traffic weight (if None, keep the current weight, or 1 for a new model)
+        
+        Returns:
+            The ServedModel
+        """
+        description = manifest["model"]
+        architecture = json.dumps({key: description[key] for key in ("class", "args", "kwargs", "dtype")},
+                                  sort_keys=True)
+        version = model_version(manifest)
+        
+        def predict_fn(states):
+            inference_batch_size.observe(len(states), model=name)
+            return agent.select_actions(states)
         
-        # Example input/output dimensions (should match what was used for training)
-        input_dim = 84 * 84  # Example for a flattened 84x84 image
-        output_dim = 6  # Example number of actions
+        with self._lock:
+            batcher = self._batchers.get(architecture)
+            if batcher is None:
+                batcher = self._batchers[architecture] = InferenceBatcher(**batcher_options)
+            
+            model = ServedModel(name, agent, batcher, predict_fn, version, model_path,
+                                tuple(description["input_shape"]))
+            self._models[name] = model
+            if weight is not None or name not in self._weights:
+                self._weights[name] = 1.0 if weight is None else float(weight)
+            self._update_routes()
+            
+            # Stop batchers no model uses any more, after running their queued requests
+            unused = [key for key, shared in self._batchers.items()
+                      if all(other.batcher is not shared for other in self._models.values())]
+            stopped = [self._batchers.pop(key) for key in unused]
         
-        # Create model
-        if model_type == "linear":
-            model = DQN(input_dim=input_dim, output_dim=output_dim)
+        for shared in stopped:
+            shared.close(drain=True)
+        
+        return model
+    
+    def _update_routes(self):
+        """Rebuild the routing table (lock must be held)"""
+        names = tuple(name for name in sorted(self._models) if self._weights[name] > 0)
+        self._routes = (tuple(np.cumsum([self._weights[name] for name in names]).tolist()), names)
+    
+    def get(self, name):
+        """
+        Get a model by name
+        
+        Args:
+            name: Model name
+        
+        Returns:
+            ServedModel, or None if no model has the name
+        """
+        return self._models.get(name)
+    
+    def route(self, session_id=None):
+        """
+        Choose the model of a request
+        
+        Args:
+            session_id: Session of the request (if None, chosen at random by weight)
+        
+        Returns:
+            ServedModel, or None if no model takes session traffic
+        """
+        cumulative, names = self._routes
+        if not names:
+            return None
+        
+        if session_id is None:
+            point = np.random.random()
         else:
-            model = ConvDQN(input_channels=1, output_dim=output_dim)
+            point = zlib.crc32(str(session_id).encode("utf-8")) / 2 ** 32
+        return self._models[names[min(bisect.bisect_right(cumulative, point * cumulative[-1]), len(names) - 1)]]
+    
+    def models(self):
+        """
+        Get every served model
         
-        # Create agent
-        agent = DQNAgent(model=model)
+        Returns:
+            List of ServedModel sorted by name
+        """
+        with self._lock:
+            return [self._models[name] for name in sorted(self._models)]
+    
+    def weight(self, name):
+        """Get the traffic weight of a model"""
+        return self._weights.get(name, 0.0)
+    
+    def queue_depth(self):
+        """Get the number of prediction requests waiting in every batcher"""
+        with self._lock:
+            batchers = list(self._batchers.values())
+        return sum(batcher.queue_depth() for batcher in batchers)
+
+# Served models
+registry = ModelRegistry()
+
+# Options of the batchers of served models
+batcher_options = {"max_batch_size": 32, "max_wait_ms": 2.0}
+
+# Serializes reloads
+reload_lock = threading.Lock()
+
+# Checkpoints loaded by load_model, by name: (agent, manifest, path). In
+# multi-worker mode they are loaded by the parent, which serves nothing itself.
+loaded_models = {}
+
+# Reload requests sent by the workers to the parent in multi-worker mode
+reload_requests = None
+
+# Models sent by the parent to every worker in multi-worker mode
+model_channel = None
+
+# Directory of new checkpoints (--watch_dir) and its watcher
+watch_dir = None
+watcher = None
+
+# Directory /api/reload may load checkpoints from (--checkpoint_dir, or --watch_dir)
+checkpoint_dir = None
+
+# Metrics served in the Prometheus text format at /metrics (see utils/metrics.py)
+metrics = MetricsRegistry()
+request_latency = metrics.histogram("game_captcha_request_duration_seconds",
+                                    "Latency of API requests in seconds", ["endpoint"])
+request_count = metrics.counter("game_captcha_requests_total", "API requests", ["endpoint"])
+request_errors = metrics.counter("game_captcha_request_errors_total", "API requests that failed", ["endpoint"])
+inference_batch_size = metrics.histogram("game_captcha_inference_batch_size", "States per inference forward pass",
+                                         ["model"], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+inference_queue_depth = metrics.gauge("game_captcha_inference_queue_depth", "Prediction requests waiting for a batch")
+model_info = metrics.gauge("game_captcha_model_info", "Version and traffic weight of each served model",
+                          ["model", "version"], merge="max")
+model_predictions = metrics.counter("game_captcha_model_predictions_total", "Predictions made by each model",
+                                    ["model"])
+model_prediction_errors = metrics.counter("game_captcha_model_prediction_errors_total",
+                                          "Predictions that failed, by model", ["model"])
+model_prediction_latency = metrics.histogram("game_captcha_model_prediction_duration_seconds",
+                                             "Latency of predictions in seconds, by model", ["model"])
+episode_write_queue_depth = metrics.gauge("game_captcha_episode_write_queue_depth",
+                                          "Finished episodes waiting to be saved")
+
+ingestion_queue_depth = metrics.gauge("game_captcha_ingestion_queue_depth",
+                                      "Recorded transitions waiting for the background writer")
+ingestion_rejected = metrics.counter("game_captcha_ingestion_rejected_total",
+                                     "Record requests rejected because the ingestion queue was full", ["endpoint"])
+
+# Seconds clients are asked to wait before retrying when the ingestion queue is full
+RETRY_AFTER_SECONDS = 1
+
+# Directory the processes share their metrics through in multi-worker mode
+metrics_dir = None
+
+def get_api():
+    """
+    Get the API for data collection, creating one for ./data if main() did not
+    
+    Returns:
+        WebGameAPI, or the client of the parent's WebGameAPI in a worker process
+    """
+    global api
+    if api is None:
+        with api_lock:
+            if api is None:
+                api = WebGameAPI(data_dir="./data")
+    return api
+
+def collect_metrics():
+    """Set the gauges read from the served models and the API"""
+    model_info.clear()
+    for model in registry.models():
+        model_info.set(registry.weight(model.name), model=model.name, version=model.version)
+    inference_queue_depth.set(registry.queue_depth())
+    
+    # Workers forward recording to the parent process, which exports these gauges
+    if isinstance(api, WebGameAPI):
+        episode_write_queue_depth.set(api.write_queue_depth())
+        ingestion_queue_depth.set(api.ingest_queue_depth())
+
+metrics.add_collector(collect_metrics)
+
+def instrumented(endpoint):
+    """
+    Record the latency and outcome of every request to an API endpoint
+    
+    Args:
+        endpoint: Value of the endpoint label
         
-        # Load model weights
-        agent.load_model(os.path.dirname(model_path), os.path.basename(model_path))
+    Returns:
+        Decorator for a Flask view function
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            response = app.make_response(view(*args, **kwargs))
+            request_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+            request_count.inc(endpoint=endpoint)
+            
+            # Views report failures as {"success": false}
+            if response.status_code >= 400 or not (response.get_json(silent=True) or {}).get("success", False):
+                request_errors.inc(endpoint=endpoint)
+            
+            return response
+        return wrapper
+    return decorator
+
+def load_agent(model_path):
+    """
+    Build an agent from a checkpoint and its manifest
+    
+    The checkpoint is verified and warmed up by load_checkpoint (see models/checkpoint.py).
+    
+    Args:
+        model_path: Path to the model (base path given to save_model, or one of its files)
+        
+    Returns:
+        (DQNAgent, manifest)
+    """
+    model, manifest = load_checkpoint(model_path)
+    
+    # Serving never trains, so the target network is the model itself
+    agent = DQNAgent(model=model, target_model=model)
+    
+    return agent, manifest
+
+def load_model(model_path, name=DEFAULT_MODEL, weight=None):
+    """
+    Load a trained model and serve it under a name
+    
+    In multi-worker mode this runs in the parent: the weights are loaded once
+    into shared memory and every worker serves them without a copy.
+    
+    Args:
+        model_path: Path to the model
+        name: Name of the model in the registry (replaces the model of that name)
+        weight: Traffic weight (if None, keep the current weight, or 1 for a new model)
         
-        model_loaded = True
-        logger.info(f"Loaded model from {model_path}")
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with reload_lock:
+            agent, manifest = load_agent(model_path)
+            
+            # Clients send states for the served model, so a reload must take the same states and actions
+            if name in loaded_models:
+                new, current = manifest["model"], loaded_models[name][1]["model"]
+                if new["input_shape"] != current["input_shape"] or new["output_dim"] != current["output_dim"]:
+                    raise ValueError(f"Model takes states of shape {tuple(new['input_shape'])} with "
+                                     f"{new['output_dim']} actions, model {name} takes "
+                                     f"{tuple(current['input_shape'])} with {current['output_dim']}; "
+                                     f"restart to change them")
+            
+            if model_channel is not None:
+                # Workers map these tensors instead of loading their own copies
+                agent.q_network.share_memory()
+                model_channel.publish((name, manifest, model_path, weight, agent.q_network.state_dict()))
+            else:
+                registry.serve(name, agent, manifest, model_path, weight)
+            loaded_models[name] = (agent, manifest, model_path)
+        
+        logger.info(f"Loaded model {name} from {model_path} (version {model_version(manifest)})")
         
         return True
     
@@ -77,40 +364,222 @@ def load_model(model_path):
         logger.error(f"Error loading model: {str(e)}")
         return False
 
+def serve_shared_model(message):
+    """
+    Serve a model loaded by the parent process (runs in a worker)
+    
+    Args:
+        message: (name, manifest, model path, traffic weight, state dict in shared memory) from load_model
+    """
+    try:
+        name, manifest, model_path, weight, state_dict = message
+        model = share_weights(build_model(manifest["model"]), state_dict)
+        served = registry.serve(name, DQNAgent(model=model, target_model=model), manifest, model_path, weight)
+        logger.info(f"Serving model {name} (version {served.version})")
+    
+    except Exception as e:
+        logger.error(f"Error serving model: {str(e)}")
+
+def start_reload(model_path, name=DEFAULT_MODEL, weight=None):
+    """
+    Load and serve a model in the background
+    
+    In multi-worker mode the parent loads it and every worker serves it.
+    
+    Args:
+        model_path: Path to the model
+        name: Name of the model in the registry
+        weight: Traffic weight (if None, keep the current weight, or 1 for a new model)
+    """
+    if reload_requests is not None:
+        reload_requests.publish({"model_path": model_path, "name": name, "weight": weight})
+    else:
+        threading.Thread(target=load_model, args=(model_path, name, weight), name="ModelReload", daemon=True).start()
+
+def start_watcher(watch_dir, poll_interval, name=DEFAULT_MODEL):
+    """
+    Serve every new checkpoint saved to a directory
+    
+    Args:
+        watch_dir: Checkpoint directory
+        poll_interval: Seconds between checks for new checkpoints
+        name: Name of the model the checkpoints replace
+    """
+    global watcher
+    
+    def load_new_checkpoint(model_path):
+        # The newest checkpoint may be the model given with --model
+        loaded = loaded_models.get(name)
+        if loaded is None or os.path.realpath(checkpoint_base(loaded[2])) != os.path.realpath(model_path):
+            load_model(model_path, name)
+    
+    watcher = CheckpointWatcher(watch_dir, load_new_checkpoint, poll_interval=poll_interval)
+
+def resolve_checkpoint(name):
+    """
+    Resolve a checkpoint name sent to /api/reload inside the checkpoint directory
+    
+    Requests can only name checkpoints inside --checkpoint_dir (or --watch_dir),
+    so they cannot make the server load arbitrary files.
+    
+    Args:
+        name: Checkpoint name relative to the checkpoint directory, such as "dqn_web_20240101_120000"
+        
+    Returns:
+        Base path of the checkpoint
+    """
+    if checkpoint_dir is None:
+        raise ValueError("Reloading a named checkpoint requires --checkpoint_dir or --watch_dir")
+    if not isinstance(name, str) or not name or os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+        raise ValueError(f"Invalid checkpoint name {name!r}")
+    
+    root = os.path.realpath(checkpoint_dir)
+    model_path = os.path.realpath(os.path.join(root, checkpoint_base(name)))
+    if os.path.commonpath([root, model_path]) != root:
+        raise ValueError(f"Checkpoint {name!r} is outside the checkpoint directory")
+    if not os.path.isfile(model_path + MANIFEST_SUFFIX):
+        raise ValueError(f"No checkpoint {name!r} in the checkpoint directory")
+    
+    return model_path
+
+def latest_model():
+    """
+    Get the newest checkpoint in --watch_dir
+    
+    Returns:
+        Base path of the checkpoint, or None if there is none or no --watch_dir
+    """
+    if watch_dir is None:
+        return None
+    path = latest_checkpoint(watch_dir)
+    return checkpoint_base(path) if path is not None else None
+
+def parse_model_specs(specs):
+    """
+    Parse --model values
+    
+    Args:
+        specs: Values given as "path" or "name=path"
+        
+    Returns:
+        List of (name, path)
+    """
+    models = []
+    for spec in specs or []:
+        name, separator, path = spec.partition("=")
+        models.append((name, path) if separator else (DEFAULT_MODEL, spec))
+    return models
+
+def parse_traffic(specs):
+    """
+    Parse --traffic values
+    
+    Args:
+        specs: Values given as "name=weight"
+        
+    Returns:
+        Dictionary of model name to traffic weight
+    """
+    weights = {}
+    for spec in specs or []:
+        name, _, weight = spec.partition("=")
+        weights[name] = float(weight)
+    return weights
+
+def queue_full_response(endpoint, error):
+    """
+    Respond to a record request that did not fit in the ingestion queue or would open too many sessions
+    
+    Args:
+        endpoint: Endpoint of the request
+        error: The queue.Full raised by the API
+        
+    Returns:
+        503 response asking the client to retry later
+    """
+    ingestion_rejected.inc(endpoint=endpoint)
+    response = jsonify({
+        "success": False,
+        "error": f"{str(error) or 'Ingestion queue is full'}, retry later"
+    })
+    return response, 503, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
+def request_data():
+    """
+    Get the payload of the current request
+    
+    Bodies sent as WIRE_CONTENT_TYPE carry arrays as raw bytes and are decoded
+    without copying them (see utils/wire_format.py); anything else is parsed as JSON.
+    
+    Returns:
+        Dict of request fields
+    """
+    if request.mimetype == WIRE_CONTENT_TYPE:
+        return decode_message(request.get_data(cache=False))
+    return request.json
+
 @app.route('/api/predict', methods=['POST'])
+@instrumented('/api/predict')
 def predict():
     """API endpoint for making predictions with the model"""
-    global agent, model_loaded
-    
+    model = None
+    started = time.perf_counter()
     try:
+        # Get state from request
+        data = request_data()
+        
+        # Choose the model by header or session, and use it for the whole request even if a reload swaps it meanwhile
+        name = request.headers.get(MODEL_HEADER)
+        model = registry.get(name) if name else registry.route(data.get('session_id'))
+        
         # Check if model is loaded
-        if not model_loaded:
+        if model is None:
             return jsonify({
                 "success": False,
-                "error": "Model not loaded"
+                "error": f"Model {name} not loaded" if name else "Model not loaded"
             })
         
-        # Get state from request
-        data = request.json
-        
         if 'state' not in data:
             return jsonify({
                 "success": False,
                 "error": "Missing state"
             })
         
-        # Convert state to numpy array
-        state = np.array(data['state'])
+        # Convert state to numpy array (binary bodies are already arrays)
+        state = np.asarray(data['state'])
         
-        # Make prediction
-        action = agent.select_action(state, epsilon=0.0)
+        # Flatten or reshape the state to the model's input
+        if state.size != np.prod(model.input_shape):
+            model_prediction_errors.inc(model=model.name)
+            return jsonify({
+                "success": False,
+                "error": f"State of shape {state.shape} does not match model input {model.input_shape}"
+            })
+        state = state.reshape(model.input_shape)
+        
+        # Make prediction, batched with concurrent requests to models of the same architecture
+        try:
+            action = model.batcher.predict(state, predict_fn=model.predict_fn)
+        except RuntimeError:
+            if registry.get(model.name) is model:
+                raise
+            # The model was replaced between reading it and queueing the state
+            model = registry.get(model.name)
+            action = model.batcher.predict(state, predict_fn=model.predict_fn)
+        
+        model_predictions.inc(model=model.name)
+        model_prediction_latency.observe(time.perf_counter() - started, model=model.name)
         
         return jsonify({
             "success": True,
-            "action": int(action)
+            "action": int(action),
+            "model": model.name,
+            "model_version": model.version
         })
     
     except Exception as e:
+        if model is not None:
+            model_prediction_errors.inc(model=model.name)
         logger.error(f"Error making prediction: {str(e)}")
         return jsonify({
             "success": False,
@@ -118,11 +587,12 @@ def predict():
         })
 
 @app.route('/api/record', methods=['POST'])
+@instrumented('/api/record')
 def record():
     """API endpoint for recording gameplay data"""
     try:
         # Get data from request
-        data = request.json
+        data = request_data()
         
         # Validate data
         required_keys = ["state", "action", "reward", "next_state", "done"]
@@ -133,13 +603,16 @@ def record():
                     "error": f"Missing {key}"
                 })
         
-        # Record step
-        result = api.record_step(data)
+        # Queue the step for the background writer
+        result = get_api().enqueue_step(data)
         
         return jsonify({
             "success": result
         })
     
+    except queue.Full as e:
+        return queue_full_response('/api/record', e)
+    
     except Exception as e:
         logger.error(f"Error recording data: {str(e)}")
         return jsonify({
@@ -147,12 +620,38 @@ def record():
             "error": str(e)
         })
 
+@app.route('/api/record_batch', methods=['POST'])
+@instrumented('/api/record_batch')
+def record_batch():
+    """API endpoint for recording many transitions (or a whole session) in one request"""
+    try:
+        # Get data from request
+        data = request_data()
+        
+        # Validate all transitions in one pass and queue them for the background writer
+        result = get_api().enqueue_batch(data)
+        
+        return jsonify({
+            "success": result
+        })
+    
+    except queue.Full as e:
+        return queue_full_response('/api/record_batch', e)
+    
+    except Exception as e:
+        logger.error(f"Error recording batch: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        })
+
 @app.route('/api/stats', methods=['GET'])
+@instrumented('/api/stats')
 def stats():
     """API endpoint for getting statistics about the collected data"""
     try:
         # Get statistics
-        statistics = api.get_statistics()
+        statistics = get_api().get_statistics()
         
         return jsonify({
             "success": True,
@@ -166,6 +665,77 @@ def stats():
             "error": str(e)
         })
 
+@app.route('/api/predict/metrics', methods=['GET'])
+def predict_metrics():
+    """API endpoint for getting batching metrics of the prediction endpoint"""
+    models = registry.models()
+    if not models:
+        return jsonify({
+            "success": False,
+            "error": "Model not loaded"
+        })
+    
+    # Models with the same architecture report the metrics of their shared batcher
+    return jsonify({
+        "success": True,
+        "models": {
+            model.name: {
+                "model_version": model.version,
+                "metrics": model.batcher.metrics()
+            } for model in models
+        }
+    })
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """API endpoint for listing the served models and their traffic weights"""
+    return jsonify({
+        "success": True,
+        "models": [{
+            "name": model.name,
+            "model_version": model.version,
+            "weight": registry.weight(model.name)
+        } for model in registry.models()]
+    })
+
+@app.route('/api/reload', methods=['POST'])
+def reload():
+    """API endpoint for replacing a served model, or adding one, without downtime"""
+    try:
+        # Reload the named checkpoint of the checkpoint directory, or the newest checkpoint of the watched directory
+        data = request.get_json(silent=True) or {}
+        name = data.get("name", DEFAULT_MODEL)
+        model_path = resolve_checkpoint(data["model"]) if data.get("model") else latest_model()
+        
+        if model_path is None:
+            return jsonify({
+                "success": False,
+                "error": "Missing model"
+            })
+        
+        # Build and warm up the model in the background; requests keep using the current one
+        start_reload(model_path, name, data.get("weight"))
+        
+        served = registry.get(name)
+        return jsonify({
+            "success": True,
+            "name": name,
+            "reloading": os.path.basename(model_path),
+            "model_version": served.version if served is not None else None
+        })
+    
+    except Exception as e:
+        logger.error(f"Error reloading model: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Endpoint for scraping metrics in the Prometheus text format"""
+    return Response(metrics.render(metrics_dir), content_type=METRICS_CONTENT_TYPE)
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="Web integration for DQN")
@@ -174,29 +744,139 @@ def parse_args():
                       help="Host to run the server on")
     parser.add_argument("--port", type=int, default=5000,
                       help="Port to run the server on")
-    parser.add_argument("--model", type=str, default=None,
-                      help="Path to the model to load")
+    parser.add_argument("--model", type=str, action="append", default=None,
+                      help="Path to a model to load, as path or name=path (repeat to serve several models)")
+    parser.add_argument("--traffic", type=str, action="append", default=None,
+                      help="Share of session traffic of a model, as name=weight (default: equal shares)")
     parser.add_argument("--data_dir", type=str, default="./data",
                       help="Directory to save data to")
+    parser.add_argument("--max_batch_size", type=int, default=32,
+                      help="Maximum number of prediction requests run in one forward pass")
+    parser.add_argument("--max_wait_ms", type=float, default=2.0,
+                      help="Maximum time in milliseconds a prediction request waits for others to batch with")
+    parser.add_argument("--ingest_queue_size", type=int, default=100000,
+                      help="Maximum number of recorded transitions waiting to be written before requests are rejected")
+    parser.add_argument("--max_sessions", type=int, default=10000,
+                      help="Maximum number of game sessions with an unfinished episode before new sessions are rejected")
+    parser.add_argument("--session_timeout", type=float, default=600.0,
+                      help="Seconds after which the unfinished episode of an idle session is saved and the session closed")
+    parser.add_argument("--watch_dir", type=str, default=None,
+                      help="Directory to watch for new checkpoints to serve")
+    parser.add_argument("--watch_interval", type=float, default=5.0,
+                      help="Seconds between checks for new checkpoints")
+    parser.add_argument("--checkpoint_dir", type=str, default=None,
+                      help="Directory /api/reload may load named checkpoints from (default: --watch_dir)")
+    parser.add_argument("--watch_model", type=str, default=DEFAULT_MODEL,
+                      help="Name of the model replaced by new checkpoints in --watch_dir")
+    parser.add_argument("--workers", type=int, default=1,
+                      help="Number of server processes sharing the loaded model")
+    parser.add_argument("--torch_threads", type=int, default=None,
+                      help="Torch intra-op threads per worker (default: CPU count divided by workers)")
     
     return parser.parse_args()
 
+def serve_workers(args):
+    """
+    Serve with several pre-forked worker processes
+    
+    The models are loaded once before forking and their weights are moved to
+    shared memory, so every worker runs inference on the same tensors. The
+    workers accept connections from one shared listening socket, which the
+    kernel balances between them. Recording is forwarded to the WebGameAPI
+    of this process, so the steps of a session are kept together whichever
+    worker receives them. Reloads are done by this process too: a reload
+    request received by any worker, or a new checkpoint seen by the one
+    watcher, is loaded here into shared memory and sent to every worker as
+    tensor handles, so the weights are never copied per worker.
+    
+    Args:
+        args: Parsed command line arguments
+    """
+    global api, reload_requests, model_channel, metrics_dir
+    
+    traffic = parse_traffic(args.traffic)
+    for name, model_path in parse_model_specs(args.model):
+        try:
+            agent, manifest = load_agent(model_path)
+            agent.q_network.share_memory()
+            loaded_models[name] = (agent, manifest, model_path)
+            logger.info(f"Loaded model {name} from {model_path}")
+        except Exception as e:
+            logger.error(f"Failed to load model {model_path}: {str(e)}")
+    
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    sock = create_listening_socket(args.host, args.port)
+    api_server = APIServer(["enqueue_step", "enqueue_batch", "get_statistics"], args.workers)
+    reload_requests = MessageQueue()
+    model_channel = TensorChannel(args.workers)
+    metrics_dir = tempfile.mkdtemp(prefix="game-captcha-metrics-")
+    
+    def run_worker(index):
+        global api
+        
+        torch.set_num_threads(torch_threads)
+        api = api_server.client(index)
+        metrics.start_export(metrics_dir, f"worker_{index}")
+        for name, (agent, manifest, model_path) in loaded_models.items():
+            registry.serve(name, agent, manifest, model_path, traffic.get(name))
+        model_channel.listen(index, serve_shared_model)
+        
+        server = make_server(args.host, args.port, app, threaded=True, fd=sock.fileno())
+        logger.info(f"Worker {index} serving with {torch_threads} torch threads")
+        server.serve_forever()
+    
+    logger.info(f"Starting {args.workers} workers on {args.host}:{args.port}")
+    workers = start_workers(args.workers, run_worker)
+    sock.close()
+    
+    # Only this process writes episodes; it is created after forking so its threads stay here
+    api = WebGameAPI(data_dir=args.data_dir, ingest_queue_size=args.ingest_queue_size,
+                     max_sessions=args.max_sessions, session_timeout=args.session_timeout)
+    api_server.start(api)
+    metrics.start_export(metrics_dir, "server")
+    
+    # Models are reloaded here and sent to the workers
+    reload_requests.listen(lambda message: load_model(**message))
+    if args.watch_dir:
+        start_watcher(args.watch_dir, args.watch_interval, args.watch_model)
+    try:
+        wait_for_workers(workers)
+    finally:
+        api_server.stop()
+        api.close()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
 def main():
     """Main function"""
     args = parse_args()
     
+    batcher_options.update(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    
+    global api, watch_dir, checkpoint_dir
+    watch_dir = args.watch_dir
+    checkpoint_dir = args.checkpoint_dir or args.watch_dir
+    
+    if args.workers > 1:
+        serve_workers(args)
+        return
+    
     # Set data directory
-    global api
-    api = WebGameAPI(data_dir=args.data_dir)
+    api = WebGameAPI(data_dir=args.data_dir, ingest_queue_size=args.ingest_queue_size,
+                     max_sessions=args.max_sessions, session_timeout=args.session_timeout)
+    
+    # Load models if specified
+    traffic = parse_traffic(args.traffic)
+    for name, model_path in parse_model_specs(args.model):
+        if not load_model(model_path, name, traffic.get(name)):
+            logger.error(f"Failed to load model {model_path}")
     
-    # Load model if specified
-    if args.model:
-        if not load_model(args.model):
-            logger.error(f"Failed to load model {args.model}")
+    # Serve new checkpoints as they are saved
+    if args.watch_dir:
+        start_watcher(args.watch_dir, args.watch_interval, args.watch_model)
     
     # Run server
     logger.info(f"Starting server on {args.host}:{args.port}")
-    app.run(host=args.host, port=args.port)
+    app.run(host=args.host, port=args.port, threaded=True)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file